@@ -6,13 +6,16 @@ import re
 import os
 import json
 import subprocess
-from fpdf import FPDF
 from datetime import datetime
 
 # Core imports
 from engine import BacteriaIdentifier
-from parser_llm import parse_input_free_text as parse_llm_input_free_text, enable_self_learning_autopatch
+from compiled_db import ensure_compiled, get_compiled_db
+from trait_index import get_trait_index
+from parser_llm import parse_input_free_text as parse_llm_input_free_text, enable_self_learning_autopatch, get_feedback_log
 from parser_basic import enable_self_learning_autopatch as enable_regex_autopatch
+from learning_jobs import LEARNING_LOCK, start_learning_job, learning_status_line
+from git_sync import get_git_sync
 
 # ──────────────────────────────────────────────────────────────────────────────
 # GIT INITIALIZATION (Streamlit Cloud Fix)
@@ -38,23 +41,21 @@ def ensure_git_repo():
         subprocess.run(["git", "checkout", "-B", branch], check=False)
         print("✅ Git repo initialized and connected to remote.")
 
-ensure_git_repo()
-enable_self_learning_autopatch(run_tests=False)
+# Once per process, in the background: first render never waits on this
+start_learning_job("startup", [
+    ("git repo", ensure_git_repo),
+    ("parser learning", lambda: enable_self_learning_autopatch(run_tests=False)),
+])
 
 # ──────────────────────────────────────────────────────────────────────────────
 # CONFIG
 # ──────────────────────────────────────────────────────────────────────────────
 st.set_page_config(page_title="BactAI-D Assistant", layout="wide")
+st.sidebar.caption(learning_status_line("startup"))
 
 # ──────────────────────────────────────────────────────────────────────────────
 # LOAD DATA
 # ──────────────────────────────────────────────────────────────────────────────
-@st.cache_data
-def load_data(path, last_modified):
-    df = pd.read_excel(path)
-    df.columns = [c.strip() for c in df.columns]
-    return df
-
 primary_path = os.path.join("data", "bacteria_db.xlsx")
 fallback_path = os.path.join("bacteria_db.xlsx")
 data_path = primary_path if os.path.exists(primary_path) else fallback_path
@@ -65,7 +66,8 @@ except FileNotFoundError:
     st.error(f"Database file not found at '{primary_path}' or '{fallback_path}'.")
     st.stop()
 
-db = load_data(data_path, last_modified)
+# One shared read-only mapping of the compiled DB per process (recompiled when the xlsx changes)
+db = get_compiled_db(ensure_compiled(data_path))
 eng = BacteriaIdentifier(db)
 
 st.sidebar.caption(f"📅 Database last updated: {datetime.fromtimestamp(last_modified).strftime('%Y-%m-%d %H:%M:%S')}")
@@ -128,7 +130,7 @@ st.sidebar.markdown(
 
 def get_unique_values(field):
     vals = []
-    for v in eng.db[field]:
+    for v in eng.compiled.column_values(field):
         parts = re.split(r"[;/]", str(v))
         for p in parts:
             clean = p.strip()
@@ -178,19 +180,22 @@ if st.sidebar.button("🔄 Reset All Inputs"):
 # GOLD SPEC TESTS (SELF-LEARNING)
 # ──────────────────────────────────────────────────────────────────────────────
 with st.sidebar.expander("🧪 Gold Spec Tests", expanded=False):
+    full_gold = st.checkbox("Re-run all cases (ignore cache)", value=False)
     if st.button("▶️ Run Gold Spec Tests & Self-Learn"):
         with st.spinner("Running Gold Spec Tests and analyzing feedback..."):
             try:
-                enable_self_learning_autopatch(run_tests=True, db_fields=[c for c in db.columns if c.lower() != "genus"])
-                enable_regex_autopatch(run_tests=True, db_fields=[c for c in db.columns if c.lower() != "genus"])
+                with LEARNING_LOCK:  # waits for the startup job if it is still running
+                    enable_self_learning_autopatch(run_tests=True, db_fields=[c for c in db.columns if c.lower() != "genus"], full=full_gold)
+                    enable_regex_autopatch(run_tests=True, db_fields=[c for c in db.columns if c.lower() != "genus"])
                 st.success("✅ Gold Spec Tests completed and learning applied.")
             except Exception as e:
                 st.error(f"Gold Test Learning failed: {e}")
 
     if st.button("🧹 Clear Learning Memory"):
-        for f in ["parser_feedback.json", "parser_memory.json"]:
-            if os.path.exists(f):
-                os.remove(f)
+        with LEARNING_LOCK:
+            get_feedback_log().clear()
+            if os.path.exists("parser_memory.json"):
+                os.remove("parser_memory.json")
         st.success("Cleared parser learning memory.")
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -231,10 +236,33 @@ if not st.session_state.results.empty:
             if row["Extra Notes"]:
                 st.markdown(f"**Notes:** {row['Extra Notes']}")
 
+# ──────────────────────────────────────────────────────────────────────────────
+# TRAIT BROWSER — inverted index filters with live counts (trait_index.py)
+# ──────────────────────────────────────────────────────────────────────────────
+BROWSE_EXCLUDE = ["Extra Notes"]
+
+with st.expander("🔎 Trait Browser", expanded=False):
+    st.caption("Pick trait values to list the genera that have all of them. Counts show how many genera each value would leave.")
+    tindex = get_trait_index(db)
+    browse_fields = st.multiselect(
+        "Filter on fields", [f for f in tindex.fields if f not in BROWSE_EXCLUDE], default=[], key="browse::fields"
+    )
+    criteria = {f: st.session_state.get(f"browse::{f}") or [] for f in browse_fields}
+    facet_counts = tindex.facets(criteria, browse_fields)
+    for field in browse_fields:
+        counts = facet_counts[field]
+        options = sorted(set(counts) | set(criteria[field]))
+        st.multiselect(field, options, key=f"browse::{field}", format_func=lambda v, c=counts: f"{v} ({c.get(v, 0)})")
+    hits = tindex.filter(criteria)
+    st.markdown(f"**{tindex.count(hits)}** of {len(tindex.genera)} genera match.")
+    if criteria and tindex.count(hits):
+        st.write(", ".join(tindex.genera_of(hits)))
+
 # ──────────────────────────────────────────────────────────────────────────────
 # PDF EXPORT
 # ──────────────────────────────────────────────────────────────────────────────
 def export_pdf(results_df, user_input):
+    from fpdf import FPDF  # only needed when a report is exported
     pdf = FPDF()
     pdf.add_page()
     pdf.set_font("Helvetica", "B", 16)
@@ -273,69 +301,8 @@ st.markdown("<hr>", unsafe_allow_html=True)
 st.markdown("<div style='text-align:center; font-size:14px;'>Created by <b>Zain (Eph)</b></div>", unsafe_allow_html=True)
 
 # ──────────────────────────────────────────────────────────────────────────────
-# AUTO-GIT COMMIT (Streamlit Cloud Safe)
+# GIT SYNC — debounced background worker (git_sync.py); never blocks a rerun
 # ──────────────────────────────────────────────────────────────────────────────
-def auto_git_commit():
-    import subprocess, os
-    from datetime import datetime
-
-    # Read token from Streamlit secrets env (GH_TOKEN is what you set)
-    token = os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN")
-    repo  = os.getenv("GITHUB_REPO")  # e.g. "EphraimAsad/BacAi-D-Dev"
-    branch = os.getenv("GIT_BRANCH", "main")
-    email = os.getenv("GITHUB_EMAIL", os.getenv("GIT_USER_EMAIL", "bot@bactaid.local"))
-    name  = os.getenv("GITHUB_NAME", os.getenv("GIT_USER_NAME", "BactAI-D AutoLearner"))
-
-    if not token or not repo:
-        print("⚠️ GitHub credentials not found; skipping auto-commit.")
-        return
-
-    try:
-        # Identity + safe directory
-        subprocess.run(["git", "config", "--global", "user.email", email], check=True)
-        subprocess.run(["git", "config", "--global", "user.name", name], check=True)
-        subprocess.run(['git', 'config', '--global', '--add', 'safe.directory', os.getcwd()], check=False)
-
-        # QUICK DEBUG
-        print(f"🔧 DEBUG repo={repo} branch={branch}")
-
-        # Stage relevant project files (now includes engine.py + app files)
-        files_to_add = [
-            "engine.py",
-            "app.py",
-            "app_chat.py",
-            "parser_llm.py",
-            "parser_basic.py",
-            "parser_memory.json",
-            "parser_feedback.json",
-            "gold_tests.json",
-            "bacteria_db.xlsx",
-            "data/bacteria_db.xlsx",
-        ]
-        # Add only those that exist (avoids errors)
-        for f in files_to_add:
-            if os.path.exists(f):
-                subprocess.run(["git", "add", f], check=False)
-
-        # If you prefer to stage ALL tracked changes instead, uncomment:
-        # subprocess.run(["git", "add", "-u"], check=False)
-
-        # Any staged changes?
-        status = subprocess.run(["git", "diff", "--cached", "--name-only"], capture_output=True, text=True)
-        if not status.stdout.strip():
-            print("ℹ️ No staged changes; nothing to commit.")
-            return
-
-        msg = f"🤖 Auto-learned update — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        subprocess.run(["git", "commit", "-m", msg], check=False)
-
-        remote_url = f"https://{token}@github.com/{repo}.git"
-        print(f"🔧 DEBUG pushing to {remote_url} HEAD:{branch}")
-        subprocess.run(["git", "push", remote_url, f"HEAD:{branch}"], check=True)
-
-        print("✅ Successfully committed & pushed updates to GitHub.")
-    except Exception as e:
-        print(f"⚠️ Auto-commit failed: {e}")
-
-auto_git_commit()
-st.sidebar.success("✅ Learning cycle complete & synced with GitHub.")
+git_sync = get_git_sync()
+git_sync.notify("app rerun")
+st.sidebar.caption(git_sync.status_line())
@@ -1,5 +1,5 @@
 # app_chat.py — LLM-first chat (Ollama Cloud) with Basic regex fallback
-# - Git auto-commit enabled (runtime .git init for Streamlit Cloud)
+# - Learned state synced to git by a debounced background worker (git_sync.py)
 # - Gold Spec Tests trigger self-learning + regex patch
 # - Fully compatible with updated parser_llm.py (DeepSeek v3.1:671b)
 
@@ -8,11 +8,11 @@ import re
 import json
 from datetime import datetime
 import subprocess
-import pandas as pd
 import streamlit as st
 
 # ──────────────────────────────────────────────────────────────────────────────
-# EARLY GIT INIT — required for Streamlit Cloud to push back to GitHub
+# GIT INIT — required for Streamlit Cloud to push back to GitHub (run in the
+# background startup job below, not at import)
 # ──────────────────────────────────────────────────────────────────────────────
 def ensure_git_repo():
     """Initializes a git repo in the current directory if none exists."""
@@ -36,19 +36,25 @@ def ensure_git_repo():
         subprocess.run(["git", "checkout", "-B", branch], check=False)
         print("✅ Git repo initialized and connected to remote.")
 
-ensure_git_repo()
-
 # ──────────────────────────────────────────────────────────────────────────────
 # IMPORTS
 # ──────────────────────────────────────────────────────────────────────────────
 from engine import BacteriaIdentifier
+from compiled_db import ensure_compiled, get_compiled_db
 # LLM-first parser (Ollama Cloud)
 from parser_llm import parse_input_free_text as parse_llm_input_free_text
 # Deterministic fallback parser
 from parser_basic import parse_input_free_text as parse_basic_input_free_text
 # Self-learning and autopatch
-from parser_llm import enable_self_learning_autopatch
-enable_self_learning_autopatch(run_tests=False)
+from parser_llm import enable_self_learning_autopatch, get_feedback_log
+from learning_jobs import LEARNING_LOCK, start_learning_job, learning_status_line
+from git_sync import get_git_sync
+
+# Git init + learning run once per process, in the background (not per rerun)
+start_learning_job("startup", [
+    ("git repo", ensure_git_repo),
+    ("parser learning", lambda: enable_self_learning_autopatch(run_tests=False)),
+])
 
 # ──────────────────────────────────────────────────────────────────────────────
 # CONFIG
@@ -59,12 +65,6 @@ DEFAULT_LOCAL_MODEL = os.getenv("LOCAL_MODEL", "deepseek-v3.1:671b")
 # ──────────────────────────────────────────────────────────────────────────────
 # DATA LOADING
 # ──────────────────────────────────────────────────────────────────────────────
-@st.cache_data
-def load_data(path, last_modified):
-    df = pd.read_excel(path)
-    df.columns = [c.strip() for c in df.columns]
-    return df
-
 primary_path = os.path.join("data", "bacteria_db.xlsx")
 fallback_path = os.path.join("bacteria_db.xlsx")
 data_path = primary_path if os.path.exists(primary_path) else fallback_path
@@ -75,7 +75,8 @@ except FileNotFoundError:
     st.error(f"Database not found at '{primary_path}' or '{fallback_path}'.")
     st.stop()
 
-db = load_data(data_path, last_modified)
+# One shared read-only mapping of the compiled DB per process (recompiled when the xlsx changes)
+db = get_compiled_db(ensure_compiled(data_path))
 eng = BacteriaIdentifier(db)
 db_fields = [c for c in db.columns if c.strip().lower() != "genus"]
 
@@ -116,6 +117,7 @@ if "active_parser" not in st.session_state:
 # SIDEBAR
 # ──────────────────────────────────────────────────────────────────────────────
 st.sidebar.markdown("### ⚙️ Runtime")
+st.sidebar.caption(learning_status_line("startup"))
 st.sidebar.text_input(
     "Active Parser",
     value=st.session_state.active_parser,
@@ -142,77 +144,34 @@ if st.sidebar.button("🔄 Reset conversation"):
 # GOLD SPEC TESTS — runs from gold_tests.json and triggers self-learning
 # ──────────────────────────────────────────────────────────────────────────────
 with st.sidebar.expander("🧪 Gold Spec Tests (Parser Validation)", expanded=False):
+    full_gold = st.checkbox("Re-run all cases (ignore cache)", value=False)
     if st.button("▶️ Run Gold Spec Tests & Self-Learn"):
         try:
             # Load test cases from file
             with open("gold_tests.json", "r", encoding="utf-8") as f:
                 tests = json.load(f)
 
-            results = []
-            feedback = []
-            passed = 0
-
-            for case in tests:
-                text = case["input"]
-                expected = case.get("expected", {})
-
-                # Try LLM first, then fallback to Basic
-                used_backend = None
-                try:
-                    parsed = parse_llm_input_free_text(
-                        text,
-                        prior_facts={},
-                        db_fields=db_fields
-                    )
-                    used_backend = f"LLM (Ollama: {DEFAULT_LOCAL_MODEL})"
-                except Exception:
-                    parsed = parse_basic_input_free_text(
-                        text,
-                        prior_facts={},
-                        db_fields=db_fields
-                    )
-                    used_backend = "Basic (regex)"
-
-                # Compare only expected keys (gold standard)
-                mismatched = []
-                for key, exp_val in expected.items():
-                    got_val = parsed.get(key)
-                    if got_val != exp_val:
-                        mismatched.append({"field": key, "got": got_val, "expected": exp_val})
-
-                if mismatched:
-                    results.append({
-                        "name": case.get("name", "Unnamed Case"),
-                        "status": "❌",
-                        "mismatches": mismatched,
-                        "parsed": parsed,
-                        "expected": expected,
-                        "backend": used_backend
-                    })
-                    feedback.append({"name": case.get("name", "Unnamed Case"), "text": text, "errors": mismatched})
-                else:
-                    results.append({
-                        "name": case.get("name", "Unnamed Case"),
-                        "status": "✅",
-                        "mismatches": [],
-                        "parsed": parsed,
-                        "expected": expected,
-                        "backend": used_backend
-                    })
-                    passed += 1
-
-            # Save feedback for learning
-            with open("parser_feedback.json", "w", encoding="utf-8") as fb:
-                json.dump(feedback, fb, indent=2)
-
-            # Learning + auto-regex patch in parser_llm.py
+            # Incremental: unchanged cases reuse their cached outcome;
+            # failures from fresh runs go to the feedback log in one batch
+            from gold_test_runner import run_gold_suite
+            report = run_gold_suite(tests, db_fields, full=full_gold, verbose=False)
+            results = [
+                dict(r, status="✅" if r["ok"] else "❌",
+                     backend=f"{r['backend']}{' · cached' if r['cached'] else ''}")
+                for r in report["results"]
+            ]
+            passed = report["passed"]
+
+            # Learning → learned regex rows in data/learned_patterns.json
             from parser_llm import analyze_feedback_and_learn, auto_update_parser_regex
-            analyze_feedback_and_learn("parser_feedback.json", "parser_memory.json")
-            auto_update_parser_regex("parser_memory.json", "parser_llm.py")
+            with LEARNING_LOCK:  # waits for the startup job if it is still running
+                analyze_feedback_and_learn(memory_path="parser_memory.json")
+                auto_update_parser_regex("parser_memory.json")
 
             st.session_state.gold_results = results
             st.session_state.gold_summary = (passed, len(tests))
-            st.success(f"Gold Spec Tests complete ({passed}/{len(tests)} passed).")
+            st.success(f"Gold Spec Tests complete ({passed}/{len(tests)} passed; "
+                       f"{report['ran']} run, {report['cached']} unchanged, {report['seconds']}s).")
 
         except FileNotFoundError:
             st.error("⚠️ gold_tests.json not found. Add it to the repo root.")
@@ -222,11 +181,12 @@ with st.sidebar.expander("🧪 Gold Spec Tests (Parser Validation)", expanded=Fa
     # Clear learning memory
     if st.button("🧹 Clear Learning Memory"):
         try:
-            if os.path.exists("parser_feedback.json"):
-                os.remove("parser_feedback.json")
+            log = get_feedback_log()
+            if len(log):
+                log.clear()
                 st.success("Cleared feedback memory.")
             else:
-                st.info("No feedback file found.")
+                st.info("No feedback recorded yet.")
         except Exception as e:
             st.error(f"Could not clear memory: {e}")
 
@@ -321,62 +281,8 @@ if user_msg:
     st.chat_message("assistant").markdown(reply)
 
 # ──────────────────────────────────────────────────────────────────────────────
-# 🔄 AUTO-GIT COMMIT (Full integration for Streamlit Cloud)
+# 🔄 GIT SYNC — debounced background worker (git_sync.py); never blocks a rerun
 # ──────────────────────────────────────────────────────────────────────────────
-def auto_git_commit():
-    """Automatically commit parser learning updates and push to GitHub."""
-    import subprocess
-    from datetime import datetime
-
-    token = os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN")
-    repo = os.getenv("GITHUB_REPO")
-    branch = os.getenv("GIT_BRANCH", "main")
-    email = os.getenv("GIT_USER_EMAIL", os.getenv("GITHUB_EMAIL", "bot@bactaid.local"))
-    name = os.getenv("GIT_USER_NAME", os.getenv("GITHUB_NAME", "BactAI-D AutoCommit"))
-
-    if not token or not repo:
-        print("⚠️ Missing GitHub credentials (GH_TOKEN/GITHUB_REPO). Skipping auto-commit.")
-        return
-
-    try:
-        # Configure Git identity & safety
-        subprocess.run(["git", "config", "--global", "user.email", email], check=False)
-        subprocess.run(["git", "config", "--global", "user.name", name], check=False)
-        subprocess.run(["git", "config", "--global", "--add", "safe.directory", os.getcwd()], check=False)
-
-        # Stage relevant files (learning-related & core engine)
-        files_to_add = [
-            "parser_llm.py",
-            "parser_basic.py",
-            "parser_memory.json",
-            "parser_feedback.json",
-            "engine.py",
-            "gold_tests.json"
-        ]
-        for f in files_to_add:
-            if os.path.exists(f):
-                subprocess.run(["git", "add", f], check=False)
-
-        # Check for staged changes
-        status = subprocess.run(["git", "diff", "--cached", "--name-only"], capture_output=True, text=True)
-        if not status.stdout.strip():
-            print("ℹ️ No staged changes to commit.")
-            return
-
-        msg = f"🤖 Auto-learn update — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        subprocess.run(["git", "commit", "-m", msg], check=False)
-
-        remote_url = f"https://{token}@github.com/{repo}.git"
-        subprocess.run(["git", "push", remote_url, f"HEAD:{branch}"], check=True)
-        print("✅ Auto-commit and push completed successfully.")
-    except Exception as e:
-        print(f"⚠️ Auto-commit failed: {e}")
-
-
-# Auto-run commit after gold test learning or feedback changes
-if os.path.exists("parser_memory.json") or os.path.exists("parser_feedback.json"):
-    try:
-        auto_git_commit()
-        st.sidebar.success("✅ Auto-commit to GitHub completed.")
-    except Exception as e:
-        st.sidebar.warning(f"⚠️ Auto-commit skipped: {e}")
+git_sync = get_git_sync()
+git_sync.notify("chat rerun")
+st.sidebar.caption(git_sync.status_line())
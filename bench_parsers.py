@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# bench_parsers.py — latency + accuracy benchmark for the parsers over gold_tests.json
+# ──────────────────────────────────────────────────────────────────────────────
+# Parsers benchmarked (--parsers, comma-separated):
+#   • basic  ← parser_basic.parse_input_free_text
+#   • regex  ← parser_llm.regex_stage (the deterministic layer only)
+#   • llm    ← parser_llm.parse_input_free_text (gate + LLM); needs a server,
+#              normally the local stand-in (see ollama_stub.py / OLLAMA_HOST)
+#
+# Reported per parser (JSON with --json PATH, "-" for stdout):
+#   • per-case latency, pass/fail and mismatch count
+#   • latency p50/p90/p95/p99/max/mean, throughput (cases/s)
+#   • per-field precision/recall over fields the case has an expectation for:
+#       tp = value matches, wrong = different value, missed = not produced,
+#       extra = produced for a field the case does not list (reported, unscored)
+#       precision = tp / (tp + wrong), recall = tp / (tp + wrong + missed)
+#   • pattern-level hit counts: how many cases each *_PATTERNS entry (built-in
+#     and learned) matches
+#
+# Compare mode: --compare PREV.json prints speed and accuracy deltas against a
+# previous run (and stores them under "compare" in the JSON).
+#
+# Usage:
+#   python bench_parsers.py --json data/bench/base.json
+#   python bench_parsers.py --compare data/bench/base.json --json data/bench/new.json
+#   python bench_parsers.py --parsers basic,regex,llm --repeat 3 --limit 50
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import contextlib
+import subprocess
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from gold_test_runner import GOLD_TESTS_PATH, load_db_fields, load_tests
+import parser_llm
+import parser_basic
+
+ParseFn = Callable[[str, List[str]], Dict[str, str]]
+
+PARSERS: Dict[str, ParseFn] = {
+    "basic": lambda text, fields: parser_basic.parse_input_free_text(text, prior_facts={}, db_fields=fields),
+    "regex": lambda text, fields: parser_llm.regex_stage(text, fields)[2],
+    "llm": lambda text, fields: parser_llm.parse_input_free_text(text, prior_facts={}, db_fields=fields),
+}
+PERCENTILES = (50, 90, 95, 99)
+EMPTY_VALUES = ("", None, "Unknown")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Linear-interpolated percentile of an unsorted list (0.0 if empty)."""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = (len(xs) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    out = {f"p{p}_ms": round(percentile(seconds, p) * 1000, 3) for p in PERCENTILES}
+    out["max_ms"] = round(max(seconds) * 1000, 3) if seconds else 0.0
+    out["mean_ms"] = round(sum(seconds) / len(seconds) * 1000, 3) if seconds else 0.0
+    return out
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Accuracy
+# ──────────────────────────────────────────────────────────────────────────────
+def score_fields(cases: List[Dict[str, object]]) -> Dict[str, object]:
+    """Per-field and micro-averaged precision/recall from per-case parsed/expected."""
+    fields: Dict[str, Dict[str, int]] = {}
+    for case in cases:
+        parsed, expected = case["parsed"], case["expected"]
+        for f in set(parsed) | set(expected):
+            got = parsed.get(f)
+            c = fields.setdefault(f, {"tp": 0, "wrong": 0, "missed": 0, "extra": 0})
+            if f not in expected:
+                if got not in EMPTY_VALUES:
+                    c["extra"] += 1
+            elif got in EMPTY_VALUES:
+                c["missed"] += 1
+            elif str(got) == str(expected[f]):
+                c["tp"] += 1
+            else:
+                c["wrong"] += 1
+
+    def pr(c: Dict[str, int]) -> Dict[str, object]:
+        scored = c["tp"] + c["wrong"]
+        total = scored + c["missed"]
+        return dict(c, precision=round(c["tp"] / scored, 4) if scored else None,
+                    recall=round(c["tp"] / total, 4) if total else None)
+
+    micro = {k: sum(c[k] for c in fields.values()) for k in ("tp", "wrong", "missed", "extra")}
+    return {"fields": {f: pr(c) for f, c in sorted(fields.items())}, "micro": pr(micro)}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Pattern hit counts
+# ──────────────────────────────────────────────────────────────────────────────
+def pattern_hits(texts: List[str]) -> Dict[str, List[Dict[str, object]]]:
+    """Cases matched per pattern: parser_llm's *_PATTERNS lists plus learned buckets."""
+    banks: Dict[str, List[str]] = {
+        name: list(val) for name, val in vars(parser_llm).items()
+        if name.endswith("_PATTERNS") and isinstance(val, list)
+    }
+    for bucket, pats in parser_llm.get_learned_patterns().snapshot().items():
+        banks.setdefault(bucket, []).extend(rx.pattern for _, rx in pats)
+
+    normalized = [parser_llm.normalize_text(t) for t in texts]
+    report: Dict[str, List[Dict[str, object]]] = {}
+    for bank, pats in sorted(banks.items()):
+        rows = []
+        for pat in pats:
+            try:
+                rx = re.compile(pat, re.I | re.S)
+            except re.error as e:
+                rows.append({"pattern": pat, "hits": 0, "error": str(e)})
+                continue
+            rows.append({"pattern": pat, "hits": sum(1 for t in normalized if rx.search(t))})
+        report[bank] = rows
+    return report
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Running
+# ──────────────────────────────────────────────────────────────────────────────
+def bench_parser(name: str, fn: ParseFn, tests: List[Dict], db_fields: List[str], repeat: int = 1) -> Dict[str, object]:
+    """Run one parser over the corpus; per-case latency is the median of `repeat` runs."""
+    for case in tests[:3]:  # warm-up: regex compile caches, lazy imports
+        fn(case.get("input", ""), db_fields)
+
+    cases: List[Dict[str, object]] = []
+    t_start = time.perf_counter()
+    for i, case in enumerate(tests, 1):
+        text = case.get("input", "")
+        expected = {k: v for k, v in case.get("expected", {}).items() if k in db_fields}
+        timings, parsed = [], {}
+        for _ in range(max(1, repeat)):
+            t0 = time.perf_counter()
+            parsed = fn(text, db_fields)
+            timings.append(time.perf_counter() - t0)
+        mismatches = sum(1 for k, v in expected.items() if str(parsed.get(k, "")) != str(v))
+        cases.append({
+            "name": case.get("name", f"Case_{i}"), "seconds": round(percentile(timings, 50), 6),
+            "ok": mismatches == 0, "mismatches": mismatches, "parsed": parsed, "expected": expected,
+        })
+    wall = time.perf_counter() - t_start
+
+    seconds = [c["seconds"] for c in cases]
+    scores = score_fields(cases)
+    return {
+        "aggregate": {
+            "cases": len(cases),
+            "passed": sum(1 for c in cases if c["ok"]),
+            "wall_s": round(wall, 3),
+            "throughput_cps": round(len(cases) * max(1, repeat) / wall, 2) if wall else 0.0,
+            "latency": latency_summary(seconds),
+            "precision": scores["micro"]["precision"],
+            "recall": scores["micro"]["recall"],
+        },
+        "fields": scores["fields"],
+        "cases": [{k: c[k] for k in ("name", "seconds", "ok", "mismatches")} for c in cases],
+    }
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_bench(parsers: List[str], tests: List[Dict], db_fields: List[str], repeat: int = 1) -> Dict[str, object]:
+    report: Dict[str, object] = {
+        "meta": {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "git_rev": _git_rev(),
+            "cases": len(tests),
+            "db_fields": len(db_fields),
+            "repeat": repeat,
+            "learned_patterns_version": parser_llm.get_learned_patterns().version,
+            "prompt_version": parser_llm.PROMPT_VERSION,
+        },
+        "parsers": {},
+    }
+    for name in parsers:
+        print(f"⏱️ Benchmarking {name} over {len(tests)} cases...", file=sys.stderr)
+        report["parsers"][name] = bench_parser(name, PARSERS[name], tests, db_fields, repeat)
+    report["patterns"] = pattern_hits([c.get("input", "") for c in tests])
+    return report
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Compare
+# ──────────────────────────────────────────────────────────────────────────────
+def _delta(new: Optional[float], old: Optional[float]) -> Dict[str, Optional[float]]:
+    if new is None or old is None:
+        return {"old": old, "new": new, "delta": None, "pct": None}
+    return {"old": old, "new": new, "delta": round(new - old, 4),
+            "pct": round((new - old) / old * 100, 1) if old else None}
+
+
+def _case_outcomes(cases: List[Dict[str, object]]) -> Dict[str, bool]:
+    """name → ok, with "#2", "#3"… on repeated names (gold_tests.json has duplicates)."""
+    seen: Dict[str, int] = {}
+    out: Dict[str, bool] = {}
+    for c in cases:
+        seen[c["name"]] = seen.get(c["name"], 0) + 1
+        out[c["name"] if seen[c["name"]] == 1 else f"{c['name']} #{seen[c['name']]}"] = c["ok"]
+    return out
+
+
+def compare_reports(new: Dict[str, object], old: Dict[str, object]) -> Dict[str, object]:
+    """Speed and accuracy deltas per parser present in both reports."""
+    out: Dict[str, object] = {"against": old.get("meta", {})}
+    for name, cur in new["parsers"].items():
+        prev = old.get("parsers", {}).get(name)
+        if not prev:
+            continue
+        a, b = cur["aggregate"], prev["aggregate"]
+        field_changes = {}
+        for f, fc in cur["fields"].items():
+            pf = prev["fields"].get(f, {})
+            for metric in ("precision", "recall"):
+                if fc.get(metric) != pf.get(metric):
+                    field_changes.setdefault(f, {})[metric] = _delta(fc.get(metric), pf.get(metric))
+        cur_ok, prev_ok = _case_outcomes(cur["cases"]), _case_outcomes(prev["cases"])
+        out[name] = {
+            "p50_ms": _delta(a["latency"]["p50_ms"], b["latency"]["p50_ms"]),
+            "p95_ms": _delta(a["latency"]["p95_ms"], b["latency"]["p95_ms"]),
+            "throughput_cps": _delta(a["throughput_cps"], b["throughput_cps"]),
+            "passed": _delta(a["passed"], b["passed"]),
+            "precision": _delta(a["precision"], b["precision"]),
+            "recall": _delta(a["recall"], b["recall"]),
+            "fields": field_changes,
+            "fixed": [n for n, ok in cur_ok.items() if ok and prev_ok.get(n) is False],
+            "broken": [n for n, ok in cur_ok.items() if not ok and prev_ok.get(n) is True],
+        }
+    return out
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────────────────────
+def _fmt_delta(d: Dict[str, Optional[float]]) -> str:
+    if d["delta"] is None:
+        return f"{d['new']}"
+    if d["pct"] is None:
+        return f"{d['new']} ({d['delta']:+g})"
+    return f"{d['new']} ({d['delta']:+g}, {d['pct']:+.1f}%)"
+
+
+def print_summary(report: Dict[str, object]) -> None:
+    for name, r in report["parsers"].items():
+        a = r["aggregate"]
+        lat = a["latency"]
+        print(f"📊 {name}: {a['passed']}/{a['cases']} passed | p50 {lat['p50_ms']}ms p95 {lat['p95_ms']}ms "
+              f"max {lat['max_ms']}ms | {a['throughput_cps']} cases/s | precision {a['precision']} recall {a['recall']}")
+    dead = sum(1 for rows in report["patterns"].values() for row in rows if row["hits"] == 0)
+    total = sum(len(rows) for rows in report["patterns"].values())
+    print(f"🔎 Patterns: {total - dead}/{total} match at least one case ({dead} never hit)")
+
+    cmp_ = report.get("compare")
+    if not cmp_:
+        return
+    print(f"↔️ Compared with {cmp_['against'].get('timestamp')} ({cmp_['against'].get('git_rev')}):")
+    for name, c in cmp_.items():
+        if name == "against":
+            continue
+        print(f"   {name}: p50 {_fmt_delta(c['p50_ms'])} ms, p95 {_fmt_delta(c['p95_ms'])} ms, "
+              f"passed {_fmt_delta(c['passed'])}, precision {_fmt_delta(c['precision'])}, recall {_fmt_delta(c['recall'])}")
+        if c["broken"]:
+            print(f"     ❌ newly failing: {', '.join(c['broken'][:10])}{' …' if len(c['broken']) > 10 else ''}")
+        if c["fixed"]:
+            print(f"     ✅ newly passing: {', '.join(c['fixed'][:10])}{' …' if len(c['fixed']) > 10 else ''}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark parser latency and accuracy over gold_tests.json")
+    ap.add_argument("--parsers", default="basic,regex", help="comma list of: " + ", ".join(PARSERS))
+    ap.add_argument("--repeat", type=int, default=1, help="timed runs per case (median kept)")
+    ap.add_argument("--limit", type=int, default=0, help="only the first N cases")
+    ap.add_argument("--tests", default=str(GOLD_TESTS_PATH))
+    ap.add_argument("--json", dest="json_path", help="write the full report here ('-' = stdout)")
+    ap.add_argument("--compare", help="previous report to diff against")
+    args = ap.parse_args(argv)
+
+    parsers = [p.strip() for p in args.parsers.split(",") if p.strip()]
+    unknown = [p for p in parsers if p not in PARSERS]
+    if unknown:
+        ap.error(f"unknown parser(s): {', '.join(unknown)}")
+
+    tests = load_tests(args.tests)
+    if args.limit:
+        tests = tests[: args.limit]
+    # Keep stdout clean for --json - (parsers/loaders print diagnostics)
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json_path == "-" else contextlib.nullcontext()
+    with quiet:
+        report = run_bench(parsers, tests, load_db_fields(), repeat=args.repeat)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["compare"] = compare_reports(report, json.load(f))
+
+    if args.json_path == "-":
+        json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        print_summary(report)
+        if args.json_path:
+            os.makedirs(os.path.dirname(os.path.abspath(args.json_path)), exist_ok=True)
+            with open(args.json_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"💾 Wrote {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,639 @@
+#!/usr/bin/env python3
+# compiled_db.py — pandas-free compiled form of the reference DB for engine.py
+# ──────────────────────────────────────────────────────────────────────────────
+# BacteriaIdentifier only needs, per genus, which of a handful of strings each
+# field holds. CompiledDB keeps exactly that:
+#   • columns  — original column order (suggest_next_tests walks it)
+#   • fields   — columns minus Genus (the scored ones)
+#   • genera   — one name per row, DB order
+#   • vocab    — per field, the distinct cell strings (fillna("") + str());
+#                "" is always code 0 when a field has blank cells
+#   • one code column per field, stored column-major:
+#       – categorical fields → 1-byte (uint8) codes
+#       – free-text fields (FREE_TEXT_FIELDS, or > 256 distinct values) →
+#         2/4-byte ids into that field's own string table (its vocab)
+#       – any column with enough blanks is stored sparse: a bitmask of
+#         non-blank rows + codes for those rows only
+#
+# Scoring a query is then compare_field() once per distinct value per field,
+# plus integer lookups per row (see engine.BacteriaIdentifier.identify).
+#
+# On disk a compiled DB is ONE read-only file (bacteria_db.cdb next to the
+# xlsx), laid out so every process can map it and share the same pages:
+#   header        ← magic, format, counts, section offsets (little-endian)
+#   column table  ← per field: sparse flag, code width, vocab size, non-blank
+#                   count, codes offset, mask offset
+#   string table  ← u32 offsets + UTF-8 blob: columns, genera, then each vocab
+#   column data   ← masks and code columns (8-byte aligned)
+#   row hashes    ← 8-byte content hash per genus (all cells of the row)
+# Loading is a single mmap; genus names and vocab strings are decoded from the
+# mapping on access, so a worker holds no private copy of the reference data.
+# The file is written to a temp name and os.replace()d, so readers never see a
+# partial file and existing mappings stay valid across a recompile.
+#
+# Recompiles are differential: rows whose hash is unchanged keep their codes
+# (copied from the old file), only changed / added genera are encoded, and the
+# vocabularies keep their order so existing codes stay stable. Each recompile
+# bumps the DB version and appends what changed to <out>.changes.jsonl:
+#   {"version", "previous", "full", "added", "changed", "removed", ...}
+# changes_since(out, version) turns that into the set of genera a downstream
+# cache must drop (None → flush everything).
+#
+# Several workers (Streamlit sessions, CLI runs) may find the file stale at
+# once: the freshness check, recompile and change-log append run under an
+# exclusive flock on <out>.lock, and the check is repeated once the lock is
+# held, so only the first one recompiles and each version is logged once.
+#
+# pandas is only needed to compile from a DataFrame / xlsx.
+#
+# Usage:
+#   python compiled_db.py                          ← bacteria_db.xlsx → bacteria_db.cdb
+#   python compiled_db.py path/to/db.xlsx out.cdb
+#   python compiled_db.py --full ...               ← ignore the old file, rebuild all
+#   python compiled_db.py --memory-report [db.cdb|db.xlsx]
+#                                                  ← bytes per genus at 150 / 100k rows
+#
+#   from compiled_db import ensure_compiled, get_compiled_db
+#   eng = BacteriaIdentifier(get_compiled_db(ensure_compiled("data/bacteria_db.xlsx")))
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import tempfile
+import threading
+from array import array
+from contextlib import contextmanager
+from collections.abc import Sequence as _SequenceABC
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import fcntl  # POSIX only; cross-process recompile lock
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+GENUS_COLUMN = "Genus"
+FREE_TEXT_FIELDS = ("Colony Morphology", "Media Grown On", "Extra Notes")
+COMPILED_SUFFIX = ".cdb"
+CHANGELOG_SUFFIX = ".changes.jsonl"
+LOCK_SUFFIX = ".lock"
+REPORT_ROWS = (150, 100_000)
+MAGIC = b"BACTCDB\0"
+FORMAT = 4
+HASH_BYTES = 8
+# magic, format, big-endian flag, n_columns, n_rows, n_fields, n_strings, DB
+# version, column table offset, strings offset, blob offset, row hashes offset
+_HEADER = struct.Struct("<8sHBxIIIIIxxxxQQQQ")
+# sparse flag, code itemsize, vocab size, non-blank count, codes offset, mask offset
+_COLDESC = struct.Struct("<BBxxIIxxxxQQ")
+_ALIGN = 8
+
+
+def _code_type(max_vocab: int) -> str:
+    """Smallest unsigned array typecode that can index max_vocab entries."""
+    for tc in ("B", "H", "I"):
+        if max_vocab <= 1 << (8 * array(tc).itemsize):
+            return tc
+    return "L"
+
+
+def _typecode(itemsize: int) -> str:
+    return next(t for t in ("B", "H", "I", "L") if array(t).itemsize == itemsize)
+
+
+def _pad(n: int) -> int:
+    return -n % _ALIGN
+
+
+class _StrTable(_SequenceABC):
+    """Read-only run of strings in a mapped string table, decoded on access."""
+    __slots__ = ("_offs", "_blob", "_start", "_n")
+
+    def __init__(self, offs: memoryview, blob: memoryview, start: int, n: int):
+        self._offs, self._blob, self._start, self._n = offs, blob, start, n
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        k = self._start + i
+        return str(self._blob[self._offs[k]:self._offs[k + 1]], "utf-8")
+
+
+class _Column:
+    """
+    One field's codes. Dense: codes[i] per row. Sparse: mask has bit i set for
+    non-blank rows and codes holds only those rows' codes (blank = code 0).
+    """
+    __slots__ = ("n", "codes", "mask")
+
+    def __init__(self, n: int, codes: Sequence[int], mask: Optional[Sequence[int]] = None):
+        self.n, self.codes, self.mask = n, codes, mask
+
+    @property
+    def itemsize(self) -> int:
+        return self.codes.itemsize
+
+    def code(self, i: int) -> int:
+        if self.mask is None:
+            return self.codes[i]
+        byte, bit = divmod(i, 8)
+        if not (self.mask[byte] >> bit) & 1:
+            return 0
+        below = int.from_bytes(self.mask[:byte], "little").bit_count()
+        return self.codes[below + (self.mask[byte] & ((1 << bit) - 1)).bit_count()]
+
+    def dense(self) -> Sequence[int]:
+        """Codes for every row (zero-copy for dense columns)."""
+        if self.mask is None:
+            return self.codes
+        out = array(_typecode(self.itemsize), bytes(self.n * self.itemsize))
+        k = 0
+        for byte, bits in enumerate(self.mask):
+            while bits:
+                low = bits & -bits
+                out[byte * 8 + low.bit_length() - 1] = self.codes[k]
+                k += 1
+                bits ^= low
+        return out
+
+    def nbytes(self) -> Tuple[int, int]:
+        """(code bytes, mask bytes)."""
+        return len(self.codes) * self.itemsize, 0 if self.mask is None else len(self.mask)
+
+
+def _build_column(codes: Sequence[int], n_vocab: int, free_text: bool, has_blank: bool) -> _Column:
+    """Pick width (uint8 unless free text / > 256 values) and dense vs sparse (blank = code 0)."""
+    tc = _code_type(n_vocab) if free_text or n_vocab > 256 else "B"
+    width = array(tc).itemsize
+    n = len(codes)
+    nnz = sum(1 for c in codes if c) if has_blank else n
+    if not has_blank or (n + 7) // 8 + nnz * width >= n * width:
+        return _Column(n, array(tc, codes))
+    mask = bytearray((n + 7) // 8)
+    for i, c in enumerate(codes):
+        if c:
+            mask[i >> 3] |= 1 << (i & 7)
+    return _Column(n, array(tc, (c for c in codes if c)), bytes(mask))
+
+
+def _row_hash(cells: Sequence[str]) -> bytes:
+    return hashlib.blake2b("\x1f".join(cells).encode("utf-8"), digest_size=HASH_BYTES).digest()
+
+
+class CompiledDB:
+    """Reference profiles as per-field vocabularies + compact code columns."""
+
+    def __init__(self, columns: List[str], genera: Sequence[str], vocab: List[Sequence[str]], cols: List[_Column],
+                 row_hashes: bytes = b"", version: int = 1):
+        self.columns = list(columns)
+        self.fields = [c for c in self.columns if c != GENUS_COLUMN]
+        self.genera = genera if isinstance(genera, _StrTable) else list(genera)
+        self.vocab = vocab
+        self.cols = cols
+        self.row_hashes = row_hashes  # HASH_BYTES per row, DB order
+        self.version = version
+        self.field_index: Dict[str, int] = {f: j for j, f in enumerate(self.fields)}
+        self._mapped: List[object] = []  # views then the mmap, when loaded from disk
+        if (len(vocab) != len(self.fields) or len(cols) != len(self.fields)
+                or any(c.n != len(self.genera) for c in cols) or len(row_hashes) != HASH_BYTES * len(self.genera)):
+            raise ValueError("compiled DB shape mismatch")
+
+    def __len__(self) -> int:
+        return len(self.genera)
+
+    def row_hash(self, i: int) -> bytes:
+        return bytes(self.row_hashes[i * HASH_BYTES:(i + 1) * HASH_BYTES])
+
+    def column_codes(self, j: int) -> Sequence[int]:
+        """Every row's code for field j (index into vocab[j])."""
+        return self.cols[j].dense()
+
+    def cell(self, i: int, field: str, default: str = "") -> str:
+        j = self.field_index.get(field)
+        if j is None:
+            return default
+        return self.vocab[j][self.cols[j].code(i)]
+
+    def column_values(self, field: str) -> List[str]:
+        """Every row's value for a field, in DB order (Genus included)."""
+        if field == GENUS_COLUMN:
+            return list(self.genera)
+        j = self.field_index[field]
+        vocab = self.vocab[j]
+        return [vocab[c] for c in self.column_codes(j)]
+
+    # ── persistence ─────────────────────────────────────────────────────────
+    def save(self, path: str) -> None:
+        """Write the single-file format atomically (temp file + os.replace)."""
+        strings = [*self.columns, *self.genera, *(s for v in self.vocab for s in v)]
+        blob = bytearray()
+        offs = array("I", [0])
+        for s in strings:
+            blob += s.encode("utf-8")
+            offs.append(len(blob))
+
+        coldesc_off = _HEADER.size + _pad(_HEADER.size)
+        strings_off = coldesc_off + _COLDESC.size * len(self.cols)
+        blob_off = strings_off + offs.itemsize * len(offs)
+        pos = blob_off + len(blob) + _pad(blob_off + len(blob))
+        descs, chunks = [], []
+        for col, voc in zip(self.cols, self.vocab):
+            code_bytes, mask_bytes = col.nbytes()
+            mask_off = 0
+            if col.mask is not None:
+                mask_off = pos
+                chunks.append(bytes(col.mask) + bytes(_pad(mask_bytes)))
+                pos += mask_bytes + _pad(mask_bytes)
+            codes_off = pos
+            chunks.append(array(_typecode(col.itemsize), col.codes).tobytes() + bytes(_pad(code_bytes)))
+            pos += code_bytes + _pad(code_bytes)
+            descs.append(_COLDESC.pack(col.mask is not None, col.itemsize, len(voc), len(col.codes), codes_off, mask_off))
+        hashes_off = pos
+        chunks.append(bytes(self.row_hashes))
+        header = _HEADER.pack(
+            MAGIC, FORMAT, sys.byteorder == "big", len(self.columns), len(self.genera), len(self.fields),
+            len(strings), self.version, coldesc_off, strings_off, blob_off, hashes_off,
+        )
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header + bytes(_pad(_HEADER.size)))
+            f.write(b"".join(descs))
+            offs.tofile(f)
+            f.write(blob)
+            f.write(bytes(_pad(blob_off + len(blob))))
+            f.write(b"".join(chunks))
+        os.replace(tmp, path)
+
+    def close(self) -> None:
+        """Unmap a loaded DB (no-op for compiled-in-memory ones)."""
+        if self._mapped:
+            *views, mm = self._mapped
+            for v in reversed(views):
+                v.release()
+            mm.close()
+            self._mapped = []
+
+    # ── size accounting ─────────────────────────────────────────────────────
+    def memory_breakdown(self) -> Dict[str, int]:
+        """Bytes by section, as stored in the compiled file."""
+        out = {"uint8 codes": 0, "free-text ids": 0, "blank masks": 0, "genus names": 0, "string tables": 0}
+        for j, col in enumerate(self.cols):
+            code_bytes, mask_bytes = col.nbytes()
+            out["uint8 codes" if col.itemsize == 1 and self.fields[j] not in FREE_TEXT_FIELDS else "free-text ids"] += code_bytes
+            out["blank masks"] += mask_bytes
+        out["genus names"] = sum(len(g.encode("utf-8")) + 4 for g in self.genera)
+        out["string tables"] = sum(len(s.encode("utf-8")) + 4 for v in self.vocab for s in v)
+        return out
+
+
+def load_compiled_db(path: str) -> CompiledDB:
+    """Map a compiled DB file read-only; nothing but the column names is copied."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mm) < _HEADER.size:
+            raise ValueError(f"{path}: not a compiled DB")
+        (magic, fmt, big, n_cols, n_rows, n_fields, n_strings, version,
+         coldesc_off, strings_off, blob_off, hashes_off) = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a compiled DB")
+        if fmt != FORMAT:
+            raise ValueError(f"{path}: unsupported compiled DB format {fmt}")
+        if bool(big) != (sys.byteorder == "big"):
+            raise ValueError(f"{path}: compiled on a machine with different byte order")
+        descs = [_COLDESC.unpack_from(mm, coldesc_off + j * _COLDESC.size) for j in range(n_fields)]
+    except Exception:
+        mm.close()
+        raise
+
+    base = memoryview(mm)
+    views: List[memoryview] = [base]
+    offs_v = base[strings_off:blob_off].cast("I")
+    blob_v = base[blob_off:]
+    hashes_v = base[hashes_off:hashes_off + HASH_BYTES * n_rows]
+    views += [offs_v, blob_v, hashes_v]
+
+    columns = _StrTable(offs_v, blob_v, 0, n_cols)[:]
+    genera = _StrTable(offs_v, blob_v, n_cols, n_rows)
+    vocab: List[Sequence[str]] = []
+    cols: List[_Column] = []
+    start = n_cols + n_rows
+    for sparse, itemsize, n_vocab, n_codes, codes_off, mask_off in descs:
+        vocab.append(_StrTable(offs_v, blob_v, start, n_vocab))
+        start += n_vocab
+        codes_v = base[codes_off:codes_off + itemsize * n_codes].cast(_typecode(itemsize))
+        mask_v = base[mask_off:mask_off + (n_rows + 7) // 8] if sparse else None
+        views += [codes_v] + ([mask_v] if sparse else [])
+        cols.append(_Column(n_rows, codes_v, mask_v))
+    if start != n_strings:
+        raise ValueError(f"{path}: corrupt string table")
+    cdb = CompiledDB(columns, genera, vocab, cols, hashes_v, version)
+    cdb._mapped = views + [mm]
+    return cdb
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Per-process cache: one mapping per file version
+# ──────────────────────────────────────────────────────────────────────────────
+_CACHE: Dict[str, Tuple[Tuple[int, int, int], CompiledDB]] = {}
+_CACHE_LOCK = threading.Lock()
+
+
+def get_compiled_db(path: str) -> CompiledDB:
+    """
+    Process-wide mapping of a compiled DB. Re-maps only when the file was
+    replaced; the previous mapping stays readable for whoever still holds it.
+    """
+    key = os.path.abspath(path)
+    st = os.stat(key)
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(key)
+        if hit is None or hit[0] != stamp:
+            hit = _CACHE[key] = (stamp, load_compiled_db(key))
+        return hit[1]
+
+
+def compiled_path_for(src: str) -> str:
+    return os.path.splitext(src)[0] + COMPILED_SUFFIX
+
+
+@contextmanager
+def _compile_lock(out: str):
+    """Exclusive lock (threads and processes) held while out is rebuilt and logged."""
+    if fcntl is None:
+        yield
+        return
+    with open(out + LOCK_SUFFIX, "a+") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+def _is_fresh(src: str, out: str) -> bool:
+    try:
+        return os.path.getmtime(out) >= os.path.getmtime(src)
+    except FileNotFoundError:
+        return False
+
+
+def ensure_compiled(src: str, out: Optional[str] = None) -> str:
+    """Recompile src (xlsx) → out if out is missing or older (differentially); returns out."""
+    out = out or compiled_path_for(src)
+    if not _is_fresh(src, out):
+        with _compile_lock(out):
+            if not _is_fresh(src, out):  # another worker may have just rebuilt it
+                _update_compiled(src, out)
+    return out
+
+
+def update_compiled(src: str, out: str, full: bool = False) -> Dict[str, object]:
+    """Recompile src into out, reusing unchanged rows of the existing out; logs and returns the change entry."""
+    with _compile_lock(out):
+        return _update_compiled(src, out, full)
+
+
+def _update_compiled(src: str, out: str, full: bool = False) -> Dict[str, object]:
+    old = None
+    if not full and os.path.exists(out):
+        try:
+            old = load_compiled_db(out)
+        except ValueError as e:  # older format / foreign file → full rebuild
+            print(f"⚠️ {e}; rebuilding from scratch")
+    try:
+        cdb, change = recompile_xlsx(src, old)
+        cdb.save(out)
+    finally:
+        if old is not None:
+            old.close()
+    change.update(time=datetime.now().strftime("%Y-%m-%d %H:%M:%S"), source=src)
+    with open(out + CHANGELOG_SUFFIX, "a", encoding="utf-8") as f:
+        f.write(json.dumps(change, ensure_ascii=False) + "\n")
+    edits = len(change["added"]) + len(change["changed"]) + len(change["removed"])
+    how = "full rebuild" if change["full"] else f"{edits} genera changed, {change['unchanged']} reused"
+    print(f"📦 Compiled reference DB {src} → {out} (v{change['version']}: {how})")
+    return change
+
+
+def read_change_log(out: str) -> List[Dict[str, object]]:
+    try:
+        with open(out + CHANGELOG_SUFFIX, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def changes_since(out: str, version: int) -> Optional[Set[str]]:
+    """
+    Genera added, changed or removed after DB version `version`, or None when
+    the log can't tell (full rebuild since, or history missing) — flush then.
+    """
+    later = [e for e in read_change_log(out) if e["version"] > version]
+    if not later:
+        return set()
+    if any(e["full"] for e in later) or min(e["previous"] or 0 for e in later) > version:
+        return None
+    return {g for e in later for key in ("added", "changed", "removed") for g in e[key]}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Compile (the only step that may involve pandas)
+# ──────────────────────────────────────────────────────────────────────────────
+def compile_rows(columns: Sequence[str], rows: Iterable[Sequence[object]]) -> CompiledDB:
+    """
+    Build a CompiledDB from a header and row tuples. Cells are stored as
+    str(cell) with None / NaN as "" — the same strings
+    BacteriaIdentifier(df.fillna("")) used to compare.
+    """
+    return recompile_rows(None, columns, rows)[0]
+
+
+def recompile_rows(old: Optional[CompiledDB], columns: Sequence[str],
+                   rows: Iterable[Sequence[object]]) -> Tuple[CompiledDB, Dict[str, object]]:
+    """
+    compile_rows(), reusing `old` where possible: a row whose genus and content
+    hash match a row of `old` copies that row's codes; other rows are encoded
+    against old's vocabularies (new values appended). Returns the new DB and a
+    change entry (version, previous, full, added, changed, removed, unchanged).
+    Rows are keyed by genus name (n-th occurrence, should names repeat).
+    """
+    columns = [str(c) for c in columns]
+    if GENUS_COLUMN not in columns:
+        raise ValueError(f"no {GENUS_COLUMN!r} column")
+    g = columns.index(GENUS_COLUMN)
+    field_pos = [k for k, c in enumerate(columns) if c != GENUS_COLUMN]
+    reuse = old is not None and old.columns == columns
+
+    vocab: List[List[str]] = [list(v) for v in old.vocab] if reuse else [[] for _ in field_pos]
+    lookup: List[Dict[str, int]] = [{s: c for c, s in enumerate(v)} for v in vocab]
+    old_codes: List[Sequence[int]] = [old.column_codes(j) for j in range(len(field_pos))] if reuse else []
+    old_rows: Dict[Tuple[str, int], int] = {}
+    if reuse:
+        counts: Dict[str, int] = {}
+        for i, name in enumerate(old.genera):
+            old_rows[_row_key(counts, name)] = i
+
+    genera: List[str] = []
+    hashes = bytearray()
+    codes: List[array] = [array("I") for _ in field_pos]
+    change: Dict[str, object] = {"added": [], "changed": [], "removed": []}
+    seen: Dict[str, int] = {}
+    unchanged = 0
+    for row in rows:
+        cells = [_cell_str(v) for v in row]
+        h = _row_hash(cells)
+        name = cells[g]
+        genera.append(name)
+        hashes += h
+        i_old = old_rows.pop(_row_key(seen, name), None) if reuse else None
+        if i_old is not None and old.row_hash(i_old) == h:
+            unchanged += 1
+            for j in range(len(field_pos)):
+                codes[j].append(old_codes[j][i_old])
+            continue
+        if reuse:
+            change["changed" if i_old is not None else "added"].append(name)
+        for j, k in enumerate(field_pos):
+            s = cells[k]
+            code = lookup[j].get(s)
+            if code is None:
+                code = lookup[j][s] = len(vocab[j])
+                vocab[j].append(s)
+            codes[j].append(code)
+    if reuse:
+        change["removed"] = [key[0] for key, _ in sorted(old_rows.items(), key=lambda kv: kv[1])]
+
+    cols = []
+    for j, field in enumerate(columns[k] for k in field_pos):
+        vocab[j], col = _compact_vocab(vocab[j], codes[j])
+        has_blank = bool(vocab[j]) and vocab[j][0] == ""
+        cols.append(_build_column(col, len(vocab[j]), field in FREE_TEXT_FIELDS, has_blank))
+    version = old.version + 1 if old is not None else 1
+    change.update(version=version, previous=old.version if old is not None else None,
+                  full=not reuse, unchanged=unchanged)
+    return CompiledDB(columns, genera, vocab, cols, bytes(hashes), version), change
+
+
+def _row_key(counts: Dict[str, int], name: str) -> Tuple[str, int]:
+    """(name, n) for the n-th row named `name` seen through this counts dict."""
+    n = counts.get(name, 0)
+    counts[name] = n + 1
+    return (name, n)
+
+
+def _compact_vocab(vocab: List[str], codes: array) -> Tuple[List[str], array]:
+    """Drop values no row uses and put "" (blank) at code 0; other codes keep their order."""
+    used = bytearray(len(vocab))
+    for c in codes:
+        used[c] = 1
+    keep = [c for c in range(len(vocab)) if used[c] and vocab[c] == ""]
+    keep += [c for c in range(len(vocab)) if used[c] and vocab[c] != ""]
+    if keep == list(range(len(vocab))):
+        return vocab, codes
+    remap = array("I", bytes(4 * len(vocab)))
+    for new, c in enumerate(keep):
+        remap[c] = new
+    return [vocab[c] for c in keep], array("I", (remap[c] for c in codes))
+
+
+def _cell_str(v: object) -> str:
+    if v is None or v != v:  # NaN / NaT (what fillna("") blanks)
+        return ""
+    return str(v)
+
+
+def compile_dataframe(df) -> CompiledDB:
+    """CompiledDB from a pandas DataFrame (columns as-is, NaN → "")."""
+    return compile_rows(list(df.columns), df.itertuples(index=False, name=None))
+
+
+def compile_xlsx(path: str) -> CompiledDB:
+    """Read the xlsx with pandas (column names stripped, as the apps do) and compile."""
+    return recompile_xlsx(path, None)[0]
+
+
+def recompile_xlsx(path: str, old: Optional[CompiledDB]) -> Tuple[CompiledDB, Dict[str, object]]:
+    import pandas as pd
+    df = pd.read_excel(path)
+    df.columns = [str(c).strip() for c in df.columns]
+    return recompile_rows(old, list(df.columns), df.itertuples(index=False, name=None))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Memory report
+# ──────────────────────────────────────────────────────────────────────────────
+def scale_rows(cdb: CompiledDB, n_rows: int) -> CompiledDB:
+    """Synthetic DB of n_rows: the real rows repeated, genus names made unique."""
+    src = [cdb.column_values(c) for c in cdb.columns]
+    n = len(cdb)
+    rows = ([col[i % n] if c != GENUS_COLUMN else f"{col[i % n]} #{i // n}" for c, col in zip(cdb.columns, src)]
+            for i in range(n_rows))
+    return compile_rows(cdb.columns, rows)
+
+
+def _str_cells_bytes(cdb: CompiledDB) -> int:
+    """What the same cells cost as a DataFrame of Python str plus its fillna("") copy."""
+    total = 0
+    for c in cdb.columns:
+        for v in cdb.column_values(c):
+            total += sys.getsizeof(v) + 8  # str object + column pointer
+    return 2 * total
+
+
+def memory_report(cdb: CompiledDB, sizes: Sequence[int] = REPORT_ROWS) -> List[Dict[str, object]]:
+    """Per-genus bytes of the compiled file at each row count (vs Python str cells)."""
+    report = []
+    for n in sizes:
+        db = scale_rows(cdb, n)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "scaled" + COMPILED_SUFFIX)
+            db.save(path)
+            file_bytes = os.path.getsize(path)
+        report.append({
+            "rows": n, "file_bytes": file_bytes, "per_genus": file_bytes / n,
+            "str_cells_per_genus": _str_cells_bytes(db) / n, "breakdown": db.memory_breakdown(),
+        })
+    return report
+
+
+def _print_memory_report(cdb: CompiledDB) -> None:
+    print(f"📏 Compiled DB memory ({len(cdb.fields)} fields; rows beyond {len(cdb)} are the real rows repeated)")
+    for r in memory_report(cdb):
+        parts = ", ".join(f"{k} {v / r['rows']:.1f}" for k, v in r["breakdown"].items())
+        print(f"   {r['rows']:>7} rows: {r['per_genus']:.1f} B/genus in file ({r['file_bytes'] / 1024:.1f} KiB) "
+              f"vs ~{r['str_cells_per_genus']:.0f} B/genus as str cells — {parts}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    report, full = "--memory-report" in argv, "--full" in argv
+    argv = [a for a in argv if a not in ("--memory-report", "--full")]
+    src = argv[0] if argv else (os.path.join("data", "bacteria_db.xlsx")
+                                if os.path.exists(os.path.join("data", "bacteria_db.xlsx")) else "bacteria_db.xlsx")
+    if report:
+        _print_memory_report(load_compiled_db(src) if src.endswith(COMPILED_SUFFIX) else compile_xlsx(src))
+        return 0
+    out = argv[1] if len(argv) > 1 else compiled_path_for(src)
+    update_compiled(src, out, full=full)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,9 @@
-import pandas as pd
 import re
 import random
 
+from compiled_db import CompiledDB, compile_dataframe
+from pair_table import get_pair_table
+
 # -----------------------------
 # Helper Function
 # -----------------------------
@@ -29,6 +31,8 @@ class IdentificationResult:
         total_fields_evaluated,
         total_fields_possible,
         extra_notes="",
+        row=None,
+        pair_table=None,
     ):
         self.genus = genus
         self.total_score = total_score
@@ -38,6 +42,8 @@ class IdentificationResult:
         self.total_fields_evaluated = total_fields_evaluated
         self.total_fields_possible = total_fields_possible
         self.extra_notes = extra_notes
+        self.row = row  # compiled DB row, for pair_table lookups
+        self.pair_table = pair_table
 
     # -----------------------------
     # Confidence Calculations
@@ -54,6 +60,20 @@ class IdentificationResult:
             return 0
         return max(0, min(100, int((self.total_score / self.total_fields_possible) * 100)))
 
+    # -----------------------------
+    # Pairwise Discrimination
+    # -----------------------------
+    def discriminating_fields(self, others, among):
+        """Fields of `among` whose DB values differ between this genus and any of `others`."""
+        if self.pair_table is None or self.row is None:
+            return []
+        mask = 0
+        for r in others:
+            if r.row is not None:
+                mask |= self.pair_table.diff_mask(self.row, r.row)
+        bit = self.pair_table.bit
+        return [f for f in among if mask & bit.get(f, 0)]
+
     # -----------------------------
     # Reasoning Paragraph Generator
     # -----------------------------
@@ -93,10 +113,13 @@ class IdentificationResult:
             close_others = ranked_results[1:3]
             other_names = [r.genus for r in close_others]
             if other_names:
+                # Prefer fields where the genera really differ; fall back to the plain lists
                 if self.total_score >= close_others[0].total_score:
-                    comparison = f" It is **more likely** than {join_with_and(other_names)} based on stronger alignment in {join_with_and(self.matched_fields[:3])}."
+                    fields = self.discriminating_fields(close_others, self.matched_fields) or self.matched_fields
+                    comparison = f" It is **more likely** than {join_with_and(other_names)} based on stronger alignment in {join_with_and(fields[:3])}."
                 else:
-                    comparison = f" It is **less likely** than {join_with_and(other_names)} due to differences in {join_with_and(self.mismatched_fields[:3])}."
+                    fields = self.discriminating_fields(close_others, self.mismatched_fields) or self.mismatched_fields
+                    comparison = f" It is **less likely** than {join_with_and(other_names)} due to differences in {join_with_and(fields[:3])}."
 
         return f"{intro} {summary}, the isolate most closely resembles **{self.genus}**. {confidence_text}{comparison}"
 
@@ -105,9 +128,22 @@ class IdentificationResult:
 # Bacteria Identifier Engine
 # -----------------------------
 class BacteriaIdentifier:
-    """Main engine to match bacterial genus based on biochemical & morphological data."""
-    def __init__(self, db: pd.DataFrame):
-        self.db = db.fillna("")
+    """
+    Main engine to match bacterial genus based on biochemical & morphological data.
+    Runs on a CompiledDB; a pandas DataFrame is accepted and compiled once.
+    """
+    def __init__(self, db):
+        if isinstance(db, CompiledDB):
+            self.db = None
+            self.compiled = db
+        else:
+            self.db = db.fillna("")  # kept for callers that still read the DataFrame
+            self.compiled = compile_dataframe(db)
+
+    @property
+    def pair_table(self):
+        """Genus × genus field-difference table for the compiled DB (built once per DB)."""
+        return get_pair_table(self.compiled)
 
     # -----------------------------
     # Field Comparison Logic
@@ -162,26 +198,30 @@ class BacteriaIdentifier:
     # -----------------------------
     # Suggest Next Tests
     # -----------------------------
-    def suggest_next_tests(self, top_results):
-        """Suggest tests that best differentiate top matches."""
+    def suggest_next_tests(self, top_results, user_input=None):
+        """Suggest untested fields whose DB values best differentiate the top matches."""
         if len(top_results) < 2:
             return []
-        varying_fields = []
-        top3 = top_results[:3]
+        top3 = [r for r in top_results[:3] if r.row is not None]
+        entered = {f for f, v in (user_input or {}).items() if v and str(v).lower() != "unknown"}
 
-        for field in self.db.columns:
-            if field in ["Genus", "Extra Notes", "Colony Morphology"]:
-                continue
-
-            field_values = set()
-            for r in top3:
-                field_values.update(r.matched_fields)
-                field_values.update(r.mismatched_fields)
+        # How many of the top-3 pairs each field tells apart (pair_table lookups)
+        table = self.pair_table
+        splits = {}
+        for a in range(len(top3)):
+            for b in range(a + 1, len(top3)):
+                for field in table.fields_in(table.diff_mask(top3[a].row, top3[b].row)):
+                    splits[field] = splits.get(field, 0) + 1
 
-            if len(field_values) > 1:
+        varying_fields = []
+        for field in self.compiled.columns:
+            if field in ["Genus", "Extra Notes", "Colony Morphology"] or field in entered:
+                continue
+            if field in splits:
                 varying_fields.append(field)
 
         random.shuffle(varying_fields)
+        varying_fields.sort(key=lambda f: -splits[f])  # stable: equally good tests stay shuffled
         return varying_fields[:3]
 
     # -----------------------------
@@ -190,24 +230,31 @@ class BacteriaIdentifier:
     def identify(self, user_input):
         """Compare user input to database and rank top 10 possible genera."""
         results = []
-        total_fields_possible = len([c for c in self.db.columns if c != "Genus"])
-
-        for _, row in self.db.iterrows():
-            genus = row["Genus"]
+        cdb = self.compiled
+        total_fields_possible = len(cdb.fields)
+
+        # compare_field depends only on (DB value, user value, field): score each
+        # field's distinct DB values once, then rows are table lookups
+        total_fields_evaluated = 0
+        active = []  # (field, user value, score per vocab code, every row's code)
+        for j, field in enumerate(cdb.fields):
+            user_val = user_input.get(field, "")
+            if user_val and user_val.lower() != "unknown":
+                total_fields_evaluated += 1
+            scores = [self.compare_field(v, user_val, field) for v in cdb.vocab[j]]
+            if any(scores):
+                active.append((field, user_val, scores, cdb.column_codes(j)))
+
+        pair_table = self.pair_table
+        notes_j = cdb.field_index.get("Extra Notes")
+        notes_codes = cdb.column_codes(notes_j) if notes_j is not None else None
+
+        for i, genus in enumerate(cdb.genera):
             total_score = 0
             matched_fields, mismatched_fields, reasoning_factors = [], [], {}
-            total_fields_evaluated = 0
-
-            for field in self.db.columns:
-                if field == "Genus":
-                    continue
-
-                db_val = row[field]
-                user_val = user_input.get(field, "")
-                score = self.compare_field(db_val, user_val, field)
 
-                if user_val and user_val.lower() != "unknown":
-                    total_fields_evaluated += 1
+            for field, user_val, scores, codes in active:
+                score = scores[codes[i]]
 
                 if score == -999:
                     total_score = -999
@@ -223,7 +270,7 @@ class BacteriaIdentifier:
                     mismatched_fields.append(field)
 
             if total_score > -999:
-                extra_notes = row.get("Extra Notes", "")
+                extra_notes = cdb.vocab[notes_j][notes_codes[i]] if notes_codes is not None else ""
                 results.append(
                     IdentificationResult(
                         genus,
@@ -234,13 +281,15 @@ class BacteriaIdentifier:
                         total_fields_evaluated,
                         total_fields_possible,
                         extra_notes,
+                        row=i,
+                        pair_table=pair_table,
                     )
                 )
 
         results.sort(key=lambda x: x.total_score, reverse=True)
 
         if results:
-            top_suggestions = self.suggest_next_tests(results)
+            top_suggestions = self.suggest_next_tests(results, user_input)
             for r in results[:3]:
                 r.reasoning_factors["next_tests"] = ", ".join(top_suggestions)
 
@@ -0,0 +1,172 @@
+# feedback_index.py — in-process similarity index over parser feedback
+# ──────────────────────────────────────────────────────────────────────────────
+# Picks the few past failures most similar to the text being parsed, so the LLM
+# prompt carries relevant examples instead of "the last 5, whatever they were".
+#
+#   • Character n-gram TF-IDF (no external deps), cosine similarity
+#   • Built once per process from the feedback store (feedback_store.py), then
+#     folds in only entries appended since its last look (by sequence number)
+#   • Rebuilt only if the store is cleared
+#   • select() returns the k best cases that fit a token budget
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import re
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from feedback_store import FeedbackStore
+
+NGRAM = 3
+# Rough chars-per-token for budget estimates (no tokenizer available offline)
+CHARS_PER_TOKEN = 4
+
+
+def _grams(text: str) -> Dict[str, int]:
+    t = re.sub(r"\s+", " ", (text or "").lower()).strip()
+    t = f" {t} "
+    out: Dict[str, int] = {}
+    for i in range(len(t) - NGRAM + 1):
+        g = t[i:i + NGRAM]
+        out[g] = out.get(g, 0) + 1
+    return out
+
+
+def render_example(case: Dict) -> str:
+    """Prompt snippet for one feedback case (compact error list)."""
+    errs = "; ".join(
+        f"{e.get('field')}: expected {e.get('expected')!r} got {e.get('got')!r}"
+        for e in case.get("errors", [])
+    )
+    return f"\nExample failed: {case.get('name', 'case')}\nInput: {case.get('text', '')}\nErrors: {errs}\n"
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class FeedbackIndex:
+    """
+    Char n-gram TF-IDF index over feedback cases. Cases with identical input
+    text collapse to the most recent one (gold runs log the same case often).
+    """
+
+    def __init__(self, store: Optional[FeedbackStore] = None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._docs: List[Dict] = []
+        self._tf: List[Dict[str, int]] = []
+        self._by_text: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._norms: Optional[List[float]] = None
+        self._store_id: Optional[str] = None
+        self._seen_seq = 0
+
+    # ── building ────────────────────────────────────────────────────────────
+    def _reset(self) -> None:
+        self._docs, self._tf, self._by_text, self._postings = [], [], {}, {}
+        self._norms = None
+        self._seen_seq = 0
+
+    def _add_locked(self, case: Dict) -> None:
+        text = (case.get("text") or "").strip()
+        if not text or not case.get("errors"):
+            return
+        if text in self._by_text:
+            # Same input seen again: keep the newest errors, vector is unchanged
+            self._docs[self._by_text[text]] = case
+            return
+        idx = len(self._docs)
+        tf = _grams(text)
+        self._docs.append(case)
+        self._tf.append(tf)
+        self._by_text[text] = idx
+        for g in tf:
+            self._postings.setdefault(g, []).append(idx)
+        self._norms = None
+
+    def add(self, case: Dict) -> None:
+        """Fold one feedback case into the index (not persisted)."""
+        with self._lock:
+            self._add_locked(case)
+
+    def sync(self) -> None:
+        """Fold in store entries appended since the last sync."""
+        if self.store is None:
+            return
+        store_id = self.store.store_id
+        with self._lock:
+            if store_id != self._store_id:
+                self._reset()
+                self._store_id = store_id
+            if self.store.last_seq == self._seen_seq:
+                return
+            for case in self.store.since_seq(self._seen_seq):
+                self._add_locked(case)
+                self._seen_seq = max(self._seen_seq, case.get("_seq", 0))
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ── querying ────────────────────────────────────────────────────────────
+    def _idf(self, gram: str) -> float:
+        return math.log((len(self._docs) + 1) / (len(self._postings.get(gram, ())) + 1)) + 1.0
+
+    def _doc_norms(self) -> List[float]:
+        if self._norms is None:
+            self._norms = [
+                math.sqrt(sum((c * self._idf(g)) ** 2 for g, c in tf.items())) or 1.0
+                for tf in self._tf
+            ]
+        return self._norms
+
+    def search(self, text: str, k: int = 5) -> List[Tuple[float, Dict]]:
+        """Top-k (score, case) pairs by cosine similarity, best first."""
+        with self._lock:
+            if not self._docs:
+                return []
+            q = _grams(text)
+            norms = self._doc_norms()
+            scores: Dict[int, float] = {}
+            q_norm = 0.0
+            for g, c in q.items():
+                idf = self._idf(g)
+                w = c * idf
+                q_norm += w * w
+                for d in self._postings.get(g, ()):
+                    scores[d] = scores.get(d, 0.0) + w * self._tf[d][g] * idf
+            q_norm = math.sqrt(q_norm) or 1.0
+            ranked = sorted(((s / (q_norm * norms[d]), d) for d, s in scores.items()), reverse=True)
+            return [(round(s, 4), self._docs[d]) for s, d in ranked[:k]]
+
+    def select(self, text: str, k: int = 3, token_budget: int = 600) -> str:
+        """
+        Render up to k most similar past failures whose combined size fits
+        token_budget. Returns "" when nothing relevant is indexed.
+        """
+        self.sync()
+        out, used = [], 0
+        for _, case in self.search(text, k=k * 3):
+            snippet = render_example(case)
+            cost = estimate_tokens(snippet)
+            if used + cost > token_budget:
+                continue
+            out.append(snippet)
+            used += cost
+            if len(out) >= k:
+                break
+        return "".join(out)
+
+
+_INDEXES: Dict[str, FeedbackIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def get_feedback_index(store: FeedbackStore) -> FeedbackIndex:
+    """Process-wide index for a feedback store (built lazily on first select)."""
+    with _INDEXES_LOCK:
+        if store.root not in _INDEXES:
+            _INDEXES[store.root] = FeedbackIndex(store)
+        return _INDEXES[store.root]
@@ -0,0 +1,345 @@
+# feedback_store.py — append-only JSONL feedback log with an offset index
+# ──────────────────────────────────────────────────────────────────────────────
+# Replaces the old "load parser_feedback.json, append one entry, rewrite it all"
+# pattern (O(n) per failure, O(n²) per gold run).
+#
+# Layout (one directory, default data/feedback/):
+#   • segment-000001.jsonl …   ← feedback entries, one JSON object per line
+#   • index.jsonl              ← sidecar: {"seq","seg","off","len","name","ts"}
+#   • meta.json                ← {"store_id", "created", "migrated_from"}
+#
+# Segments rotate once they pass max_segment_bytes. Readers load the small
+# index (incrementally — only lines appended since their last look) and seek
+# straight to the entries they need, so "last N", "by case name" and "since
+# timestamp/seq" never parse the full history.
+#
+# store_id changes whenever the store is cleared, so consumers that remember
+# a sequence number (e.g. incremental learning) can tell their mark is stale.
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import json
+import uuid
+import bisect
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl  # POSIX only; cross-process append lock
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_SEGMENT_BYTES = int(os.getenv("BACTAI_FEEDBACK_SEGMENT_BYTES", str(1024 * 1024)))
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class FeedbackStore:
+    """Append-only feedback log. Safe to share between threads and processes."""
+
+    def __init__(self, root: str, max_segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        self.root = root
+        self.max_segment_bytes = max_segment_bytes
+        self._lock = threading.RLock()
+        self._records: List[Dict] = []
+        self._ts_keys: List[str] = []
+        self._index_offset = 0
+        self._store_id: Optional[str] = None
+        os.makedirs(self.root, exist_ok=True)
+        self._load_meta()
+
+    # ── paths / metadata ─────────────────────────────────────────────────────
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, "index.jsonl")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.root, "meta.json")
+
+    def _segment_path(self, seg: int) -> str:
+        return os.path.join(self.root, f"segment-{seg:06d}.jsonl")
+
+    def _read_meta(self) -> Dict:
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _write_meta(self, meta: Dict) -> None:
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self.meta_path)
+
+    def _load_meta(self) -> None:
+        with self._file_lock():
+            meta = self._read_meta()
+            if not meta.get("store_id"):
+                meta = {"store_id": uuid.uuid4().hex, "created": _now(), "migrated_from": None}
+                self._write_meta(meta)
+        self._store_id = meta["store_id"]
+
+    @property
+    def store_id(self) -> str:
+        self.refresh()
+        return self._store_id or ""
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, ".lock"), "a+") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    # ── index maintenance ───────────────────────────────────────────────────
+    def refresh(self) -> None:
+        """Pick up index lines appended since the last look (any process)."""
+        with self._lock:
+            meta_id = self._read_meta().get("store_id")
+            try:
+                size = os.path.getsize(self.index_path)
+            except OSError:
+                size = 0
+            if meta_id != self._store_id or size < self._index_offset:
+                # Store was cleared/recreated underneath us: start over
+                self._records, self._ts_keys, self._index_offset = [], [], 0
+                self._store_id = meta_id
+            if size == self._index_offset:
+                return
+            with open(self.index_path, "rb") as f:
+                f.seek(self._index_offset)
+                for raw in f:
+                    if not raw.endswith(b"\n"):
+                        break  # half-written line; retry on next refresh
+                    self._index_offset += len(raw)
+                    try:
+                        rec = json.loads(raw)
+                    except ValueError:
+                        continue
+                    self._records.append(rec)
+                    self._ts_keys.append(rec.get("ts") or "")
+
+    def _current_segment(self) -> int:
+        return self._records[-1]["seg"] if self._records else 1
+
+    # ── writing ─────────────────────────────────────────────────────────────
+    def append_many(self, entries: Iterable[Dict]) -> List[int]:
+        """Append entries (timestamped if missing); returns their sequence numbers."""
+        entries = list(entries)
+        if not entries:
+            return []
+        with self._lock, self._file_lock():
+            return self._append_locked(entries)
+
+    def _append_locked(self, entries: List[Dict]) -> List[int]:
+        """Caller holds both locks."""
+        seqs: List[int] = []
+        if not entries:
+            return seqs
+        self.refresh()
+        seg = self._current_segment()
+        seg_path = self._segment_path(seg)
+        seg_size = os.path.getsize(seg_path) if os.path.exists(seg_path) else 0
+        next_seq = (self._records[-1]["seq"] + 1) if self._records else 1
+        index_lines: List[str] = []
+        seg_f = open(seg_path, "ab")
+        try:
+            for entry in entries:
+                entry = dict(entry)
+                entry.pop("_seq", None)
+                entry.setdefault("timestamp", _now())
+                line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                if seg_size and seg_size + len(line) > self.max_segment_bytes:
+                    seg_f.close()
+                    seg += 1
+                    seg_path = self._segment_path(seg)
+                    seg_f = open(seg_path, "ab")
+                    seg_size = 0
+                seg_f.write(line)
+                index_lines.append(json.dumps({
+                    "seq": next_seq, "seg": seg, "off": seg_size, "len": len(line),
+                    "name": entry.get("name", ""), "ts": entry.get("timestamp", ""),
+                }, ensure_ascii=False) + "\n")
+                seqs.append(next_seq)
+                seg_size += len(line)
+                next_seq += 1
+            seg_f.flush()
+            os.fsync(seg_f.fileno())
+        finally:
+            seg_f.close()
+        # Index lines go last: an entry is only visible once fully written
+        with open(self.index_path, "a", encoding="utf-8") as idx_f:
+            idx_f.writelines(index_lines)
+        self.refresh()
+        return seqs
+
+    def append(self, entry: Dict) -> int:
+        return self.append_many([entry])[0]
+
+    def clear(self) -> None:
+        """Drop all entries and rotate store_id (stale high-water marks reset)."""
+        with self._lock, self._file_lock():
+            for name in os.listdir(self.root):
+                if name.startswith("segment-") or name == "index.jsonl":
+                    os.remove(os.path.join(self.root, name))
+            meta = self._read_meta()
+            meta.update({"store_id": uuid.uuid4().hex, "created": _now()})
+            self._write_meta(meta)
+            self.refresh()
+
+    # ── reading ─────────────────────────────────────────────────────────────
+    def _load(self, recs: List[Dict]) -> List[Dict]:
+        out: List[Dict] = []
+        handles: Dict[int, object] = {}
+        try:
+            for rec in recs:
+                f = handles.get(rec["seg"])
+                if f is None:
+                    f = handles[rec["seg"]] = open(self._segment_path(rec["seg"]), "rb")
+                f.seek(rec["off"])
+                entry = json.loads(f.read(rec["len"]))
+                entry["_seq"] = rec["seq"]
+                out.append(entry)
+        finally:
+            for f in handles.values():
+                f.close()
+        return out
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._records)
+
+    @property
+    def last_seq(self) -> int:
+        self.refresh()
+        return self._records[-1]["seq"] if self._records else 0
+
+    def last(self, n: int) -> List[Dict]:
+        self.refresh()
+        return self._load(self._records[-n:]) if n > 0 else []
+
+    def by_name(self, name: str) -> List[Dict]:
+        self.refresh()
+        return self._load([r for r in self._records if r.get("name") == name])
+
+    def since(self, timestamp: str) -> List[Dict]:
+        """Entries with timestamp >= the given "%Y-%m-%d %H:%M:%S" string."""
+        self.refresh()
+        return self._load(self._records[bisect.bisect_left(self._ts_keys, timestamp):])
+
+    def since_seq(self, seq: int) -> List[Dict]:
+        """Entries with sequence number > seq (seqs are dense, starting at 1)."""
+        self.refresh()
+        return self._load(self._records[max(0, seq):])
+
+    def iter_all(self, batch: int = 500) -> Iterator[Dict]:
+        self.refresh()
+        recs = list(self._records)
+        for i in range(0, len(recs), batch):
+            yield from self._load(recs[i:i + batch])
+
+    # ── migration ───────────────────────────────────────────────────────────
+    def migrate_legacy(self, legacy_path: str) -> int:
+        """
+        One-time import of an old whole-file parser_feedback.json array.
+        Recorded in meta.json so it never runs twice; the legacy file is left
+        untouched. Returns the number of entries imported.
+        """
+        with self._lock, self._file_lock():
+            meta = self._read_meta()
+            if meta.get("migrated_from") or not os.path.exists(legacy_path):
+                return 0
+            try:
+                with open(legacy_path, "r", encoding="utf-8") as f:
+                    legacy = json.load(f)
+            except Exception:
+                legacy = []
+            entries = [e for e in legacy if isinstance(e, dict)] if isinstance(legacy, list) else []
+            for e in entries:
+                e.setdefault("timestamp", "")
+            self._append_locked(entries)
+            meta = self._read_meta()
+            meta["migrated_from"] = os.path.abspath(legacy_path)
+            self._write_meta(meta)
+            return len(entries)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Incremental aggregation (persisted inside parser_memory.json)
+# ──────────────────────────────────────────────────────────────────────────────
+def fold_feedback_counters(memory: Dict, store: FeedbackStore, consumer: str = "default") -> List[Dict]:
+    """
+    Fold entries appended since memory["feedback_counters"]["high_water"] into
+    the persisted counters, and return the entries `consumer` hasn't seen yet:
+
+        "feedback_counters": {
+            "store_id": "...", "high_water": 312,
+            "consumers": {"parser_llm": 312, "parser_basic": 290},
+            "fields":  {"Oxidase": 7, ...},
+            "triples": {"Oxidase": {"Positive": {"": 5, "Negative": 2}}, ...}
+        }
+
+    The counters are shared (each entry is counted once, by whichever pass
+    folds it first); every consumer keeps its own mark, so parser_llm and
+    parser_basic both get the new entries for their per-run logic whatever
+    order they run in. Counters and marks restart from zero when the store
+    was cleared (store_id changed). Cost is proportional to the new entries.
+    """
+    counters = memory.get("feedback_counters") or {}
+    store_id = store.store_id
+    if counters.get("store_id") != store_id:
+        counters = {"store_id": store_id, "high_water": 0, "consumers": {}, "fields": {}, "triples": {}}
+
+    high_water = int(counters.get("high_water", 0))
+    # Memory written before per-consumer marks: everything folded counts as seen
+    unseen = high_water if "consumers" not in counters else 0
+    consumers = counters.setdefault("consumers", {})
+    mark = min(int(consumers.get(consumer, unseen)), high_water)
+    new_entries = store.since_seq(mark)
+    fields, triples = counters["fields"], counters["triples"]
+    for entry in new_entries:
+        seq = entry.get("_seq", 0)
+        if seq > high_water:
+            for err in entry.get("errors", []):
+                field = err.get("field")
+                if not field:
+                    continue
+                exp, got = str(err.get("expected") or ""), str(err.get("got") or "")
+                fields[field] = fields.get(field, 0) + 1
+                by_exp = triples.setdefault(field, {}).setdefault(exp, {})
+                by_exp[got] = by_exp.get(got, 0) + 1
+            counters["high_water"] = max(counters["high_water"], seq)
+        mark = max(mark, seq)
+    consumers[consumer] = mark
+
+    memory["feedback_counters"] = counters
+    return new_entries
+
+
+_STORES: Dict[str, FeedbackStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_feedback_store(root: str, legacy_path: Optional[str] = None) -> FeedbackStore:
+    """Process-wide store for a directory; migrates legacy_path on first open."""
+    key = os.path.abspath(root)
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = FeedbackStore(key)
+            if legacy_path:
+                store.migrate_legacy(legacy_path)
+        return store
@@ -0,0 +1,337 @@
+# git_sync.py — debounced background git sync for learned state
+# ──────────────────────────────────────────────────────────────────────────────
+# Replaces the per-rerun auto_git_commit() in app.py / app_chat.py and the
+# os.system() calls in parser_llm.auto_commit_changes().
+#
+#   • notify() is all request threads ever call: it just flags "maybe dirty"
+#   • One daemon worker waits until notifications go quiet for `debounce`
+#     seconds (or `max_wait` since the first pending one), then
+#   • hashes (path, mtime, size) of the tracked files and skips git entirely
+#     if nothing changed since the last sync, otherwise
+#   • git add → commit (one commit per batch) → push, all on the worker
+#   • pending changes are flushed at interpreter exit (atexit), so CLI runs
+#     (parser_llm.py --test, gold_test_runner.py) don't lose them to the
+#     daemon thread dying before the debounce fires
+#
+# Env:
+#   • GH_TOKEN / GITHUB_TOKEN + GITHUB_REPO ← push to github.com/<repo>
+#   • GIT_SYNC_REMOTE                       ← explicit remote URL/path instead
+#   • GIT_BRANCH                            ← default "main"
+#   • GIT_USER_NAME / GIT_USER_EMAIL        ← commit identity (per command)
+#   • BACTAI_GIT_SYNC_DEBOUNCE              ← seconds, default 30
+#
+# CLI:
+#   python git_sync.py --selftest   ← exercises the worker against a local
+#                                     bare repo in a temp dir
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import atexit
+import hashlib
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+# Learned state only; code is never committed from a running app
+DEFAULT_PATHS = [
+    "parser_memory.json",
+    os.path.join("data", "feedback"),
+    os.path.join("data", "learned_patterns.json"),
+]
+DEFAULT_DEBOUNCE = float(os.getenv("BACTAI_GIT_SYNC_DEBOUNCE", "30"))
+
+
+def remote_from_env() -> Optional[str]:
+    explicit = os.getenv("GIT_SYNC_REMOTE", "").strip()
+    if explicit:
+        return explicit
+    token = os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN")
+    repo = os.getenv("GITHUB_REPO")
+    if token and repo:
+        return f"https://{token}@github.com/{repo}.git"
+    return None
+
+
+class GitSyncWorker:
+    """Batches learned-state changes into one commit + push, off-thread."""
+
+    def __init__(
+        self,
+        repo_dir: str = ".",
+        paths: Sequence[str] = DEFAULT_PATHS,
+        remote: Optional[str] = None,
+        branch: str = "main",
+        debounce: float = DEFAULT_DEBOUNCE,
+        max_wait: Optional[float] = None,
+        user_name: str = "BactAI-D AutoLearner",
+        user_email: str = "bot@bactaid.local",
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.repo_dir = os.path.abspath(repo_dir)
+        self.paths = list(paths)
+        self.remote = remote
+        self.branch = branch
+        self.debounce = debounce
+        self.max_wait = max_wait if max_wait is not None else debounce * 5
+        self.user_name = user_name
+        self.user_email = user_email
+
+        self._cond = threading.Condition()
+        self._first_pending: Optional[float] = None
+        self._last_notify = 0.0
+        self._syncing = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._synced_hash: Optional[str] = None
+        self._exit_hook = False
+        self.status: Dict[str, object] = {
+            "state": "idle", "notifications": 0, "commits": 0, "pushes": 0,
+            "skipped_unchanged": 0, "last_sync": None, "last_error": None,
+        }
+
+    # ── request-thread API ──────────────────────────────────────────────────
+    def notify(self, reason: str = "") -> None:
+        """Cheap: mark state possibly dirty and wake the worker."""
+        if not self.enabled:
+            return
+        with self._cond:
+            now = time.time()
+            if self._first_pending is None:
+                self._first_pending = now
+            self._last_notify = now
+            self.status["notifications"] += 1
+            if reason:
+                self.status["last_reason"] = reason
+            if not self._exit_hook:
+                atexit.register(self._flush_at_exit)
+                self._exit_hook = True
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = 60.0) -> bool:
+        """Sync pending changes now (skip the debounce); True once idle."""
+        with self._cond:
+            if self._first_pending is None:
+                self._first_pending = self._last_notify = time.time()
+            self._first_pending = -float("inf")  # due immediately
+            self._ensure_thread()
+            self._cond.notify_all()
+            return self._cond.wait_for(
+                lambda: self._first_pending is None and not self._syncing, timeout=timeout
+            )
+
+    def _flush_at_exit(self, timeout: float = 60.0) -> None:
+        """atexit hook: the daemon worker dies with the process, so sync what is pending."""
+        if self._stopped or (self._first_pending is None and not self._syncing):
+            return
+        print("⏳ Git sync: flushing pending changes before exit…")
+        if not self.flush(timeout=timeout):
+            print(f"⚠️ Git sync: still busy after {timeout:.0f}s, exiting anyway")
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def status_line(self) -> str:
+        s = self.status
+        if not self.enabled:
+            return "ℹ️ Git sync: off (no GH_TOKEN/GITHUB_REPO)"
+        if s["last_error"]:
+            return f"⚠️ Git sync: {s['last_error']}"
+        if self._first_pending is not None or self._syncing:
+            return "⏳ Git sync: changes pending"
+        if s["last_sync"]:
+            return f"✅ Git sync: {s['commits']} commit(s), last {s['last_sync']}"
+        return "ℹ️ Git sync: nothing to sync yet"
+
+    # ── worker ──────────────────────────────────────────────────────────────
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="git-sync", daemon=True)
+            self._thread.start()
+
+    def _due_in(self) -> float:
+        quiet = self._last_notify + self.debounce
+        capped = self._first_pending + self.max_wait
+        return min(quiet, capped) - time.time()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (self._first_pending is None or self._due_in() > 0):
+                    self._cond.wait(None if self._first_pending is None else self._due_in())
+                if self._stopped:
+                    return
+                self._first_pending = None
+                self._syncing = True
+            try:
+                self._sync_once()
+            finally:
+                with self._cond:
+                    self._syncing = False
+                    self._cond.notify_all()
+
+    def fingerprint(self) -> str:
+        """Hash of (path, mtime, size) for every tracked file (dotfiles skipped)."""
+        h = hashlib.sha1()
+        for rel in self.paths:
+            full = os.path.join(self.repo_dir, rel)
+            files: List[str] = []
+            if os.path.isdir(full):
+                for root, dirs, names in os.walk(full):
+                    dirs[:] = [d for d in dirs if not d.startswith(".")]
+                    files.extend(os.path.join(root, n) for n in names if not n.startswith("."))
+            elif os.path.exists(full):
+                files.append(full)
+            for fp in sorted(files):
+                st = os.stat(fp)
+                h.update(f"{os.path.relpath(fp, self.repo_dir)}\0{st.st_mtime_ns}\0{st.st_size}\n".encode())
+        return h.hexdigest()
+
+    def _git(self, *args: str, check: bool = True) -> subprocess.CompletedProcess:
+        cmd = ["git", "-c", f"user.name={self.user_name}", "-c", f"user.email={self.user_email}", *args]
+        return subprocess.run(cmd, cwd=self.repo_dir, capture_output=True, text=True, check=check)
+
+    def _sync_once(self) -> None:
+        self.status["state"] = "syncing"
+        try:
+            digest = self.fingerprint()
+            if digest == self._synced_hash:
+                self.status["skipped_unchanged"] += 1
+                return
+            if not os.path.isdir(os.path.join(self.repo_dir, ".git")):
+                raise RuntimeError("no git repo (startup git init not done yet?)")
+            present = [p for p in self.paths if os.path.exists(os.path.join(self.repo_dir, p))]
+            if present:
+                self._git("add", "--", *present)
+            if self._git("diff", "--cached", "--quiet", check=False).returncode != 0:
+                msg = f"🤖 Auto-learned update — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                self._git("commit", "-m", msg)
+                self.status["commits"] += 1
+            if self.remote:
+                self._git("push", self.remote, f"HEAD:{self.branch}")
+                self.status["pushes"] += 1
+            self._synced_hash = digest
+            self.status["last_sync"] = datetime.now().strftime("%H:%M:%S")
+            self.status["last_error"] = None
+        except subprocess.CalledProcessError as e:
+            err = (e.stderr or "").strip().splitlines()
+            self.status["last_error"] = f"git failed: {err[-1] if err else e.returncode}"
+            print(f"⚠️ {self.status['last_error']}")
+        except Exception as e:
+            self.status["last_error"] = str(e)
+            print(f"⚠️ Git sync failed: {e}")
+        finally:
+            self.status["state"] = "idle"
+
+
+_WORKER: Optional[GitSyncWorker] = None
+_WORKER_LOCK = threading.Lock()
+
+
+def get_git_sync() -> GitSyncWorker:
+    """Process-wide worker configured from env (one per Streamlit process)."""
+    global _WORKER
+    with _WORKER_LOCK:
+        if _WORKER is None:
+            remote = remote_from_env()
+            _WORKER = GitSyncWorker(
+                repo_dir=os.getcwd(),
+                remote=remote,
+                enabled=remote is not None,
+                branch=os.getenv("GIT_BRANCH", "main"),
+                user_name=os.getenv("GIT_USER_NAME", os.getenv("GITHUB_NAME", "BactAI-D AutoLearner")),
+                user_email=os.getenv("GIT_USER_EMAIL", os.getenv("GITHUB_EMAIL", "bot@bactaid.local")),
+            )
+        return _WORKER
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Self-test against a throwaway bare repo
+# ──────────────────────────────────────────────────────────────────────────────
+def _selftest() -> int:
+    def git(cwd: str, *args: str) -> str:
+        return subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+
+    def remote_commits(bare: str) -> int:
+        out = subprocess.run(["git", "rev-list", "--count", "main"], cwd=bare, capture_output=True, text=True)
+        return int(out.stdout.strip() or 0) if out.returncode == 0 else 0
+
+    ok = True
+
+    def check(label: str, cond: bool) -> None:
+        nonlocal ok
+        ok = ok and cond
+        print(f"{'✅' if cond else '❌'} {label}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bare, work = os.path.join(tmp, "remote.git"), os.path.join(tmp, "work")
+        git(tmp, "init", "--bare", "-q", bare)
+        os.makedirs(os.path.join(work, "data", "feedback"))
+        git(work, "init", "-q")
+        worker = GitSyncWorker(repo_dir=work, remote=bare, branch="main", debounce=0.3, max_wait=2.0)
+
+        # Burst of changes → one commit
+        for i in range(5):
+            with open(os.path.join(work, "parser_memory.json"), "w") as f:
+                f.write(f'{{"n": {i}}}')
+            with open(os.path.join(work, "data", "feedback", "segment-000001.jsonl"), "a") as f:
+                f.write(f'{{"i": {i}}}\n')
+            t0 = time.time()
+            worker.notify("burst")
+            if i == 0:
+                check("notify() returns immediately", time.time() - t0 < 0.05)
+            time.sleep(0.05)
+        time.sleep(0.8)
+        check("burst of 5 notifications → 1 commit pushed", remote_commits(bare) == 1)
+
+        # Nothing changed → no git work at all
+        worker.notify("no-op")
+        time.sleep(0.6)
+        check("unchanged state skipped by hash", worker.status["skipped_unchanged"] >= 1 and remote_commits(bare) == 1)
+
+        # Ignored lock file does not count as a change
+        open(os.path.join(work, "data", "feedback", ".lock"), "w").close()
+        worker.notify("lock")
+        time.sleep(0.6)
+        check("dotfiles ignored", remote_commits(bare) == 1)
+
+        # flush() syncs without waiting for the debounce
+        with open(os.path.join(work, "data", "learned_patterns.json"), "w") as f:
+            f.write('{"version": 1, "patterns": []}')
+        worker.debounce = 60
+        worker.notify("flush")
+        check("flush() completes", worker.flush(timeout=10))
+        check("second batch pushed", remote_commits(bare) == 2)
+        check("no errors", worker.status["last_error"] is None)
+
+        # A CLI process exiting inside the debounce window still syncs
+        script = os.path.join(tmp, "exit_flush.py")
+        with open(script, "w") as f:
+            f.write(
+                "import sys\n"
+                f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r})\n"
+                "from git_sync import GitSyncWorker\n"
+                f"open({os.path.join(work, 'parser_memory.json')!r}, 'w').write('{{\"n\": 99}}')\n"
+                f"GitSyncWorker(repo_dir={work!r}, remote={bare!r}, debounce=60).notify('cli')\n"
+            )
+        subprocess.run([sys.executable, script], capture_output=True, timeout=60)
+        check("pending change flushed at exit", remote_commits(bare) == 3)
+        worker.stop()
+        print(worker.status_line())
+    print("git_sync selftest:", "PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    if "--selftest" in sys.argv:
+        sys.exit(_selftest())
+    print("git_sync.py — use --selftest to exercise the worker against a local bare repo.")
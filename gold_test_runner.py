@@ -5,17 +5,63 @@ gold_tests_runner.py — robust runner for BactAI-D parser gold tests + self-lea
 - Ensures imports resolve by pinning repo root to sys.path
 - Uses absolute paths based on this file’s directory
 - Runs LLM-first parser tests with Basic (regex) fallback
-- Writes feedback + memory to repo root
-- Applies auto-patches to parser_llm.py and parser_basic.py
+- Incremental: unchanged cases reuse their cached outcome (--full re-runs all)
+- Writes feedback to the parser's own log (parser.feedback_log()), memory to its base dir
+- Records learned regex in data/learned_patterns.json (shared by both parsers)
 - Optional Git push if GH_TOKEN / GITHUB_REPO provided
+
+Incremental runs
+----------------
+Each case is fingerprinted from its input text, expected dict, the DB field
+list, the model names + prompt version, a hash of the parser_llm.py and
+parser_basic.py sources, the active learned-rule set (PatternStore.rules_hash:
+count-only refreshes from the learners don't change it), and the case's
+own regex-stage output (Parser.regex_stage). Any parser code edit or new
+learned pattern therefore re-runs the suite; the per-case regex output keeps
+cases apart within one context. Outcomes from a run where the LLM
+call failed are never cached. Cache lives in data/gold_cache.json.
+
+Parallel runs
+-------------
+The regex stage (needed for every fingerprint, and the whole parse when the
+coverage gate skips the LLM) is CPU-bound and runs on a process pool
+(BACTAI_GOLD_PROCESSES, default CPU count; small suites stay in-process).
+Cases that need the LLM are I/O-bound and run on a thread pool capped at
+BACTAI_GOLD_LLM_CONCURRENCY (default 4) concurrent calls; by default each
+thread sends its share through Parser.parse_batch, so several cases go in
+one request (per-case LLM time is then the batch time split evenly). The
+parse reuses the regex stage already run for the fingerprint instead of
+running it again. Results, per-case
+timing and printed output keep gold_tests.json order regardless of which
+case finishes first; feedback is written once at the end.
+CLI: --llm-concurrency=N, --processes=N (1 = in-process regex stage),
+     --no-batch (one LLM request per case), --diagnostics (path/sys.path dump).
+
+Start-up
+--------
+CLI and batch runs import no Streamlit, pandas, fpdf or ollama: the DB field
+list is read from the xlsx header with the stdlib (pandas only as fallback)
+and the Ollama client is created on the first LLM call.
+`--import-budget[=SECONDS]` imports the parser modules in a fresh interpreter
+and exits 1 if that takes longer than the budget (default 0.5s,
+BACTAI_IMPORT_BUDGET) or loads any of HEAVY_MODULES.
+
+Library use (app buttons, parser_llm --test):
+    from gold_test_runner import run_gold_suite
+    report = run_gold_suite(tests, db_fields, full=False)
+    report = run_gold_suite(tests, db_fields, parser=my_parser)  ← a non-default Parser
 """
 
 import os
 import sys
 import json
+import time
+import hashlib
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 import importlib
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -27,11 +73,41 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 GOLD_TESTS_PATH = REPO_ROOT / "gold_tests.json"
-FEEDBACK_PATH   = REPO_ROOT / "parser_feedback.json"
+FEEDBACK_PATH   = REPO_ROOT / "parser_feedback.json"   # legacy, migrated once
+FEEDBACK_DIR    = REPO_ROOT / "data" / "feedback"
 MEMORY_PATH     = REPO_ROOT / "parser_memory.json"
+GOLD_CACHE_PATH = REPO_ROOT / "data" / "gold_cache.json"
 PARSER_LLM_PATH = REPO_ROOT / "parser_llm.py"
 PARSER_BASIC_PATH = REPO_ROOT / "parser_basic.py"
 
+# Bump to invalidate every cached outcome (e.g. comparison rules change)
+CACHE_FORMAT = 1
+# Outcome sets kept per run context (db_fields/models/prompt); oldest dropped
+CACHE_CONTEXTS = 4
+
+# Concurrency caps (CLI: --llm-concurrency=N, --processes=N)
+LLM_CONCURRENCY = int(os.getenv("BACTAI_GOLD_LLM_CONCURRENCY", "4"))
+REGEX_PROCESSES = int(os.getenv("BACTAI_GOLD_PROCESSES", str(os.cpu_count() or 1)))
+# Below this many cases, process start-up costs more than it saves
+PROCESS_POOL_MIN_CASES = 64
+
+# Import-time budget for the parser modules (--import-budget), and modules
+# they must leave to the features that need them
+IMPORT_BUDGET_S = float(os.getenv("BACTAI_IMPORT_BUDGET", "0.5"))
+HEAVY_MODULES = ("streamlit", "pandas", "numpy", "openpyxl", "fpdf", "ollama", "httpx")
+
+STATIC_DB_FIELDS = [
+    "Gram Stain","Shape","Motility","Oxidase","Catalase","Indole","Urease",
+    "Citrate","Methyl Red","VP","DNase","Gelatin Hydrolysis","Esculin Hydrolysis",
+    "Nitrate Reduction","H2S","Oxygen Requirement","Growth Temperature",
+    "Media Grown On","Colony Morphology","Haemolysis","Haemolysis Type","Coagulase",
+    "Lysine Decarboxylase","Ornithine Decarboxylase","Arginine dihydrolase","ONPG",
+    "NaCl Tolerant (>=6%)","Lipase Test","Lactose Fermentation","Glucose Fermentation",
+    "Sucrose Fermentation","Maltose Fermentation","Mannitol Fermentation","Xylose Fermentation",
+    "Arabinose Fermentation","Rhamnose Fermentation","Raffinose Fermentation",
+    "Inositol Fermentation","Trehalose Fermentation"
+]
+
 def log_env():
     print("── gold_tests_runner diagnostics ──")
     print(f"cwd: {Path.cwd()}")
@@ -43,18 +119,16 @@ def log_env():
     print("repo root listing:", [p.name for p in REPO_ROOT.iterdir()])
     print("───────────────────────────────────")
 
-log_env()
 importlib.invalidate_caches()
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Safe imports with diagnostics
 # ──────────────────────────────────────────────────────────────────────────────
 try:
+    import parser_llm
     from parser_llm import (
-        parse_input_free_text as parse_llm_input_free_text,
         enable_self_learning_autopatch as llm_autopatch,
     )
-    print("✅ Imported parser_llm successfully.")
 except Exception as e:
     print(f"❌ Failed to import parser_llm: {e!r}")
     print("Tip: ensure parser_llm.py is at repo root and not a folder named 'parser_llm/'.")
@@ -65,124 +139,368 @@ try:
         parse_input_free_text as parse_basic_input_free_text,
         enable_self_learning_autopatch as basic_autopatch,
     )
-    print("✅ Imported parser_basic successfully.")
 except Exception as e:
     print(f"❌ Failed to import parser_basic: {e!r}")
     raise
 
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Load DB schema dynamically (optional but recommended)
 # ──────────────────────────────────────────────────────────────────────────────
-# If you prefer a static schema, you can hardcode your list instead.
-try:
-    import pandas as pd
-    # Prefer data/bacteria_db.xlsx, fallback bacteria_db.xlsx
-    db_path = REPO_ROOT / "data" / "bacteria_db.xlsx"
-    if not db_path.exists():
-        alt = REPO_ROOT / "bacteria_db.xlsx"
-        db_path = alt if alt.exists() else db_path
-    if db_path.exists():
-        df = pd.read_excel(db_path)
-        df.columns = [str(c).strip() for c in df.columns]
-        db_fields = [c for c in df.columns if c.lower() != "genus"]
-        print(f"📚 Loaded DB fields ({len(db_fields)}): {', '.join(db_fields)}")
-    else:
+_XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+
+def read_xlsx_header(path: Path) -> List[str]:
+    """
+    First row of the first worksheet, stdlib only. Streams the sheet and stops
+    after row 1 (the DB sheet declares ~1M rows, which pandas walks in full).
+    """
+    import zipfile
+    import xml.etree.ElementTree as ET
+    with zipfile.ZipFile(path) as z:
+        shared: List[str] = []
+        if "xl/sharedStrings.xml" in z.namelist():
+            with z.open("xl/sharedStrings.xml") as f:
+                for _, el in ET.iterparse(f):
+                    if el.tag == _XLSX_NS + "si":
+                        shared.append("".join(t.text or "" for t in el.iter(_XLSX_NS + "t")))
+                        el.clear()
+        with z.open("xl/worksheets/sheet1.xml") as f:
+            for _, el in ET.iterparse(f):
+                if el.tag != _XLSX_NS + "row":
+                    continue
+                header = []
+                for c in el.iter(_XLSX_NS + "c"):
+                    v = c.find(_XLSX_NS + "v")
+                    if c.get("t") == "s" and v is not None:
+                        header.append(shared[int(v.text)])
+                    elif c.get("t") == "inlineStr":
+                        header.append("".join(t.text or "" for t in c.iter(_XLSX_NS + "t")))
+                    else:
+                        header.append(v.text if v is not None and v.text else "")
+                return header
+    return []
+
+def load_db_fields() -> List[str]:
+    """DB columns (minus Genus) from bacteria_db.xlsx, else a static schema."""
+    try:
+        # Prefer data/bacteria_db.xlsx, fallback bacteria_db.xlsx
+        db_path = REPO_ROOT / "data" / "bacteria_db.xlsx"
+        if not db_path.exists():
+            alt = REPO_ROOT / "bacteria_db.xlsx"
+            db_path = alt if alt.exists() else db_path
+        if db_path.exists():
+            try:
+                columns = read_xlsx_header(db_path)
+            except Exception as e:
+                print(f"⚠️ Could not read xlsx header directly ({e!r}); using pandas.")
+                columns = []
+            if not columns:
+                import pandas as pd
+                columns = list(pd.read_excel(db_path, nrows=0).columns)
+            columns = [str(c).strip() for c in columns if str(c).strip()]
+            db_fields = [c for c in columns if c.lower() != "genus"]
+            print(f"📚 Loaded DB fields ({len(db_fields)}): {', '.join(db_fields)}")
+            return db_fields
         print("⚠️ No database found, falling back to conservative static schema.")
-        db_fields = [
-            "Gram Stain","Shape","Motility","Oxidase","Catalase","Indole","Urease",
-            "Citrate","Methyl Red","VP","DNase","Gelatin Hydrolysis","Esculin Hydrolysis",
-            "Nitrate Reduction","H2S","Oxygen Requirement","Growth Temperature",
-            "Media Grown On","Colony Morphology","Haemolysis","Haemolysis Type","Coagulase",
-            "Lysine Decarboxylase","Ornithine Decarboxylase","Arginine dihydrolase","ONPG",
-            "NaCl Tolerant (>=6%)","Lipase Test","Lactose Fermentation","Glucose Fermentation",
-            "Sucrose Fermentation","Maltose Fermentation","Mannitol Fermentation","Xylose Fermentation",
-            "Arabinose Fermentation","Rhamnose Fermentation","Raffinose Fermentation",
-            "Inositol Fermentation","Trehalose Fermentation"
-        ]
-except Exception as e:
-    print(f"⚠️ Could not load DB schema dynamically: {e!r}")
-    db_fields = [
-        "Gram Stain","Shape","Motility","Oxidase","Catalase","Indole","Urease",
-        "Citrate","Methyl Red","VP","DNase","Gelatin Hydrolysis","Esculin Hydrolysis",
-        "Nitrate Reduction","H2S","Oxygen Requirement","Growth Temperature",
-        "Media Grown On","Colony Morphology","Haemolysis","Haemolysis Type","Coagulase",
-        "Lysine Decarboxylase","Ornithine Decarboxylase","Arginine dihydrolase","ONPG",
-        "NaCl Tolerant (>=6%)","Lipase Test","Lactose Fermentation","Glucose Fermentation",
-        "Sucrose Fermentation","Maltose Fermentation","Mannitol Fermentation","Xylose Fermentation",
-        "Arabinose Fermentation","Rhamnose Fermentation","Raffinose Fermentation",
-        "Inositol Fermentation","Trehalose Fermentation"
-    ]
-
-# ──────────────────────────────────────────────────────────────────────────────
-# Load tests
-# ──────────────────────────────────────────────────────────────────────────────
-if not GOLD_TESTS_PATH.exists():
-    print("⚠️ gold_tests.json not found in repo root.")
-    sys.exit(1)
-
-with open(GOLD_TESTS_PATH, "r", encoding="utf-8") as f:
-    tests = json.load(f)
-
-total, passed = 0, 0
-feedback = []
-
-print(f"🧪 Running {len(tests)} gold tests...")
-for case in tests:
-    total += 1
-    name = case.get("name", f"Case_{total}")
-    text = case.get("input", "")
-    expected = case.get("expected", {})
-
-    print(f"\n— {name}")
-    # LLM-first with regex fallback
+    except Exception as e:
+        print(f"⚠️ Could not load DB schema dynamically: {e!r}")
+    return list(STATIC_DB_FIELDS)
+
+def load_tests(path: Path = GOLD_TESTS_PATH) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Fingerprints + outcome cache
+# ──────────────────────────────────────────────────────────────────────────────
+def _sha1(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def parser_code_hash(paths: Tuple[Path, ...] = (PARSER_LLM_PATH, PARSER_BASIC_PATH)) -> str:
+    """sha1 over the parser sources: any edit (LLM merge rules, fallback) invalidates the cache."""
+    h = hashlib.sha1()
+    for path in paths:
+        try:
+            h.update(path.read_bytes())
+        except OSError:
+            h.update(f"missing:{path.name}".encode("utf-8"))
+    return h.hexdigest()
+
+def run_context(db_fields: List[str], parser: Optional["parser_llm.Parser"] = None) -> Dict[str, object]:
+    """Parts of the fingerprint shared by every case in a run (on `parser`, default: the module's)."""
+    parser = parser or parser_llm.default_parser()
+    return {
+        "format": CACHE_FORMAT,
+        "db_fields": _sha1(sorted(db_fields)),
+        "models": [parser.small_model, parser.large_model],
+        "prompt": parser_llm.PROMPT_VERSION,
+        "skip_coverage": parser.skip_coverage,
+        "code": parser_code_hash(),
+        "patterns": parser.learned_patterns().rules_hash,
+    }
+
+def case_fingerprint(
+    text: str,
+    expected: Dict[str, str],
+    db_fields: List[str],
+    context: Dict[str, object],
+    regex_only: Optional[Dict[str, str]] = None,
+    parser: Optional["parser_llm.Parser"] = None,
+) -> str:
+    """Stable hash of everything that can change this case's outcome."""
+    if regex_only is None:
+        _, _, regex_only = (parser or parser_llm.default_parser()).regex_stage(text, db_fields)
+    return _sha1({"ctx": context, "input": text, "expected": expected, "regex": regex_only})
+
+def _read_cache_file(path: Path) -> Dict[str, Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("contexts", {}) if data.get("format") == CACHE_FORMAT else {}
+    except Exception:
+        return {}
+
+def load_cache(context: Dict[str, object], path: Path = GOLD_CACHE_PATH) -> Dict[str, Dict]:
+    """Cached outcomes (fingerprint → outcome) recorded under this run context."""
+    return _read_cache_file(path).get(_sha1(context), {}).get("cases", {})
+
+def save_cache(context: Dict[str, object], cases: Dict[str, Dict], path: Path = GOLD_CACHE_PATH) -> None:
+    """Replace this context's outcomes; other contexts (e.g. parser_llm --test's field list) are kept."""
+    contexts = _read_cache_file(path)
+    contexts[_sha1(context)] = {"updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "cases": cases}
+    keep = sorted(contexts.items(), key=lambda kv: kv[1]["updated"], reverse=True)[:CACHE_CONTEXTS]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"format": CACHE_FORMAT, "contexts": dict(keep)}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Running
+# ──────────────────────────────────────────────────────────────────────────────
+# Parse callbacks: (text(s), db_fields, staged regex stage(s), parser) → run(s)
+ParseFn = Callable[[str, List[str], Optional[Dict[str, object]], object], Dict[str, object]]
+BatchParseFn = Callable[[List[str], List[str], Optional[List[Dict[str, object]]], object], List[Dict[str, object]]]
+
+# Parsers rebuilt inside pool workers, by (base_dir, skip_coverage)
+_WORKER_PARSERS: Dict[Tuple[str, float], "parser_llm.Parser"] = {}
+
+def _parser_spec(parser: "parser_llm.Parser") -> Tuple[str, float]:
+    """What a spawned worker needs to rebuild `parser`'s regex stage + gate (a Parser doesn't pickle)."""
+    return (parser.base_dir, parser.skip_coverage)
+
+def _spec_parser(spec: Tuple[str, float]) -> "parser_llm.Parser":
+    if spec not in _WORKER_PARSERS:
+        _WORKER_PARSERS[spec] = parser_llm.Parser(spec[0], skip_coverage=spec[1])
+    return _WORKER_PARSERS[spec]
+
+def regex_pass(text: str, db_fields: List[str], parser=None) -> Dict[str, object]:
+    """
+    Regex stage + coverage gate for one case on `parser` (a Parser, or a
+    _parser_spec() in process-pool workers; default: the module's). The
+    result is Parser.stage()'s dict, handed back to the parse as `staged`;
+    when the gate skips the LLM, `regex` is also the case's final parse.
+    """
+    if parser is None:
+        parser = parser_llm.default_parser()
+    elif isinstance(parser, tuple):
+        parser = _spec_parser(parser)
+    t0 = time.perf_counter()
+    staged = parser.stage(text, db_fields)
+    return dict(staged, seconds=time.perf_counter() - t0)
+
+def _regex_pass_all(
+    texts: List[str], db_fields: List[str], processes: int, parser: "parser_llm.Parser"
+) -> Tuple[List[Dict[str, object]], int]:
+    """regex_pass over every case, in order. Returns (results, processes used)."""
+    if processes > 1 and len(texts) >= PROCESS_POOL_MIN_CASES:
+        try:
+            # spawn, not fork: the apps call this from a thread while other
+            # threads may hold pattern/feedback store locks
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            ctx = multiprocessing.get_context("spawn")
+            chunk = max(1, len(texts) // (processes * 4))
+            with ProcessPoolExecutor(max_workers=processes, mp_context=ctx) as pool:
+                spec = [_parser_spec(parser)] * len(texts)
+                return list(pool.map(regex_pass, texts, [db_fields] * len(texts), spec, chunksize=chunk)), processes
+        except Exception as e:
+            print(f"⚠️ Regex process pool unavailable ({e!r}); running regex stage in-process.")
+    return [regex_pass(t, db_fields, parser) for t in texts], 1
+
+def parse_with_fallback(
+    text: str,
+    db_fields: List[str],
+    staged: Optional[Dict[str, object]] = None,
+    parser: Optional["parser_llm.Parser"] = None,
+) -> Dict[str, object]:
+    """LLM-first parse (on `parser`, reusing its `staged` regex stage) with regex fallback; returns parsed + how it was produced."""
+    parser = parser or parser_llm.default_parser()
     try:
-        parsed = parse_llm_input_free_text(text, prior_facts={}, db_fields=db_fields)
-        backend = "LLM"
+        parsed = parser.parse(text, prior_facts={}, db_fields=db_fields, staged=staged)
+        info = parser.last_parse_info()
+        backend = {"skipped": "Regex", "error": "Regex (LLM error)"}.get(info.get("llm"), "LLM")
+        return {"parsed": parsed, "backend": backend, "cacheable": info.get("llm") != "error"}
     except Exception as e:
         print(f"  LLM parse failed ({e!r}); falling back to regex.")
         parsed = parse_basic_input_free_text(text, prior_facts={}, db_fields=db_fields)
-        backend = "Regex"
+        return {"parsed": parsed, "backend": "Regex (fallback)", "cacheable": False}
+
+def parse_batch_with_fallback(
+    texts: List[str],
+    db_fields: List[str],
+    staged: Optional[List[Dict[str, object]]] = None,
+    parser: Optional["parser_llm.Parser"] = None,
+) -> List[Dict[str, object]]:
+    """Batched LLM parse of several cases; per-case fallback if the batch call itself fails."""
+    parser = parser or parser_llm.default_parser()
+    staged = staged or [None] * len(texts)
+    try:
+        parsed = parser.parse_batch(texts, prior_facts={}, db_fields=db_fields, staged=staged)
+    except Exception as e:
+        print(f"  Batch parse failed ({e!r}); parsing cases one by one.")
+        return [parse_with_fallback(t, db_fields, st, parser) for t, st in zip(texts, staged)]
+    runs = []
+    for p, info in zip(parsed, parser.last_batch_info()):
+        backend = {"skipped": "Regex", "error": "Regex (LLM error)"}.get(info.get("llm"), "LLM batch")
+        runs.append({"parsed": p, "backend": backend, "cacheable": info.get("llm") != "error"})
+    return runs
 
+def compare_case(parsed: Dict[str, str], expected: Dict[str, str]) -> List[Dict[str, object]]:
     mismatches = []
     for k, vexp in expected.items():
-        if k not in db_fields:
-            # Ignore expectations for fields not present in schema
-            continue
         vgot = parsed.get(k, "")
         if str(vgot) != str(vexp):
             mismatches.append({"field": k, "got": vgot, "expected": vexp})
+    return mismatches
 
-    if not mismatches:
-        print(f"  ✅ Passed ({backend})")
-        passed += 1
-    else:
-        print(f"  ❌ Failed ({backend})")
-        for m in mismatches:
-            print(f"    - {m['field']}: got {m['got']!r}, expected {m['expected']!r}")
-        feedback.append({"name": name, "text": text, "errors": mismatches})
+def _timed_parse(parse_fn: ParseFn, text: str, db_fields: List[str], staged: Dict[str, object], parser) -> Dict[str, object]:
+    t0 = time.perf_counter()
+    run = parse_fn(text, db_fields, staged, parser)
+    return dict(run, seconds=time.perf_counter() - t0)
 
-# Save feedback for learning (repo root)
-with open(FEEDBACK_PATH, "w", encoding="utf-8") as fb:
-    json.dump(feedback, fb, indent=2, ensure_ascii=False)
+def _timed_batch(batch_fn: BatchParseFn, texts: List[str], db_fields: List[str], staged: List[Dict[str, object]], parser) -> List[Dict[str, object]]:
+    t0 = time.perf_counter()
+    runs = batch_fn(texts, db_fields, staged, parser)
+    share = (time.perf_counter() - t0) / max(1, len(texts))
+    return [dict(run, seconds=share) for run in runs]
 
-print(f"\n🧩 Gold Test Summary: {passed}/{total} passed.")
+def run_gold_suite(
+    tests: List[Dict],
+    db_fields: List[str],
+    full: bool = False,
+    parse_fn: ParseFn = parse_with_fallback,
+    batch_parse_fn: Optional[BatchParseFn] = parse_batch_with_fallback,
+    cache_path: Optional[Path] = GOLD_CACHE_PATH,
+    log_feedback: bool = True,
+    verbose: bool = True,
+    llm_concurrency: Optional[int] = None,
+    processes: Optional[int] = None,
+    record_gate: Optional[Callable[[Dict[str, object]], None]] = None,
+    parser: Optional["parser_llm.Parser"] = None,
+) -> Dict[str, object]:
+    """
+    Run gold cases, reusing cached outcomes for unchanged fingerprints unless
+    full=True. The regex stage runs on a process pool; parse_fn is called (on
+    a thread pool of `llm_concurrency`) only for uncached cases the coverage
+    gate sends to the LLM — gate-skipped cases use their regex result, and
+    their gate decision goes to `record_gate` (default: the parser's stats).
+    With batch_parse_fn (None = per-case), each thread hands its contiguous
+    share of LLM cases to it in one call. Everything runs on `parser`
+    (default: parser_llm's module-level one): regex stage, gate, cache
+    context and the parse, which reuses the regex stage already run here.
+    Failures from freshly-run cases are appended to the feedback log in one
+    batch at the end (cached failures were logged when first seen).
+    """
+    llm_concurrency = max(1, llm_concurrency or LLM_CONCURRENCY)
+    processes = REGEX_PROCESSES if processes is None else processes
+    parser = parser or parser_llm.default_parser()
+    record_gate = record_gate or parser.record_gate
+    t_start = time.time()
 
-# ──────────────────────────────────────────────────────────────────────────────
-# Apply learning + auto-patch (both parsers)
-# ──────────────────────────────────────────────────────────────────────────────
-try:
-    # LLM parser learner
-    llm_autopatch(run_tests=False, db_fields=db_fields)
-    print("✅ Applied LLM parser self-learning/auto-patch.")
-except Exception as e:
-    print(f"⚠️ LLM autopatch failed: {e!r}")
+    context = run_context(db_fields, parser)
+    cache = {} if (full or cache_path is None) else load_cache(context, cache_path)
 
-try:
-    # Regex parser learner
-    basic_autopatch(run_tests=False, db_fields=db_fields)
-    print("✅ Applied regex parser self-learning/auto-patch.")
-except Exception as e:
-    print(f"⚠️ Regex autopatch failed: {e!r}")
+    names = [case.get("name", f"Case_{i}") for i, case in enumerate(tests, 1)]
+    texts = [case.get("input", "") for case in tests]
+    # Ignore expectations for fields not present in schema
+    expecteds = [{k: v for k, v in case.get("expected", {}).items() if k in db_fields} for case in tests]
+
+    # 1) Regex stage for every case (fingerprints need it), CPU-bound → processes
+    regex_runs, processes_used = _regex_pass_all(texts, db_fields, processes, parser)
+    fps = [case_fingerprint(t, e, db_fields, context, r["regex"]) for t, e, r in zip(texts, expecteds, regex_runs)]
+
+    # 2) Uncached cases the gate sends to the LLM, I/O-bound → bounded threads
+    runs: Dict[int, Dict[str, object]] = {}
+    llm_cases: List[int] = []
+    for i, (fp, rr) in enumerate(zip(fps, regex_runs)):
+        if fp in cache:
+            continue
+        if rr["gate"]["skip_llm"]:
+            record_gate(rr["gate"])
+            runs[i] = {"parsed": rr["regex"], "backend": "Regex", "cacheable": True, "seconds": 0.0}
+        else:
+            llm_cases.append(i)
+    if llm_cases:
+        with ThreadPoolExecutor(max_workers=min(llm_concurrency, len(llm_cases)), thread_name_prefix="gold-llm") as pool:
+            if batch_parse_fn is not None and len(llm_cases) > 1:
+                step = -(-len(llm_cases) // min(llm_concurrency, len(llm_cases)))
+                shares = [llm_cases[k:k + step] for k in range(0, len(llm_cases), step)]
+                futures = [(share, pool.submit(_timed_batch, batch_parse_fn, [texts[i] for i in share], db_fields,
+                                               [regex_runs[i] for i in share], parser))
+                           for share in shares]
+                for share, fut in futures:
+                    runs.update(zip(share, fut.result()))
+            else:
+                futures = {i: pool.submit(_timed_parse, parse_fn, texts[i], db_fields, regex_runs[i], parser) for i in llm_cases}
+                for i, fut in futures.items():
+                    runs[i] = fut.result()
+
+    # 3) Assemble in gold_tests.json order
+    new_cache: Dict[str, Dict] = {}
+    results: List[Dict] = []
+    feedback: List[Dict] = []
+    for i, fp in enumerate(fps):
+        regex_seconds = round(regex_runs[i]["seconds"], 4)
+        hit = cache.get(fp)
+        if hit is not None:
+            outcome = dict(hit, cached=True, regex_seconds=regex_seconds, seconds=0.0)
+            new_cache[fp] = hit
+        else:
+            run = runs[i]
+            mismatches = compare_case(run["parsed"], expecteds[i])
+            outcome = {"parsed": run["parsed"], "backend": run["backend"], "mismatches": mismatches,
+                       "cached": False, "regex_seconds": regex_seconds, "seconds": round(run["seconds"], 3)}
+            if mismatches:
+                feedback.append({"name": names[i], "text": texts[i], "errors": mismatches})
+            if run.get("cacheable", True):
+                new_cache[fp] = {k: outcome[k] for k in ("parsed", "backend", "mismatches")}
+
+        outcome.update(name=names[i], expected=expecteds[i], ok=not outcome["mismatches"])
+        results.append(outcome)
+        if verbose:
+            tag = f"{outcome['backend']}, cached" if outcome["cached"] else f"{outcome['backend']}, {outcome['seconds']}s"
+            if outcome["ok"]:
+                print(f"  ✅ {names[i]} ({tag})")
+            else:
+                print(f"  ❌ {names[i]} ({tag})")
+                for m in outcome["mismatches"]:
+                    print(f"    - {m['field']}: got {m['got']!r}, expected {m['expected']!r}")
+
+    if log_feedback and feedback:
+        # Save feedback for learning (one batched append to the feedback log)
+        parser.feedback_log().append_many(feedback)
+    if cache_path is not None:
+        save_cache(context, new_cache, cache_path)  # only current fingerprints survive
+
+    passed = sum(1 for r in results if r["ok"])
+    ran = sum(1 for r in results if not r["cached"])
+    return {
+        "passed": passed, "total": len(results), "ran": ran, "cached": len(results) - ran,
+        "llm_cases": len(llm_cases), "seconds": round(time.time() - t_start, 2),
+        "workers": {"regex_processes": processes_used, "llm_concurrency": llm_concurrency},
+        "results": results, "feedback": feedback,
+    }
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Optional Git auto-commit (same envs as app)
@@ -219,7 +537,8 @@ def try_git_commit():
 
         subprocess.run(["git", "add",
                         "parser_llm.py", "parser_basic.py",
-                        "parser_memory.json", "parser_feedback.json"],
+                        "parser_memory.json", "data/feedback",
+                        "data/learned_patterns.json"],
                        cwd=str(REPO_ROOT), check=False)
 
         msg = f"🤖 Gold tests + auto-learn — {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
@@ -229,4 +548,99 @@ def try_git_commit():
     except Exception as e:
         print(f"⚠️ Git push failed: {e!r}")
 
-try_git_commit()
+# ──────────────────────────────────────────────────────────────────────────────
+# Import-time budget
+# ──────────────────────────────────────────────────────────────────────────────
+def check_import_budget(
+    budget: float = IMPORT_BUDGET_S,
+    modules: Tuple[str, ...] = ("parser_llm", "parser_basic", "gold_test_runner"),
+) -> bool:
+    """
+    Import `modules` in a fresh interpreter and report the time taken, the
+    slowest imports (-X importtime) and any HEAVY_MODULES that came along.
+    True when within budget and nothing heavy was loaded.
+    """
+    code = (
+        "import sys, time; t = time.perf_counter(); import " + ", ".join(modules) + "; "
+        "print(time.perf_counter() - t); print(','.join(sorted(sys.modules)))"
+    )
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=str(REPO_ROOT), capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"❌ Import failed:\n{proc.stderr[-2000:]}")
+        return False
+    seconds_line, loaded_line = proc.stdout.strip().splitlines()[-2:]
+    seconds = float(seconds_line)
+    loaded = set(loaded_line.split(","))
+    heavy = sorted(m for m in HEAVY_MODULES if m in loaded)
+
+    # "import time: self | cumulative | <indent>name" → top-level entries by cumulative µs
+    top = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # skip interpreter start-up (site, encodings, _frozen_*)
+        if len(name) - len(name.lstrip()) == 1 and name.strip() not in ("site", "encodings") and not name.strip().startswith("_"):
+            top.append((int(parts[1]), name.strip()))
+    slowest = ", ".join(f"{n} {us / 1000:.1f}ms" for us, n in sorted(top, reverse=True)[:5])
+
+    ok = seconds <= budget and not heavy
+    print(f"{'✅' if ok else '❌'} import {', '.join(modules)}: {seconds * 1000:.0f}ms (budget {budget * 1000:.0f}ms)")
+    print(f"   slowest: {slowest}")
+    if heavy:
+        print(f"   heavy modules loaded at import: {', '.join(heavy)}")
+    return ok
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI
+# ──────────────────────────────────────────────────────────────────────────────
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    full = "--full" in argv
+    opts = dict(a[2:].split("=", 1) for a in argv if a.startswith("--") and "=" in a)
+    if "--import-budget" in argv or "import-budget" in opts:
+        return 0 if check_import_budget(float(opts.get("import-budget", IMPORT_BUDGET_S))) else 1
+    if "--diagnostics" in argv:
+        log_env()
+
+    if not GOLD_TESTS_PATH.exists():
+        print("⚠️ gold_tests.json not found in repo root.")
+        return 1
+    tests = load_tests()
+    db_fields = load_db_fields()
+
+    print(f"🧪 Running {len(tests)} gold tests{' (full)' if full else ' (incremental)'}...")
+    report = run_gold_suite(
+        tests, db_fields, full=full,
+        llm_concurrency=int(opts.get("llm-concurrency", LLM_CONCURRENCY)),
+        processes=int(opts.get("processes", REGEX_PROCESSES)),
+        batch_parse_fn=None if "--no-batch" in argv else parse_batch_with_fallback,
+    )
+    w = report["workers"]
+    print(f"\n🧩 Gold Test Summary: {report['passed']}/{report['total']} passed "
+          f"({report['ran']} run, {report['cached']} unchanged/cached, {report['seconds']}s; "
+          f"{report['llm_cases']} LLM cases on {w['llm_concurrency']} threads, "
+          f"regex on {w['regex_processes']} process(es)).")
+
+    # Apply learning + auto-patch (both parsers)
+    try:
+        # LLM parser learner
+        llm_autopatch(run_tests=False, db_fields=db_fields)
+        print("✅ Applied LLM parser self-learning/auto-patch.")
+    except Exception as e:
+        print(f"⚠️ LLM autopatch failed: {e!r}")
+
+    try:
+        # Regex parser learner
+        basic_autopatch(run_tests=False, db_fields=db_fields)
+        print("✅ Applied regex parser self-learning/auto-patch.")
+    except Exception as e:
+        print(f"⚠️ Regex autopatch failed: {e!r}")
+
+    try_git_commit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# learning_jobs.py — background self-learning, off the Streamlit render path
+# ──────────────────────────────────────────────────────────────────────────────
+# Streamlit re-executes app scripts on every interaction, but imported modules
+# persist for the life of the process. Work registered here therefore runs:
+#
+#   • at most once per process per job name (later calls just return status)
+#   • on a daemon thread, so the first render never waits on feedback size,
+#     pattern-store writes or git subprocesses
+#   • under LEARNING_LOCK, which foreground learning (Gold Spec Tests buttons)
+#     also takes, so the two never write parser_memory.json at the same time
+#
+# Usage (app.py / app_chat.py):
+#   start_learning_job("startup", [("git repo", ensure_git_repo), ...])
+#   st.sidebar.caption(learning_status_line("startup"))
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import time
+import threading
+import traceback
+from typing import Callable, Dict, List, Optional, Tuple
+
+Step = Tuple[str, Callable[[], object]]
+
+LEARNING_LOCK = threading.RLock()
+
+_JOBS: Dict[str, Dict[str, object]] = {}
+_JOBS_LOCK = threading.Lock()
+
+
+def _run(name: str, steps: List[Step]) -> None:
+    status = _JOBS[name]
+    with LEARNING_LOCK:
+        status["state"] = "running"
+        for label, fn in steps:
+            status["current"] = label
+            t0 = time.time()
+            try:
+                fn()
+                status["steps"].append({"step": label, "ok": True, "seconds": round(time.time() - t0, 3)})
+            except Exception as e:
+                # One failing step (e.g. git offline) must not stop the rest
+                status["steps"].append({"step": label, "ok": False, "seconds": round(time.time() - t0, 3), "error": repr(e)})
+                status["errors"] += 1
+                print(f"⚠️ Learning job '{name}' step '{label}' failed: {e!r}")
+                traceback.print_exc()
+        status["current"] = None
+        status["state"] = "failed" if status["errors"] == len(steps) else "done"
+        status["finished"] = time.time()
+    print(f"🧠 Learning job '{name}' {status['state']} in {status['finished'] - status['started']:.1f}s.")
+
+
+def start_learning_job(name: str, steps: List[Step]) -> Dict[str, object]:
+    """Start `steps` on a background thread unless this process already did."""
+    with _JOBS_LOCK:
+        if name in _JOBS:
+            return dict(_JOBS[name])
+        _JOBS[name] = {
+            "name": name, "state": "queued", "current": None,
+            "steps": [], "errors": 0, "started": time.time(), "finished": None,
+        }
+        threading.Thread(target=_run, args=(name, list(steps)), name=f"learning-{name}", daemon=True).start()
+        return dict(_JOBS[name])
+
+
+def get_learning_status(name: str) -> Optional[Dict[str, object]]:
+    status = _JOBS.get(name)
+    return dict(status, steps=list(status["steps"])) if status else None
+
+
+def wait_for_learning_job(name: str, timeout: Optional[float] = None) -> bool:
+    """Block until the job finishes (CLI/scripts); True if it finished."""
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+        status = _JOBS.get(name)
+        if status is None or status["finished"] is not None:
+            return status is not None
+        if deadline is not None and time.time() >= deadline:
+            return False
+        time.sleep(0.05)
+
+
+def learning_status_line(name: str) -> str:
+    """One-line summary for a sidebar caption."""
+    status = get_learning_status(name)
+    if status is None:
+        return "🧠 Learning: not started"
+    if status["finished"] is None:
+        step = f" ({status['current']})" if status["current"] else ""
+        return f"🧠 Learning: running{step} — {time.time() - status['started']:.0f}s"
+    took = status["finished"] - status["started"]
+    if status["errors"]:
+        failed = ", ".join(s["step"] for s in status["steps"] if not s["ok"])
+        return f"⚠️ Learning: {status['state']} in {took:.1f}s (failed: {failed})"
+    return f"✅ Learning: up to date ({took:.1f}s)"
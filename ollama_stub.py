@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# ollama_stub.py — local, deterministic stand-in for the Ollama /api/chat server
+# ──────────────────────────────────────────────────────────────────────────────
+# Lets the LLM path (parser_llm, gold_test_runner, bench_parsers, the apps) run
+# offline and under load without a model. The ollama client reads OLLAMA_HOST,
+# so nothing in the app changes:
+#
+#   python ollama_stub.py --port 11435 --latency lognormal:0.4,0.5 --error-rate 0.02 &
+#   OLLAMA_HOST=http://127.0.0.1:11435 python gold_test_runner.py --full
+#   OLLAMA_HOST=http://127.0.0.1:11435 streamlit run app_chat.py
+#
+# Replies:
+#   • The observation text is taken from the user message ("Observation:"
+#     blocks; batch prompts from parse_batch_free_text give one per [tN] id)
+#   • --replies gold  (default): the gold_tests.json expectations for that
+#     text, restricted to the fields in the request's `format` schema;
+#     unknown texts get {}
+#   • --replies empty: always {} (measures the regex layer + plumbing only)
+#   • Batch answers drop each item with probability --drop-rate, to exercise
+#     the parser's re-queue path
+#
+# Behaviour knobs (all seeded: the same request body gets the same latency and
+# error on its n-th attempt, whatever the arrival order):
+#   • --latency fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA
+#   • --error-rate P   ← HTTP 500 {"error": ...} like a failing server
+#   • "stream": true   ← NDJSON chunks, latency spread across them
+#   • /api/tags, /api/version answered so client health checks pass
+#
+# CLI:
+#   python ollama_stub.py --selftest   ← starts on a free port, checks replies
+#                                        (and, with the ollama client installed,
+#                                        that parse_batch sends fewer requests
+#                                        than per-text parses)
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PORT = 11435  # next to Ollama's 11434 so both can run
+
+_OBS_RX = re.compile(r"Observation:\n(.*?)(?=\n\n\[t\d+\] Fields: |\Z)", re.S)
+_BATCH_RX = re.compile(r"^\[(t\d+)\] Fields: [^\n]*\n(?:.*?\n)??Observation:\n(.*?)(?=\n\n\[t\d+\] Fields: |\Z)", re.S | re.M)
+
+
+def _norm(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def parse_latency(spec: str) -> Tuple[str, List[float]]:
+    """'lognormal:0.4,0.5' → ("lognormal", [0.4, 0.5]); validated up front."""
+    kind, _, args = (spec or "fixed:0").partition(":")
+    params = [float(x) for x in args.split(",") if x.strip()] if args else []
+    need = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    if kind not in need or len(params) != need[kind]:
+        raise ValueError(f"bad latency spec {spec!r} (fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA)")
+    return kind, params
+
+
+def sample_latency(rng: random.Random, kind: str, params: List[float]) -> float:
+    if kind == "fixed":
+        return max(0.0, params[0])
+    if kind == "uniform":
+        return rng.uniform(params[0], params[1])
+    if kind == "normal":
+        return max(0.0, rng.gauss(params[0], params[1]))
+    median, sigma = params
+    return rng.lognormvariate(0.0, sigma) * median if median > 0 else 0.0
+
+
+class StubConfig:
+    """Reply corpus + behaviour knobs shared by all handler threads."""
+
+    def __init__(
+        self,
+        gold_path: Optional[str] = "gold_tests.json",
+        replies: str = "gold",
+        latency: str = "fixed:0",
+        error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        seed: int = 0,
+        chunks: int = 8,
+    ):
+        self.replies = replies
+        self.latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.seed = seed
+        self.chunks = max(1, chunks)
+        self.gold: Dict[str, Dict[str, str]] = {}
+        if gold_path and replies == "gold":
+            try:
+                with open(gold_path, "r", encoding="utf-8") as f:
+                    for case in json.load(f):
+                        self.gold.setdefault(_norm(case.get("input", "")), dict(case.get("expected", {})))
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Stub could not load {gold_path}: {e}; replying with {{}}")
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "streamed": 0}
+
+    def rng_for(self, body: bytes) -> random.Random:
+        """Per-request RNG: same body + same attempt number → same draws."""
+        digest = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            n = self._attempts.get(digest, 0)
+            self._attempts[digest] = n + 1
+            self.stats["requests"] += 1
+        return random.Random(f"{self.seed}:{digest}:{n}")
+
+    def answer_for(self, text: str, fields: Optional[List[str]]) -> Dict[str, str]:
+        expected = self.gold.get(_norm(text), {}) if self.replies == "gold" else {}
+        if fields is None:
+            return dict(expected)
+        return {k: v for k, v in expected.items() if k in fields}
+
+    def reply(self, request: Dict, rng: random.Random) -> Dict:
+        """JSON object the model 'generated' for this chat request."""
+        user = next((m.get("content", "") for m in reversed(request.get("messages", [])) if m.get("role") == "user"), "")
+        schema = request.get("format") if isinstance(request.get("format"), dict) else {}
+        props = schema.get("properties", {})
+        if "items" in props:  # batch schema from parser_llm.parse_batch_free_text
+            entry = props["items"].get("items", {}).get("properties", {})
+            fields = [f for f in entry if f != "id"]
+            items = []
+            for item_id, text in _BATCH_RX.findall(user):
+                if rng.random() < self.drop_rate:
+                    continue
+                items.append(dict(self.answer_for(text, fields), id=item_id))
+            return {"items": items}
+        m = _OBS_RX.search(user)
+        return self.answer_for(m.group(1) if m else user, list(props) if props else None)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_version = "ollama-stub/1"
+    config: StubConfig  # set on the subclass made by make_server()
+
+    def log_message(self, fmt: str, *args) -> None:  # quiet by default
+        pass
+
+    def _send_json(self, code: int, obj: Dict) -> None:
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.startswith("/api/version"):
+            self._send_json(200, {"version": "0.0.0-stub"})
+        elif self.path.startswith("/api/tags"):
+            self._send_json(200, {"models": []})
+        elif self.path in ("/", ""):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"Ollama is running")
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        if not self.path.startswith("/api/chat"):
+            self._send_json(404, {"error": f"stub only serves /api/chat, not {self.path}"})
+            return
+        cfg = self.config
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON body"})
+            return
+
+        rng = cfg.rng_for(body)
+        delay = sample_latency(rng, *cfg.latency)
+        if rng.random() < cfg.error_rate:
+            time.sleep(delay)
+            with cfg._lock:
+                cfg.stats["errors"] += 1
+            self._send_json(500, {"error": "stub: injected server error"})
+            return
+
+        content = json.dumps(cfg.reply(request, rng))
+        prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+        final = {
+            "model": request.get("model", "stub"), "created_at": _now(), "done": True, "done_reason": "stop",
+            "total_duration": int(delay * 1e9), "load_duration": 0,
+            "prompt_eval_count": max(1, prompt_chars // 4), "prompt_eval_duration": 0,
+            "eval_count": max(1, len(content) // 4), "eval_duration": int(delay * 1e9),
+        }
+        if not request.get("stream", False):
+            time.sleep(delay)
+            self._send_json(200, dict(final, message={"role": "assistant", "content": content}))
+            return
+
+        with cfg._lock:
+            cfg.stats["streamed"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        step = -(-len(content) // cfg.chunks) or 1
+        for i in range(0, len(content), step):
+            time.sleep(delay / cfg.chunks)
+            chunk = {"model": final["model"], "created_at": _now(), "done": False,
+                     "message": {"role": "assistant", "content": content[i:i + step]}}
+            self.wfile.write(json.dumps(chunk).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps(dict(final, message={"role": "assistant", "content": ""})).encode("utf-8") + b"\n")
+
+
+def make_server(config: StubConfig, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_thread(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve on a background thread (port 0 = any free port); returns (server, base URL)."""
+    server = make_server(config, host, port)
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Self-test (plain HTTP; the ollama package is not needed)
+# ──────────────────────────────────────────────────────────────────────────────
+def _post(url: str, payload: Dict) -> Tuple[int, bytes]:
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def _selftest() -> int:
+    ok = True
+
+    def check(label: str, cond: bool) -> None:
+        nonlocal ok
+        ok = ok and cond
+        print(f"{'✅' if cond else '❌'} {label}")
+
+    with open("gold_tests.json", "r", encoding="utf-8") as f:
+        case = json.load(f)[0]
+    fields = list(case["expected"])[:3]
+    schema = {"type": "object", "properties": {k: {"type": "string"} for k in fields}}
+    single = {"model": "m", "stream": False, "format": schema,
+              "messages": [{"role": "system", "content": "sys"},
+                           {"role": "user", "content": f"Fields to report — x\n\nObservation:\n{case['input']}"}]}
+
+    server, url = start_in_thread(StubConfig(latency="fixed:0.05"))
+    t0 = time.time()
+    code, body = _post(url + "/api/chat", single)
+    reply = json.loads(body)
+    check("single reply = gold expectations for the schema fields",
+          code == 200 and json.loads(reply["message"]["content"]) == {k: case["expected"][k] for k in fields})
+    check("latency applied", time.time() - t0 >= 0.05)
+
+    batch_schema = {"type": "object", "properties": {"items": {"type": "array", "items": {
+        "type": "object", "properties": dict(schema["properties"], id={"type": "string"})}}}}
+    batch_prompt = "intro\n\nPrevious facts: {}\n\n" + "\n\n".join(
+        f"[t{i}] Fields: {', '.join(fields)}\nObservation:\n{text}" for i, text in enumerate([case["input"], "unknown isolate"])
+    )
+    code, body = _post(url + "/api/chat", dict(single, format=batch_schema,
+                                               messages=[{"role": "user", "content": batch_prompt}]))
+    items = json.loads(json.loads(body)["message"]["content"])["items"]
+    check("batch reply keyed by id", [i["id"] for i in items] == ["t0", "t1"] and items[1] == {"id": "t1"}
+          and all(items[0].get(k) == case["expected"][k] for k in fields))
+
+    code, body = _post(url + "/api/chat", dict(single, stream=True))
+    lines = [json.loads(l) for l in body.decode().splitlines() if l.strip()]
+    streamed = "".join(l["message"]["content"] for l in lines)
+    check("streaming: NDJSON chunks ending in done", len(lines) > 2 and lines[-1]["done"] and json.loads(streamed) == json.loads(reply["message"]["content"]))
+    server.shutdown()
+
+    server, url = start_in_thread(StubConfig(error_rate=0.5, seed=7))
+    codes = [_post(url + "/api/chat", dict(single, model=f"m{i}"))[0] for i in range(40)]
+    check("error rate ≈ 0.5 (HTTP 500)", 10 <= codes.count(500) <= 30 and set(codes) <= {200, 500})
+    server.shutdown()
+    server, url = start_in_thread(StubConfig(error_rate=0.5, seed=7))
+    again = [_post(url + "/api/chat", dict(single, model=f"m{i}"))[0] for i in range(40)]
+    check("deterministic for a given seed", again == codes)
+    server.shutdown()
+
+    # Batched parsing must cost fewer requests than one parse per text
+    try:
+        import ollama  # noqa: F401  (parser_llm's client)
+        import parser_llm
+    except ImportError as e:
+        print(f"ℹ️ batch-vs-single request check skipped ({e})")
+    else:
+        with open("gold_tests.json", "r", encoding="utf-8") as f:
+            cases = json.load(f)[:60]
+        texts = [c.get("input", "") for c in cases]
+        fields = sorted({k for c in cases for k in c.get("expected", {})})
+        config = StubConfig()
+        server, url = start_in_thread(config)
+        requests = {}
+        for mode in ("single", "batch"):
+            config.stats["requests"] = 0
+            parser = parser_llm.Parser(host=url, skip_coverage=1.01)  # every text goes to the LLM
+            if mode == "batch":
+                parser.parse_batch(texts, db_fields=fields)
+            else:
+                for text in texts:
+                    parser.parse(text, db_fields=fields)
+            requests[mode] = config.stats["requests"]
+        server.shutdown()
+        check(f"batched parse uses fewer requests than per-text ({requests['batch']} vs {requests['single']})",
+              requests["batch"] < requests["single"])
+
+    print("ollama_stub selftest:", "PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Deterministic local stand-in for Ollama /api/chat")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--gold", default="gold_tests.json", help="expectations used for --replies gold")
+    ap.add_argument("--replies", choices=("gold", "empty"), default="gold")
+    ap.add_argument("--latency", default="fixed:0", help="fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MEDIAN,SIGMA")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="share of batch items left out of answers")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--selftest", action="store_true")
+    args = ap.parse_args(argv)
+    if args.selftest:
+        return _selftest()
+
+    config = StubConfig(args.gold, args.replies, args.latency, args.error_rate, args.drop_rate, args.seed)
+    server = make_server(config, args.host, args.port)
+    print(f"🧪 Ollama stub on http://{args.host}:{args.port} ({len(config.gold)} gold texts, "
+          f"latency {args.latency}, error rate {args.error_rate}) — set OLLAMA_HOST to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"🧪 Stub stopped: {config.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# pair_table.py — precomputed genus × genus table of discriminating fields
+# ──────────────────────────────────────────────────────────────────────────────
+# For every pair of genera (a, b) the table holds one bitmask over the compiled
+# DB's fields: bit j set ⇔ the two genera have different values in field j.
+# "Why A over B" explanations and next-test suggestions in engine.py become a
+# lookup plus a few bit operations instead of re-reading both rows.
+#
+#   • upper triangle only, one uint64 per pair (fields ≤ 64; ints beyond that)
+#     → 148 genera: ~11k pairs, 85 KB, built in ~25 ms
+#   • the build is O(n² · fields): 1000 genera take ~1 s and 4 MB. Above
+#     PAIR_TABLE_MAX_ROWS genera (env BACTAI_PAIR_TABLE_MAX_ROWS, default 1000)
+#     masks are computed per pair from the code columns instead — ~5 µs,
+#     O(fields), independent of DB size
+#   • get_pair_table() caches one table per CompiledDB object, like
+#     trait_index.get_trait_index()
+#
+# Usage:
+#   python pair_table.py Escherichia Klebsiella     ← fields that differ
+#
+#   from pair_table import get_pair_table
+#   get_pair_table(cdb).differing_fields("Escherichia", "Klebsiella")
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+import threading
+import weakref
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from compiled_db import CompiledDB, get_compiled_db
+
+PAIR_TABLE_MAX_ROWS = int(os.getenv("BACTAI_PAIR_TABLE_MAX_ROWS", "1000"))
+
+
+class PairTable:
+    """Field-difference bitmask for every pair of genus rows of one CompiledDB."""
+
+    def __init__(self, cdb: CompiledDB, max_rows: int = PAIR_TABLE_MAX_ROWS):
+        self.fields = list(cdb.fields)
+        self.bit = {f: 1 << j for j, f in enumerate(self.fields)}
+        self.n = len(cdb)
+        self.row_of: Dict[str, int] = {}
+        for i, g in enumerate(cdb.genera):
+            self.row_of.setdefault(g, i)
+        self._cols = [cdb.column_codes(j) for j in range(len(self.fields))]
+        self.table: Optional[Sequence[int]] = None
+        if self.n <= max_rows:
+            self.table = self._build()
+
+    def _build(self) -> Sequence[int]:
+        bits = [1 << j for j in range(len(self.fields))]
+        rows = list(zip(*self._cols))
+        table = array("Q") if len(self.fields) <= 64 else []
+        for a in range(self.n):
+            ra = rows[a]
+            for b in range(a + 1, self.n):
+                mask = 0
+                for bit, x, y in zip(bits, ra, rows[b]):
+                    if x != y:
+                        mask |= bit
+                table.append(mask)
+        return table
+
+    def diff_mask(self, a: int, b: int) -> int:
+        """Bitmask of fields in which rows a and b differ (0 for a == b)."""
+        if a == b:
+            return 0
+        if a > b:
+            a, b = b, a
+        if self.table is not None:
+            return self.table[a * (2 * self.n - a - 1) // 2 + b - a - 1]
+        mask = 0
+        for j, col in enumerate(self._cols):
+            if col[a] != col[b]:
+                mask |= 1 << j
+        return mask
+
+    def mask_of(self, fields: Iterable[str]) -> int:
+        mask = 0
+        for f in fields:
+            mask |= self.bit.get(f, 0)
+        return mask
+
+    def fields_in(self, mask: int) -> List[str]:
+        """Field names for the set bits of mask, in DB column order."""
+        return [f for j, f in enumerate(self.fields) if mask >> j & 1]
+
+    def differing_fields(self, genus_a: str, genus_b: str) -> List[str]:
+        return self.fields_in(self.diff_mask(self.row_of[genus_a], self.row_of[genus_b]))
+
+    def nbytes(self) -> int:
+        return 0 if self.table is None else len(self.table) * 8
+
+
+_TABLES: "weakref.WeakKeyDictionary[CompiledDB, PairTable]" = weakref.WeakKeyDictionary()
+_TABLES_LOCK = threading.Lock()
+
+
+def get_pair_table(cdb: CompiledDB) -> PairTable:
+    """Pair table for this DB object, built on first use."""
+    with _TABLES_LOCK:
+        table = _TABLES.get(cdb)
+        if table is None:
+            table = _TABLES[cdb] = PairTable(cdb)
+        return table
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv.pop(0) if argv and argv[0].endswith(".cdb") else None
+    if path is None:
+        path = next((p for p in (os.path.join("data", "bacteria_db.cdb"), "bacteria_db.cdb") if os.path.exists(p)), None)
+    if path is None:
+        print("❌ No compiled DB found; run python compiled_db.py first.")
+        return 1
+    t0 = time.perf_counter()
+    table = get_pair_table(get_compiled_db(path))
+    mode = f"{table.nbytes() / 1024:.0f} KB table" if table.table is not None else "computed per pair"
+    print(f"🧮 {table.n} genera, {table.n * (table.n - 1) // 2} pairs, {mode}, built in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    if len(argv) >= 2:
+        a, b = argv[0], argv[1]
+        t0 = time.perf_counter()
+        fields = table.differing_fields(a, b)
+        print(f"   {a} vs {b}: {len(fields)} fields differ ({(time.perf_counter() - t0) * 1e6:.0f} µs) — " + ", ".join(fields))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
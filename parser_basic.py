@@ -1,8 +1,10 @@
-# parser_basic.py — v5 (Full Regex Parser + Self-Learning + Auto-Patching + Gold Tests)
+# parser_basic.py — v5 (Full Regex Parser + Self-Learning + Learned Patterns + Gold Tests)
 # -------------------------------------------------------------------------------------
 # Features:
 #   • Pure regex parser (no LLM dependency)
 #   • Full-field self-learning (all biochemical, morphology, media, oxygen, etc.)
+#   • Learned rules stored in data/learned_patterns.json (pattern_store.py),
+#     shared with parser_llm and hot-reloaded — this file is never rewritten
 #   • Auto-fixes spacing (\ fermentation → \s+fermentation)
 #   • Prevents duplicate rule insertion
 #   • Git-safe, compatible with Streamlit Cloud auto-commit
@@ -15,6 +17,9 @@ import json
 from datetime import datetime
 from typing import Dict, List, Optional, Set
 
+from feedback_store import FeedbackStore, fold_feedback_counters, get_feedback_store
+from pattern_store import PatternStore, get_pattern_store
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Storage paths
 # ──────────────────────────────────────────────────────────────────────────────
@@ -22,6 +27,18 @@ DATA_DIR = os.path.join(os.getcwd(), "data")
 GOLD_TESTS_PATH = os.path.join(os.getcwd(), "gold_tests.json")
 FEEDBACK_PATH = os.path.join(os.getcwd(), "parser_feedback.json")
 MEMORY_PATH = os.path.join(os.getcwd(), "parser_memory.json")
+FEEDBACK_DIR = os.path.join(DATA_DIR, "feedback")
+PATTERNS_PATH = os.path.join(DATA_DIR, "learned_patterns.json")
+LEARNED_BUCKET = "GENERAL_PATTERNS"
+_REGEX_PROFILER = None  # set by regex_profiler.enable_profiling()
+
+def get_feedback_log() -> FeedbackStore:
+    """Same append-only log parser_llm uses (legacy JSON migrated on first use)."""
+    return get_feedback_store(FEEDBACK_DIR, legacy_path=FEEDBACK_PATH)
+
+def get_learned_patterns() -> PatternStore:
+    """Same learned-pattern store parser_llm uses."""
+    return get_pattern_store(PATTERNS_PATH)
 
 def _ensure_data_dir():
     os.makedirs(DATA_DIR, exist_ok=True)
@@ -80,6 +97,18 @@ def _canon_value(f: str, v: str) -> str:
     if "pos" in v or "+" in v or "detect" in v or "produced" in v: return "Positive"
     return v.capitalize()
 
+def _learned_value(m: "re.Match") -> str:
+    """
+    Value a learned rule's match asserts: its capture group (the polarity
+    phrase) if it has one, else the polarity phrases in the whole span, with
+    negative winning ("not detected" must not read as "detected").
+    """
+    span = (m.group(m.lastindex) if m.lastindex else m.group(0)).lower()
+    if re.search(r"\b(?:not\s+(?:detected|produced)|negative|absent)\b", span): return "Negative"
+    if re.search(r"\b(?:variable|weak)", span): return "Variable"
+    if re.search(r"\b(?:positive|detected|produced)\b|\+", span): return "Positive"
+    return ""
+
 def _set_field_safe(out: Dict[str,str], field: str, val: str):
     if not val: return
     cur = out.get(field)
@@ -97,6 +126,12 @@ def extract_biochem_regex(text: str, db_fields: List[str]) -> Dict[str,str]:
             _set_field_safe(out, field, "Positive")
         elif re.search(rf"\b{re.escape(base)}\b.*(?:negative|\-|not\s+detected|absent)", t):
             _set_field_safe(out, field, "Negative")
+    # Learned rules only fill fields the built-in rules left empty
+    for field, rx in get_learned_patterns().snapshot().get(LEARNED_BUCKET, ()):
+        if field in db_fields and field not in out:
+            m = rx.search(t) if _REGEX_PROFILER is None else _REGEX_PROFILER.search(LEARNED_BUCKET, rx, t)
+            if m:
+                _set_field_safe(out, field, _learned_value(m))
     # Morphology quick rules
     if "gram positive" in t: out["Gram Stain"] = "Positive"
     if "gram negative" in t: out["Gram Stain"] = "Negative"
@@ -109,9 +144,8 @@ def extract_biochem_regex(text: str, db_fields: List[str]) -> Dict[str,str]:
 def parse_input_free_text(user_text: str, prior_facts=None, db_fields=None) -> Dict[str,str]:
     if not user_text: return {}
     db_fields = db_fields or list(ALLOWED_VALUES.keys())
-    facts = prior_facts or {}
-    parsed = extract_biochem_regex(user_text, db_fields)
-    facts.update(parsed)
+    facts = dict(prior_facts or {})  # never modify the caller's dict
+    facts.update(extract_biochem_regex(user_text, db_fields))
     return facts
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -126,9 +160,7 @@ def _diff_for_feedback(expected, got):
     return diffs
 
 def _log_feedback_case(name, text, diffs):
-    fb = _load_json(FEEDBACK_PATH, [])
-    fb.append({"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "name": name, "text": text, "errors": diffs})
-    _save_json(FEEDBACK_PATH, fb)
+    get_feedback_log().append({"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "name": name, "text": text, "errors": diffs})
 
 def run_gold_tests(db_fields=None):
     tests = _load_json(GOLD_TESTS_PATH, [])
@@ -149,12 +181,12 @@ def run_gold_tests(db_fields=None):
     return passed,total
 
 def analyze_feedback_and_learn():
-    fb = _load_json(FEEDBACK_PATH, [])
-    if not fb: return
     memory=_load_json(MEMORY_PATH,{})
-    counts={}
-    for f in fb:
-        for e in f.get("errors",[]): counts[e["field"]] = counts.get(e["field"],0)+1
+    new_cases=fold_feedback_counters(memory, get_feedback_log(), "parser_basic")  # only entries since its last pass
+    counts=memory["feedback_counters"]["fields"]
+    if not counts: return
+    if not new_cases and "auto_heuristics" in memory:
+        print("🧠 No new feedback since last learning pass."); return
     learned={fld:{"rule":"auto-learn","count":c} for fld,c in counts.items() if c>=3}
     memory["auto_heuristics"]=learned
     _save_json(MEMORY_PATH,memory)
@@ -172,31 +204,15 @@ def auto_update_parser_regex():
     if not auto:
         print("No new heuristics.")
         return
-    try:
-        with open(__file__,"r",encoding="utf-8") as f: code=f.read()
-    except Exception as e:
-        print("Read self error:",e); return
-
-    updated=0
+    rules=[]
     for field,data in auto.items():
-        field_l=field.lower()
-        rule=f'r"\\b{re.escape(field_l)}\\b.*(?:positive|negative|detected|produced)"'
-        rule=_fix_regex_spaces(rule)
-        if rule in code:
-            continue  # skip duplicates
-        insert_line=f"    {rule},  # learned {data['count']}x\n"
-        pattern_list="GENERAL_PATTERNS"
-        code=re.sub(r"(# END AUTO-LEARN AREA)",insert_line+r"\1",code)
-        updated+=1
-
-    if updated:
-        with open(__file__,"w",encoding="utf-8") as f: f.write(code)
-        print(f"🧬 Added {updated} new regex rules.")
-    else:
-        print("No new regex inserted.")
-
-# Placeholder for learned pattern insertion marker
-# END AUTO-LEARN AREA
+        # group 1 = the polarity phrase (read by _learned_value); "not …" first
+        rule=(rf"\b{re.escape(field.lower())}\b[^.\n]{{0,80}}?"
+              r"\b(not\s+detected|not\s+produced|positive|negative|detected|produced|absent|variable)\b")
+        rules.append({"bucket":LEARNED_BUCKET,"field":field,"regex":_fix_regex_spaces(rule),"count":data.get("count",0)})
+    updated=get_learned_patterns().add_many(rules)  # dedupes; no source rewrite
+    if updated: print(f"🧬 Added {updated} new regex rules.")
+    else: print("No new regex inserted.")
 
 # ──────────────────────────────────────────────────────────────────────────────
 # BOOTSTRAP
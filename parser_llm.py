@@ -1,29 +1,48 @@
-# parser_llm.py — v5 (Ollama + Regex + Self-Learning + Safe Autopatching)
+# parser_llm.py — v5 (Ollama + Regex + Self-Learning + Learned Pattern Store)
 # ──────────────────────────────────────────────────────────────────────────────
 # What you get:
-#   • Ollama LLM parsing (primary) with JSON extraction
+#   • Ollama LLM parsing (primary) with schema-constrained JSON output
 #   • Deterministic regex enrichment for morphology/biochem/fermentations/media
 #   • Persistent self-learning from gold_tests + live runs (3-strike rule idea)
-#   • Auto-injection of learned regex lines back into this file (safe patcher)
-#   • Sanitizers that fix bad escapes / unterminated raw strings BEFORE parsing
-#   • CLI: python parser_llm.py --test  → runs gold_tests.json, learns, patches
+#   • Learned regex kept as data (pattern_store.py), hot-reloaded, never patched
+#     into this file
+#   • CLI: python parser_llm.py --test  → runs gold_tests.json, learns
 #
 # Files used:
 #   • gold_tests.json          ← optional input for gold-testing
-#   • parser_feedback.json     ← logs mismatches from tests/runs
+#   • data/feedback/           ← append-only log of mismatches (feedback_store.py)
+#   • parser_feedback.json     ← legacy log, imported once into data/feedback/
 #   • parser_memory.json       ← learned summaries & auto_heuristics
+#   • data/learned_patterns.json ← learned regex, shared with parser_basic
 #
 # Env:
-#   • OLLAMA_API_KEY           ← your cloud API key (if using Ollama Cloud)
-#   • LOCAL_MODEL              ← default "deepseek-v3.1:671b"
+#   • OLLAMA_API_KEY           ← your cloud API key (if using Ollama Cloud); env or
+#                                Streamlit secrets, read by Parser (never copied
+#                                into os.environ)
+#   • OLLAMA_HOST              ← server URL; point at ollama_stub.py for offline runs
+#   • LOCAL_MODEL              ← default "deepseek-v3.1:671b" (large tier)
+#   • SMALL_MODEL              ← default "gpt-oss:20b", tried first; "" disables
+#   • OLLAMA_KEEP_ALIVE        ← default "30m"; keeps the cached system prefix warm
 #   • BACTAI_STRICT_MODE       ← "1" for strict schema-only output
+#   • BACTAI_LLM_SKIP_COVERAGE ← regex coverage needed to skip the LLM (default 1.0)
+#   • BACTAI_BATCH_TOKENS / BACTAI_BATCH_MAX_ITEMS ← batch request size caps
+#   • BACTAI_GOLD_LLM_CONCURRENCY / BACTAI_GOLD_PROCESSES ← gold run pools
+#                                (see gold_test_runner.py)
 #
 # Public API:
+#   Parser(base_dir=None, **settings)  # owns paths, models, stores, client, stats;
+#                                # thread-safe, .parse() / .parse_batch() / stats
+#   default_parser()           # the Parser behind the module functions below
 #   parse_input_free_text(text, prior_facts=None, db_fields=None) -> Dict[str,str]
 #   apply_what_if(user_text, prior_result, db_fields) -> Dict[str,str]
-#   run_gold_tests()  # CLI with --test
+#   estimate_regex_coverage(text, resolved, db_fields) -> Dict  # LLM skip gate
+#   get_llm_gate_stats() / reset_llm_gate_stats()
+#   get_llm_routing_stats() / reset_llm_routing_stats()  # per-tier latency
+#   parse_batch_free_text(texts, prior_facts=None, db_fields=None) -> List[Dict]
+#                                # many texts per LLM request (bulk/gold runs)
+#   run_gold_tests(full=False)  # CLI with --test [--full]; unchanged cases cached
 #   analyze_feedback_and_learn()  # called automatically by runner helpers
-#   auto_update_parser_regex()    # writes learned regex into *_PATTERNS lists
+#   auto_update_parser_regex()    # adds learned regex to data/learned_patterns.json
 #   enable_self_learning_autopatch(run_tests: bool = False)
 # ──────────────────────────────────────────────────────────────────────────────
 
@@ -34,163 +53,38 @@ import re
 import json
 import sys
 import math
+import time
+import hashlib
 import difflib
+import threading
 from datetime import datetime
 from typing import Dict, List, Set, Tuple, Optional
 
-def _load_streamlit_secrets_into_env():
-    try:
-        import streamlit as st
-        # copy (but don't overwrite) into os.environ
-        for k, v in st.secrets.items():
-            if k not in os.environ:
-                os.environ[k] = str(v)
-    except Exception:
-        # not running in Streamlit, ignore
-        pass
-
-_load_streamlit_secrets_into_env()
-
-# Optional fallback parser import (kept harmless if missing)
-fallback_parser = None
-try:
-    from parser_basic import parse_input_free_text as _basic_parser
-    fallback_parser = _basic_parser
-except Exception:
-    fallback_parser = None
-
-# ──────────────────────────────────────────────────────────────────────────────
-# Self-healing sanitizers (SAFE: not auto-run at import; call from a function)
-# ──────────────────────────────────────────────────────────────────────────────
-
-def _sanitize_parser_file(file_path: str) -> None:
-    """
-    Ensure lines that look like raw-regex items end with a closing quote + comma,
-    and remove trailing junk that could produce unterminated strings.
-    Only lightly touches lines that begin with r"..."/r'...' patterns.
-    """
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+from feedback_store import FeedbackStore, fold_feedback_counters, get_feedback_store
+from feedback_index import estimate_tokens, get_feedback_index
+from pattern_store import PatternStore, get_pattern_store
 
-        fixed: List[str] = []
-        for line in lines:
-            s = line.rstrip("\n")
-
-            # Fix invisible control chars
-            s = s.replace("\u2028", "").replace("\u2029", "")
-
-            stripped = s.strip()
-            if stripped.startswith('r"') or stripped.startswith("r'"):
-                # if ends with quote but missing comma, add comma
-                if stripped.endswith('"') and not stripped.endswith('",'):
-                    s = s + ","
-                if stripped.endswith("'") and not stripped.endswith("',"):
-                    s = s + ","
-
-            fixed.append(s + "\n")
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.writelines(fixed)
-        print(f"🧩 Sanitized parser file endings: {file_path}")
-    except Exception as e:
-        print(f"⚠️ Failed _sanitize_parser_file: {e}")
-
-
-def _sanitize_auto_learned_patterns(file_path: str) -> None:
+def _setting(name: str, default: Optional[str] = None) -> Optional[str]:
     """
-    Fix common bad-escape issues that can sneak into learned regex in this file.
-    Safe, idempotent, and conservative.
+    Env var, else a Streamlit secret when running under Streamlit. Read-only:
+    secrets are never copied into os.environ.
     """
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        original = content
-
-        # Keep raw-strings intact; just normalize accidental half-escapes.
-        # Intentionally simple: we don't attempt deep AST edits here.
-        # Normalize r"\\s+" (backslash-space) → "\s+" intent is handled elsewhere.
-        content = content.replace(r'\\s+', r'\\s+')
-
-        # Remove accidental CR nulls or stray NULs if they appeared
-        content = content.replace("\x00", "")
-
-        if content != original:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            print(f"🧩 Fixed escaped regexes & control chars in {file_path}")
-        else:
-            print("ℹ️ No escaped regex fixes applied.")
-    except Exception as e:
-        print(f"⚠️ Auto-learned pattern sanitization failed: {e}")
-
-
-def _repair_parser_file(file_path: str) -> None:
-    """
-    Defensive pass to avoid unterminated string literals:
-    - Ensures list items that clearly should end with '",' do so (best-effort).
-    - Ensures brackets [ ... ] stay balanced around pattern lists.
-    """
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
-
-        original = content
-        lines = content.splitlines()
-        out_lines: List[str] = []
-
-        # Track whether we're inside a pattern list by a simple heuristic.
-        inside_list = False
-        open_brackets = 0
-
-        for raw in lines:
-            line = raw
-
-            if re.search(r"_PATTERNS\s*=\s*\[", line):
-                inside_list = True
-                open_brackets = 1
-
-            if inside_list:
-                stripped = line.strip()
-                if (stripped.startswith('r"') or stripped.startswith("r'")) and not stripped.endswith(","):
-                    if stripped.endswith('"') or stripped.endswith("'"):
-                        line = line + ","
-
-            # Track bracket balance
-            open_brackets += line.count("[") - line.count("]")
-
-            if inside_list and open_brackets <= 0:
-                inside_list = False
-
-            out_lines.append(line)
-
-        repaired = "\n".join(out_lines)
-
-        if repaired != original:
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(repaired)
-            print(f"🧩 Repaired potential unterminated lines in {file_path}")
-        else:
-            print("ℹ️ No repair changes required.")
-    except Exception as e:
-        print(f"⚠️ Parser file repair failed: {e}")
-
+    val = os.environ.get(name)
+    if val is not None:
+        return val
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            if name in st.secrets:
+                return str(st.secrets[name])
+        except Exception:
+            # no secrets.toml / not running under `streamlit run`
+            pass
+    return default
 
 # ──────────────────────────────────────────────────────────────────────────────
-# Persistent storage paths
+# JSON helpers (paths come from a Parser; see Parser.__init__)
 # ──────────────────────────────────────────────────────────────────────────────
-DATA_DIR = os.path.join(os.getcwd(), "data")
-GOLD_TESTS_PATH = os.path.join(os.getcwd(), "gold_tests.json")
-FEEDBACK_PATH = os.path.join(os.getcwd(), "parser_feedback.json")
-MEMORY_PATH = os.path.join(os.getcwd(), "parser_memory.json")
-
-def _ensure_data_dir() -> None:
-    try:
-        os.makedirs(DATA_DIR, exist_ok=True)
-    except Exception:
-        pass
-
 def _load_json(path: str, default):
     try:
         with open(path, "r", encoding="utf-8") as f:
@@ -200,7 +94,7 @@ def _load_json(path: str, default):
 
 def _save_json(path: str, obj) -> None:
     try:
-        _ensure_data_dir()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
         with open(path, "w", encoding="utf-8") as f:
             json.dump(obj, f, indent=2, ensure_ascii=False)
     except Exception:
@@ -358,8 +252,9 @@ CM_TOKENS = {
 }
 
 # ──────────────────────────────────────────────────────────────────────────────
-# Pattern lists used by the auto-patcher
-# (Learning writes new raw regex rows directly into these lists)
+# Built-in pattern lists
+# (Learned rows live in data/learned_patterns.json, bucketed by list name, and
+#  are appended to these at parse time — see _with_learned)
 # ──────────────────────────────────────────────────────────────────────────────
 
 OXIDASE_PATTERNS = [
@@ -666,33 +561,88 @@ def _summarize_field_categories(db_fields: List[str]) -> Dict[str, List[str]]:
             cats["Other"].append(f)
     return cats
 
-def build_prompt_text(user_text: str, cats: Dict[str, List[str]], prior_facts=None) -> str:
-    prior = json.dumps(prior_facts or {}, indent=2)
-    morph = ", ".join(cats["Morphology"][:10])
-    enz = ", ".join(cats["Enzyme"][:10])
-    ferm = ", ".join(cats["Fermentation"][:10])
-    other = ", ".join(cats["Other"][:10])
+def build_system_prompt() -> str:
+    """
+    The static half of every request: instructions, full field catalog and
+    allowed values. Depends on nothing per-request, so the server can keep its
+    KV cache for this prefix across calls (see PROMPT_VERSION).
+    """
+    catalog = []
+    for f in sorted(ALLOWED_VALUES):
+        allowed = ALLOWED_VALUES[f]
+        catalog.append(f"- {f}: {' | '.join(sorted(allowed)) if allowed else 'free text'}")
     return (
-        "Parse the observation into JSON of microbiology fields. "
-        "Focus on morphology, enzyme tests, oxygen/growth, and media. "
-        "Fermentations can be left if ambiguous; we also apply rule-based parsing. "
-        "Return compact JSON with keys from the provided schema; unmentioned fields='Unknown'.\n"
-        f"Schema hints — Morphology: {morph}\n"
-        f"Enzyme: {enz}\n"
-        f"Fermentation: {ferm}\n"
-        f"Other: {other}\n\n"
-        f"Previous facts:\n{prior}\n\n"
-        f"Observation:\n{user_text}"
+        "You parse microbiology observations into JSON for the BactAI-D identifier.\n"
+        "Rules:\n"
+        "- Only include keys the observation actually states; omit everything else.\n"
+        "- Use exactly the field names and values listed below.\n"
+        "- Weak, trace or inconsistent reactions are 'Variable'.\n"
+        "- Fermentations can be left out if ambiguous; rule-based parsing also runs.\n"
+        "- Colony Morphology and Media Grown On are '; '-separated lists.\n"
+        "- Growth Temperature ranges are written low//high (e.g. 10//45).\n"
+        "Field catalog:\n" + "\n".join(catalog)
     )
 
+SYSTEM_PROMPT = build_system_prompt()
+PROMPT_VERSION = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+SYSTEM_PROMPT = f"[bactai-parser-prompt {PROMPT_VERSION}]\n" + SYSTEM_PROMPT
+
+def build_prompt_text(user_text: str, cats: Dict[str, List[str]], prior_facts=None, examples: str = "") -> str:
+    """
+    The per-request user message, sent after SYSTEM_PROMPT. `cats` should
+    already be trimmed to the fields plausible for this text; the observation
+    comes last so everything before it stays as reusable as possible.
+    """
+    prior = json.dumps(prior_facts or {}, separators=(",", ":"), sort_keys=True)
+    lines = [f"{name}: {', '.join(fs)}" for name, fs in cats.items() if fs]
+    parts = ["Fields to report — " + "\n".join(lines), f"Previous facts: {prior}"]
+    if examples:
+        parts.append("Past mistakes:" + examples)
+    parts.append(f"Observation:\n{user_text}")
+    return "\n\n".join(parts)
+
+def build_output_schema(fields: List[str]) -> Dict[str, object]:
+    """
+    JSON schema for Ollama's `format` parameter: one optional string property
+    per field, enum-constrained when ALLOWED_VALUES has a vocabulary for it.
+    """
+    props: Dict[str, object] = {}
+    for f in normalize_columns(fields):
+        allowed = ALLOWED_VALUES.get(f)
+        if allowed:
+            props[f] = {"type": "string", "enum": sorted(allowed) + ["Unknown"]}
+        else:
+            props[f] = {"type": "string"}
+    return {"type": "object", "properties": props, "additionalProperties": False}
+
+class _PatternBank(list):
+    """Pattern list that remembers its *_PATTERNS name (for regex_profiler)."""
+    name = ""
+
+def _with_learned(list_name: str, builtin: List[str], learned) -> List[str]:
+    """Built-in patterns for a list plus any learned ones stored under its name."""
+    bank = _PatternBank(builtin + [rx.pattern for _, rx in learned.get(list_name, ())])
+    bank.name = list_name
+    return bank
+
+# Opt-in per-pattern profiling (regex_profiler.enable_profiling); None = off
+_REGEX_PROFILER = None
+
+def _finditer(bank: str, pat: str, text: str, flags: int = re.I | re.S):
+    prof = _REGEX_PROFILER
+    if prof is None:
+        return re.finditer(pat, text, flags=flags)
+    return prof.finditer(bank, pat, text, flags)
+
 # Apply learned patterns
 def _apply_learned_patterns(field_name: str, patterns: List[str], text: str, tokens: List[str], out: Dict[str,str], alias: Dict[str,str]):
     key = alias.get(field_name.lower(), field_name)
     if not key:
         key = field_name
+    bank = getattr(patterns, "name", "") or field_name
     for pat in patterns:
         try:
-            for m in re.finditer(pat, text, flags=re.I|re.S):
+            for m in _finditer(bank, pat, text):
                 span = m.group(0).lower()
                 val = None
                 if re.search(r"\b(\+|positive|detected|produced)\b", span): val = "Positive"
@@ -704,7 +654,7 @@ def _apply_learned_patterns(field_name: str, patterns: List[str], text: str, tok
             continue
 
 # Fermentation extraction
-def extract_fermentations_regex(text: str, db_fields: List[str]) -> Dict[str, str]:
+def extract_fermentations_regex(text: str, db_fields: List[str], learned=None) -> Dict[str, str]:
     out: Dict[str, str] = {}
     t = normalize_text(text)
     fields = normalize_columns(db_fields)
@@ -713,6 +663,9 @@ def extract_fermentations_regex(text: str, db_fields: List[str]) -> Dict[str, st
     ferm_fields = [f for f in fields if f.lower().endswith(" fermentation")]
     base_to_field = {f[:-12].strip().lower(): f for f in ferm_fields}
 
+    if learned is None:
+        learned = get_learned_patterns().snapshot()
+
     def set_field_by_base(base: str, val: str):
         b = _normalize_token(base)
         if b in base_to_field:
@@ -720,9 +673,9 @@ def extract_fermentations_regex(text: str, db_fields: List[str]) -> Dict[str, st
         elif b in alias and alias[b] in fields:
             _set_field_safe(out, alias[b], _canon_value(alias[b], val))
 
-    for pat in FERMENTATION_PATTERNS:
+    for pat in _with_learned("FERMENTATION_PATTERNS", FERMENTATION_PATTERNS, learned):
         try:
-            for m in re.finditer(pat, t, flags=re.I|re.S):
+            for m in _finditer("FERMENTATION_PATTERNS", pat, t):
                 if m.lastindex and m.lastindex >= 1:
                     span = m.group(1)
                     if span:
@@ -766,7 +719,7 @@ def extract_fermentations_regex(text: str, db_fields: List[str]) -> Dict[str, st
     return out
 
 # Biochemical / morphology / oxygen / media extraction
-def extract_biochem_regex(text: str, db_fields: List[str]) -> Dict[str, str]:
+def extract_biochem_regex(text: str, db_fields: List[str], learned=None) -> Dict[str, str]:
     out: Dict[str, str] = {}
     raw = text or ""
     t = normalize_text(raw)
@@ -779,23 +732,25 @@ def extract_biochem_regex(text: str, db_fields: List[str]) -> Dict[str, str]:
         if target in fields:
             _set_field_safe(out, target, _canon_value(target, val))
 
-    _apply_learned_patterns("oxidase", OXIDASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("catalase", CATALASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("coagulase", COAGULASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("indole", INDOLE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("urease", UREASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("citrate", CITRATE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("methyl red", MR_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("vp", VP_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("h2s", H2S_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("nitrate reduction", NITRATE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("esculin hydrolysis", ESCULIN_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("dnase", DNASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("gelatin hydrolysis", GELATIN_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("lipase test", LIPASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("lysine decarboxylase", DECARBOXYLASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("ornithine decarboxylase", DECARBOXYLASE_PATTERNS, t, tokens, out, alias)
-    _apply_learned_patterns("arginine dihydrolase", DECARBOXYLASE_PATTERNS, t, tokens, out, alias)
+    if learned is None:
+        learned = get_learned_patterns().snapshot()
+    _apply_learned_patterns("oxidase", _with_learned("OXIDASE_PATTERNS", OXIDASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("catalase", _with_learned("CATALASE_PATTERNS", CATALASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("coagulase", _with_learned("COAGULASE_PATTERNS", COAGULASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("indole", _with_learned("INDOLE_PATTERNS", INDOLE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("urease", _with_learned("UREASE_PATTERNS", UREASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("citrate", _with_learned("CITRATE_PATTERNS", CITRATE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("methyl red", _with_learned("MR_PATTERNS", MR_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("vp", _with_learned("VP_PATTERNS", VP_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("h2s", _with_learned("H2S_PATTERNS", H2S_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("nitrate reduction", _with_learned("NITRATE_PATTERNS", NITRATE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("esculin hydrolysis", _with_learned("ESCULIN_PATTERNS", ESCULIN_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("dnase", _with_learned("DNASE_PATTERNS", DNASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("gelatin hydrolysis", _with_learned("GELATIN_PATTERNS", GELATIN_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("lipase test", _with_learned("LIPASE_PATTERNS", LIPASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("lysine decarboxylase", _with_learned("DECARBOXYLASE_PATTERNS", DECARBOXYLASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("ornithine decarboxylase", _with_learned("DECARBOXYLASE_PATTERNS", DECARBOXYLASE_PATTERNS, learned), t, tokens, out, alias)
+    _apply_learned_patterns("arginine dihydrolase", _with_learned("DECARBOXYLASE_PATTERNS", DECARBOXYLASE_PATTERNS, learned), t, tokens, out, alias)
 
     # Gram
     if re.search(r"\bgram[-\s]?positive\b", t) and not re.search(r"\bgram[-\s]?negative\b", t):
@@ -882,13 +837,15 @@ def extract_biochem_regex(text: str, db_fields: List[str]) -> Dict[str, str]:
 
     # Media detection (exclude TSI)
     collected_media: List[str] = []
-    candidate_media = set()
+    # Ordered (not a set): the joined value must not depend on PYTHONHASHSEED,
+    # or gold fingerprints differ between processes
+    candidate_media: Dict[str, None] = {}
     for name in ["blood", "macconkey", "xld", "nutrient", "tsa", "bhi", "cba", "ba", "ssa", "chocolate", "emb"]:
-        if re.search(rf"\b{name}\b", t): candidate_media.add(name)
+        if re.search(rf"\b{name}\b", t): candidate_media[name] = None
     for m in re.finditer(r"\b([a-z0-9\-\+ ]+)\s+agar\b", t):
         lowname = m.group(1).strip().lower()
         if not any(ex in lowname for ex in MEDIA_EXCLUDE_TERMS):
-            candidate_media.add(lowname + " agar")
+            candidate_media[lowname + " agar"] = None
 
     def canon_media(name: str) -> Optional[str]:
         if name in {"xld"}: return "XLD Agar"
@@ -972,54 +929,158 @@ def normalize_to_schema(parsed: Dict[str, str], db_fields: List[str]) -> Dict[st
 
     return out
 
-# MAIN: Parse (LLM + regex enrichment) → normalize
-def parse_input_free_text(
-    user_text: str,
-    prior_facts: Optional[Dict] = None,
-    db_fields: Optional[List[str]] = None
-) -> Dict:
-    if not (user_text and str(user_text).strip()):
-        return {}
-    db_fields = db_fields or []
-    cats = _summarize_field_categories(db_fields)
-
-    # Optional few-shot from feedback (last 5 failures)
-    feedback_examples = _load_json(FEEDBACK_PATH, [])
-    feedback_tail = feedback_examples[-5:] if feedback_examples else []
-    feedback_context = ""
-    for f in feedback_tail:
-        name = f.get("name","case")
-        txt = f.get("text","")
-        errs = f.get("errors", [])
-        feedback_context += f"\nExample failed: {name}\nInput: {txt}\nErrors: {errs}\n"
-
-    # LLM pass (Ollama). If fail → fallback_parser or regex-only path.
-    llm_parsed: Dict[str, str] = {}
-    try:
-        import ollama
-        prompt = build_prompt_text(
-            user_text + ("\n\nPast mistakes:\n" + feedback_context if feedback_context else ""),
-            cats,
-            prior_facts
-        )
-        model_name = os.getenv("LOCAL_MODEL", "deepseek-v3.1:671b")
-        out = ollama.chat(model=model_name, messages=[{"role": "user", "content": prompt}])
-        m = re.search(r"\{.*\}", out.get("message", {}).get("content", ""), re.S)
-        llm_parsed = json.loads(m.group(0)) if m else {}
-    except Exception:
-        if fallback_parser is not None:
-            try:
-                llm_parsed = fallback_parser(user_text, prior_facts, db_fields)
-            except Exception:
-                llm_parsed = {}
-        else:
-            llm_parsed = {}
+# ──────────────────────────────────────────────────────────────────────────────
+# Confidence gate: skip the LLM when regex already resolved every mention
+# ──────────────────────────────────────────────────────────────────────────────
+# Minimum share of mentioned fields the regex layer must resolve before the LLM
+# call is skipped. 1.0 = only skip on complete coverage; >1.0 = never skip.
+LLM_SKIP_COVERAGE = float(os.getenv("BACTAI_LLM_SKIP_COVERAGE", "1.0"))
+
+# Few-shot examples chosen by similarity from feedback (see feedback_index.py)
+FEW_SHOT_K = int(os.getenv("BACTAI_FEW_SHOT_K", "3"))
+FEW_SHOT_TOKEN_BUDGET = int(os.getenv("BACTAI_FEW_SHOT_TOKENS", "600"))
+
+# Hedging that makes a regex-only answer untrustworthy even at full coverage
+# (whole words only: "either" must not fire inside "neither")
+AMBIGUITY_CUES = [
+    r"\?", r"\bpossibly\b", r"\bprobably\b", r"\bmaybe\b", r"\bperhaps\b", r"\bunclear\b",
+    r"\buncertain\b", r"\bequivocal\b", r"\bquestionable\b", r"\bsuspected\b",
+    r"\binconclusive\b", r"\beither\b",
+]
+_AMBIGUITY_RE = re.compile("|".join(AMBIGUITY_CUES))
+
+# Keyword scan for fields the alias map can't see (morphology is mostly prose)
+MENTION_KEYWORDS: Dict[str, List[str]] = {
+    "Gram Stain": [r"\bgram\b", r"\bg[+\-]"],
+    "Shape": [r"\brods?\b", r"cocc(?:i|us)\b", r"\bbacill(?:i|us)\b", r"\bspiral\b", r"\bcoccobacill"],
+    "Motility": [r"\bmotil", r"\bnon[-\s]?motile\b"],
+    "Capsule": [r"\bcapsul", r"\bencapsulated\b"],
+    "Spore Formation": [r"\bspores?\b", r"\bspore[-\s]?forming\b"],
+    "Oxygen Requirement": [r"\baerob", r"\banaerob", r"\bfacultative\b", r"\bmicroaerophil", r"\bcapnophil", r"\bintracellular\b"],
+    "Haemolysis": [r"haemoly"],
+    "Haemolysis Type": [r"\b(?:alpha|beta|gamma|α|β|γ)[-\s]?haem"],
+    "Growth Temperature": [r"\d\s*°\s*c\b", r"\bgrows?\s+(?:well\s+)?at\s+\d"],
+    "Colony Morphology": [r"\bcolon(?:y|ies)\b"],
+    "Media Grown On": [r"\bagar\b"],
+    "NaCl Tolerant (>=6%)": [r"\bna\s*cl\b", r"\bsalt\b"],
+    "ONPG": [r"\bonpg\b"],
+    # Blanket statements ("non-fermenter", "ferments no sugars") answer the glucose test
+    "Glucose Fermentation": [r"\bnon[-\s]?fermente?r\b", r"\bferments?\s+(?:no\s+)?(?:carbohydrates|sugars)\b"],
+}
+
+def _new_gate_stats() -> Dict[str, object]:
+    return {"skipped": 0, "called": 0, "coverage_sum": 0.0, "reasons": {}, "last": None}
+
+
+def estimate_regex_coverage(
+    text: str,
+    resolved: Dict[str, str],
+    db_fields: List[str],
+    threshold: Optional[float] = None,
+) -> Dict[str, object]:
+    """
+    Compare the fields a text *mentions* (alias map + keyword scan) against the
+    fields the regex layer *resolved*. Returns a small report dict:
+      {"mentioned": [...], "resolved": [...], "missing": [...],
+       "coverage": float, "ambiguous": bool, "skip_llm": bool, "reason": str}
+    """
+    threshold = LLM_SKIP_COVERAGE if threshold is None else threshold
+    t = normalize_text(text)
+    fields = set(normalize_columns(db_fields))
+    alias = build_alias_map(db_fields)
+
+    mentioned: Set[str] = set()
+    for key, target in alias.items():
+        if target in fields and re.search(rf"(?<![a-z0-9]){re.escape(key)}(?![a-z0-9])", t):
+            mentioned.add(target)
+    for abbr, target in BIOCHEM_ABBR.items():
+        if target in fields and re.search(rf"\b{abbr}\b", t):
+            mentioned.add(target)
+    for target, pats in MENTION_KEYWORDS.items():
+        if target in fields and any(re.search(p, t) for p in pats):
+            mentioned.add(target)
+
+    got = {k for k, v in (resolved or {}).items() if v not in ("", None, "Unknown")}
+    missing = sorted(mentioned - got)
+    coverage = (len(mentioned) - len(missing)) / len(mentioned) if mentioned else 0.0
+    ambiguous = bool(_AMBIGUITY_RE.search(t))
+
+    if not mentioned:
+        reason = "no_mentions"
+    elif ambiguous:
+        reason = "ambiguous"
+    elif coverage < threshold:
+        reason = "incomplete"
+    else:
+        reason = "covered"
+
+    return {
+        "mentioned": sorted(mentioned),
+        "resolved": sorted(got),
+        "missing": missing,
+        "coverage": round(coverage, 3),
+        "ambiguous": ambiguous,
+        "skip_llm": reason == "covered",
+        "reason": reason,
+    }
 
-    # Regex enrichment
-    regex_ferm = extract_fermentations_regex(user_text, db_fields)
-    regex_bio  = extract_biochem_regex(user_text, db_fields)
 
-    # Merge (regex wins)
+# ──────────────────────────────────────────────────────────────────────────────
+# Tiered model routing: small model first, escalate to LOCAL_MODEL on doubt
+# ──────────────────────────────────────────────────────────────────────────────
+# SMALL_MODEL="" (or equal to LOCAL_MODEL) disables the small tier.
+LARGE_MODEL = os.getenv("LOCAL_MODEL", "deepseek-v3.1:671b")
+SMALL_MODEL = os.getenv("SMALL_MODEL", "gpt-oss:20b")
+# Keep models (and their cached SYSTEM_PROMPT prefix) resident between calls
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+def _new_tier_stats(small_model: str = SMALL_MODEL, large_model: str = LARGE_MODEL) -> Dict[str, object]:
+    def tier(model: str) -> Dict[str, object]:
+        return {
+            "model": model, "calls": 0, "errors": 0, "latency_sum": 0.0, "latency_max": 0.0,
+            "prompt_tokens": 0, "generated_tokens": 0,
+        }
+    return {
+        "small": tier(small_model),
+        "large": tier(large_model),
+        "escalations": 0,
+        "escalation_reasons": {},
+        "last_call": None,
+        "batch": {"requests": 0, "items": 0, "requeued": 0, "singles": 0, "escalated": 0, "budget_cuts": 0},
+    }
+
+
+def validate_llm_output(parsed: Dict[str, str], regex_resolved: Dict[str, str], db_fields: List[str]) -> List[str]:
+    """
+    Check a raw LLM answer against the schema and the regex layer.
+    Returns a list of problems like "bad_value:Oxidase" or "disagree:Indole";
+    empty list = answer is acceptable without escalation.
+    """
+    if not isinstance(parsed, dict):
+        return ["not_object"]
+    fields = normalize_columns(db_fields)
+    alias = build_alias_map(db_fields)
+    problems: List[str] = []
+    for k, v in parsed.items():
+        if v in ("", None, "Unknown") or not isinstance(v, str):
+            continue
+        key = str(k).strip()
+        target = key if key in fields else alias.get(key.lower())
+        if target not in fields:
+            problems.append(f"unknown_field:{key}")
+            continue
+        cv = _canon_value(target, v)
+        allowed = ALLOWED_VALUES.get(target)
+        if allowed and cv not in allowed:
+            problems.append(f"bad_value:{target}")
+        elif target in regex_resolved and regex_resolved[target] != cv:
+            problems.append(f"disagree:{target}")
+    return problems
+
+
+# MAIN: Parse (regex → gated LLM) → normalize
+def _merge_parse(prior_facts, llm_parsed, regex_ferm, regex_bio, db_fields: List[str]) -> Dict[str, str]:
+    # Merge (regex wins) into a new dict; prior_facts is never modified
     merged: Dict[str, str] = {}
     if prior_facts:
         merged.update(prior_facts)
@@ -1028,8 +1089,596 @@ def parse_input_free_text(
     merged.update(regex_bio)
 
     # Normalize
-    normalized = normalize_to_schema(merged, db_fields)
-    return normalized
+    return normalize_to_schema(merged, db_fields)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Batch parse: several observations per LLM request
+# ──────────────────────────────────────────────────────────────────────────────
+# Each request carries up to BATCH_MAX_ITEMS texts, packed until the estimated
+# prompt + answer size reaches BATCH_TOKEN_BUDGET. The answer is
+# {"items": [{"id": "t3", <fields>...}, ...]}. Items that come back missing or
+# fail validate_llm_output are split off and re-queued in smaller batches; a
+# lone failing item goes through route_llm_parse (small → large) like a
+# single parse. A request that errors outright halves the budget for the rest
+# of the call.
+BATCH_TOKEN_BUDGET = int(os.getenv("BACTAI_BATCH_TOKENS", "4000"))
+BATCH_MAX_ITEMS = int(os.getenv("BACTAI_BATCH_MAX_ITEMS", "16"))
+_BATCH_OVERHEAD_TOKENS = 80
+_ANSWER_TOKENS_PER_FIELD = 8
+
+def build_batch_prompt_text(items: List[Dict[str, object]], prior_facts=None) -> str:
+    """
+    One user message for several observations. Each item lists its own
+    plausible fields and must be answered under its id.
+    """
+    prior = json.dumps(prior_facts or {}, separators=(",", ":"), sort_keys=True)
+    parts = [
+        "Parse each observation independently. Answer with one entry per id in "
+        "\"items\"; include only the fields listed for that observation.",
+        f"Previous facts (apply to every observation): {prior}",
+    ]
+    for it in items:
+        block = [f"[{it['id']}] Fields: {', '.join(it['fields'])}"]
+        if it.get("examples"):
+            block.append("Past mistakes:" + str(it["examples"]))
+        block.append(f"Observation:\n{it['text']}")
+        parts.append("\n".join(block))
+    return "\n\n".join(parts)
+
+def build_batch_output_schema(items: List[Dict[str, object]]) -> Dict[str, object]:
+    """Array-of-objects schema: per-item id plus the union of the items' fields."""
+    fields = sorted({f for it in items for f in it["fields"]})
+    entry = build_output_schema(fields)
+    entry["properties"] = dict(entry["properties"], id={"type": "string", "enum": [it["id"] for it in items]})
+    entry["required"] = ["id"]
+    return {
+        "type": "object",
+        "properties": {"items": {"type": "array", "items": entry}},
+        "required": ["items"],
+        "additionalProperties": False,
+    }
+
+def _estimate_item_tokens(item: Dict[str, object]) -> int:
+    prompt = estimate_tokens(str(item["text"]) + str(item.get("examples", ""))) + 4 * len(item["fields"]) + 10
+    return prompt + _ANSWER_TOKENS_PER_FIELD * len(item["fields"])
+
+def _pack_batches(items: List[Dict[str, object]], budget: int, max_items: int) -> List[List[Dict[str, object]]]:
+    """Greedy, order-preserving packing under the token budget (≥1 item per batch)."""
+    batches: List[List[Dict[str, object]]] = []
+    cur: List[Dict[str, object]] = []
+    used = _BATCH_OVERHEAD_TOKENS
+    for it in items:
+        cost = it["tokens"]
+        if cur and (used + cost > budget or len(cur) >= max_items):
+            batches.append(cur)
+            cur, used = [], _BATCH_OVERHEAD_TOKENS
+        cur.append(it)
+        used += cost
+    if cur:
+        batches.append(cur)
+    return batches
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Parser: one configuration + its stores, client and stats
+# ──────────────────────────────────────────────────────────────────────────────
+_USE_BASIC = object()  # Parser(fallback=...) default: parser_basic if importable
+
+def _basic_fallback():
+    try:
+        from parser_basic import parse_input_free_text as basic_parse
+        return basic_parse
+    except Exception:
+        return None
+
+class Parser:
+    """
+    Owns everything a parse depends on: data paths (under base_dir), models and
+    gate/few-shot/batch settings, the feedback log and learned-pattern store,
+    an Ollama client, and its gate/tier stats. Stats are guarded by an
+    instance lock and "last parse" info is per thread, so one Parser can be
+    shared by a thread pool. Arguments left as None take the env defaults above.
+    """
+
+    def __init__(
+        self,
+        base_dir: Optional[str] = None,
+        *,
+        large_model: Optional[str] = None,
+        small_model: Optional[str] = None,
+        keep_alive: Optional[str] = None,
+        host: Optional[str] = None,
+        api_key: Optional[str] = None,
+        skip_coverage: Optional[float] = None,
+        few_shot_k: Optional[int] = None,
+        few_shot_tokens: Optional[int] = None,
+        batch_tokens: Optional[int] = None,
+        batch_max_items: Optional[int] = None,
+        fallback=_USE_BASIC,
+    ):
+        self.base_dir = os.path.abspath(base_dir or os.getcwd())
+        self.data_dir = os.path.join(self.base_dir, "data")
+        self.gold_tests_path = os.path.join(self.base_dir, "gold_tests.json")
+        self.memory_path = os.path.join(self.base_dir, "parser_memory.json")
+        # Append-only feedback log; the legacy JSON is only read once, for migration
+        self.feedback_dir = os.path.join(self.data_dir, "feedback")
+        self.legacy_feedback_path = os.path.join(self.base_dir, "parser_feedback.json")
+        # Learned regex (extends the built-in *_PATTERNS lists at parse time)
+        self.patterns_path = os.path.join(self.data_dir, "learned_patterns.json")
+
+        self.large_model = LARGE_MODEL if large_model is None else large_model
+        self.small_model = SMALL_MODEL if small_model is None else small_model
+        self.keep_alive = OLLAMA_KEEP_ALIVE if keep_alive is None else keep_alive
+        self.host = host or _setting("OLLAMA_HOST")
+        self.api_key = api_key or _setting("OLLAMA_API_KEY")
+        self.skip_coverage = LLM_SKIP_COVERAGE if skip_coverage is None else skip_coverage
+        self.few_shot_k = FEW_SHOT_K if few_shot_k is None else few_shot_k
+        self.few_shot_tokens = FEW_SHOT_TOKEN_BUDGET if few_shot_tokens is None else few_shot_tokens
+        self.batch_tokens = BATCH_TOKEN_BUDGET if batch_tokens is None else batch_tokens
+        self.batch_max_items = BATCH_MAX_ITEMS if batch_max_items is None else batch_max_items
+        self._fallback = fallback
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._gate_stats = _new_gate_stats()
+        self._tier_stats = _new_tier_stats(self.small_model, self.large_model)
+        self._local = threading.local()
+
+    @property
+    def fallback(self):
+        """Parse function used when the LLM fails (parser_basic's, imported on first use)."""
+        if self._fallback is _USE_BASIC:
+            self._fallback = _basic_fallback()
+        return self._fallback
+
+    # ── stores ──────────────────────────────────────────────────────────────
+    def feedback_log(self) -> FeedbackStore:
+        """Shared feedback log (imports the legacy parser_feedback.json on first use)."""
+        return get_feedback_store(self.feedback_dir, legacy_path=self.legacy_feedback_path)
+
+    def learned_patterns(self) -> PatternStore:
+        """Shared learned-pattern store (re-read automatically when the file changes)."""
+        return get_pattern_store(self.patterns_path)
+
+    # ── regex stage + gate ──────────────────────────────────────────────────
+    def regex_stage(self, user_text: str, db_fields: List[str]) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+        """Deterministic regex pass: (fermentations, biochem, normalized union)."""
+        learned = self.learned_patterns().snapshot()
+        regex_ferm = extract_fermentations_regex(user_text, db_fields, learned)
+        regex_bio  = extract_biochem_regex(user_text, db_fields, learned)
+        return regex_ferm, regex_bio, normalize_to_schema({**regex_ferm, **regex_bio}, db_fields)
+
+    def estimate_coverage(self, text: str, resolved: Dict[str, str], db_fields: List[str]) -> Dict[str, object]:
+        return estimate_regex_coverage(text, resolved, db_fields, self.skip_coverage)
+
+    def stage(self, user_text: str, db_fields: List[str]) -> Dict[str, object]:
+        """
+        Regex stage + gate as one picklable dict ("ferm", "bio", "regex",
+        "gate"). Callers that already ran it (gold_test_runner's process pool)
+        hand it back to parse()/parse_batch() via `staged` to skip the rerun.
+        """
+        regex_ferm, regex_bio, regex_only = self.regex_stage(user_text, db_fields)
+        gate = self.estimate_coverage(user_text, regex_only, db_fields)
+        return {"ferm": regex_ferm, "bio": regex_bio, "regex": regex_only, "gate": gate}
+
+    def record_gate(self, report: Dict[str, object]) -> None:
+        key = "skipped" if report["skip_llm"] else "called"
+        with self._lock:
+            stats = self._gate_stats
+            stats[key] = int(stats[key]) + 1
+            stats["coverage_sum"] = float(stats["coverage_sum"]) + float(report["coverage"])
+            reasons = stats["reasons"]
+            reasons[report["reason"]] = reasons.get(report["reason"], 0) + 1
+            stats["last"] = report
+
+    def gate_stats(self) -> Dict[str, object]:
+        """Snapshot of skip/call counters (plus skip rate and mean coverage)."""
+        with self._lock:
+            stats = self._gate_stats
+            skipped, called = int(stats["skipped"]), int(stats["called"])
+            coverage_sum, reasons = float(stats["coverage_sum"]), dict(stats["reasons"])
+        total = skipped + called
+        return {
+            "skipped": skipped,
+            "called": called,
+            "skip_rate": round(skipped / total, 3) if total else 0.0,
+            "mean_coverage": round(coverage_sum / total, 3) if total else 0.0,
+            "reasons": reasons,
+            "threshold": self.skip_coverage,
+        }
+
+    def reset_gate_stats(self) -> None:
+        with self._lock:
+            self._gate_stats = _new_gate_stats()
+
+    # ── LLM calls ───────────────────────────────────────────────────────────
+    def _ollama(self):
+        """This Parser's ollama.Client (created on first LLM call; safe to share across threads)."""
+        if self._client is None:
+            import ollama
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+            with self._lock:
+                if self._client is None:
+                    self._client = ollama.Client(host=self.host, headers=headers)
+        return self._client
+
+    def _chat_json(self, model: str, prompt: str, schema: Dict[str, object]) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """
+        One structured-output chat call: static SYSTEM_PROMPT first, per-request
+        prompt last. Returns (parsed JSON object, token usage).
+        """
+        out = self._ollama().chat(
+            model=model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            format=schema,
+            options={"temperature": 0},
+            keep_alive=self.keep_alive,
+        )
+        usage = {
+            "prompt_tokens": int(out.get("prompt_eval_count") or 0),
+            "generated_tokens": int(out.get("eval_count") or 0),
+        }
+        parsed = json.loads(out.get("message", {}).get("content", "") or "{}")
+        if not isinstance(parsed, dict):
+            raise ValueError("structured output was not a JSON object")
+        return parsed, usage
+
+    def _timed_tier_call(self, tier: str, model: str, prompt: str, schema: Dict[str, object]) -> Dict[str, str]:
+        t0 = time.perf_counter()
+        usage: Optional[Dict[str, int]] = None
+        try:
+            parsed, usage = self._chat_json(model, prompt, schema)
+            return parsed
+        finally:
+            dt = time.perf_counter() - t0
+            with self._lock:
+                stats = self._tier_stats[tier]
+                stats["calls"] += 1
+                stats["latency_sum"] += dt
+                stats["latency_max"] = max(stats["latency_max"], dt)
+                if usage is None:
+                    stats["errors"] += 1
+                else:
+                    stats["prompt_tokens"] += usage["prompt_tokens"]
+                    stats["generated_tokens"] += usage["generated_tokens"]
+                    self._tier_stats["last_call"] = {"tier": tier, "model": model, "prompt_version": PROMPT_VERSION, **usage}
+
+    def route_llm_parse(
+        self,
+        prompt: str,
+        regex_resolved: Dict[str, str],
+        db_fields: List[str],
+        schema: Optional[Dict[str, object]] = None,
+    ) -> Dict[str, str]:
+        """
+        Ask the small model first; keep its answer when it validates cleanly
+        against ALLOWED_VALUES and agrees with regex. Otherwise escalate to the
+        large model. Errors from the large tier propagate so callers can fall back.
+        """
+        schema = schema or build_output_schema(db_fields)
+        if self.small_model and self.small_model != self.large_model:
+            try:
+                parsed = self._timed_tier_call("small", self.small_model, prompt, schema)
+                problems = validate_llm_output(parsed, regex_resolved, db_fields)
+                reason = problems[0].split(":")[0] if problems else ""
+            except Exception:
+                reason = "error"
+            if not reason:
+                return parsed
+            with self._lock:
+                self._tier_stats["escalations"] += 1
+                reasons = self._tier_stats["escalation_reasons"]
+                reasons[reason] = reasons.get(reason, 0) + 1
+        return self._timed_tier_call("large", self.large_model, prompt, schema)
+
+    def routing_stats(self) -> Dict[str, object]:
+        """Per-tier call counts and latency, plus the small→large escalation rate."""
+        out: Dict[str, object] = {}
+        with self._lock:
+            stats = self._tier_stats
+            for tier in ("small", "large"):
+                st_ = stats[tier]
+                calls = st_["calls"]
+                out[tier] = {
+                    "model": st_["model"],
+                    "calls": calls,
+                    "errors": st_["errors"],
+                    "mean_latency_s": round(st_["latency_sum"] / calls, 3) if calls else 0.0,
+                    "max_latency_s": round(st_["latency_max"], 3),
+                    "prompt_tokens": st_["prompt_tokens"],
+                    "generated_tokens": st_["generated_tokens"],
+                }
+            small_calls = stats["small"]["calls"]
+            out["escalations"] = stats["escalations"]
+            out["escalation_rate"] = round(stats["escalations"] / small_calls, 3) if small_calls else 0.0
+            out["escalation_reasons"] = dict(stats["escalation_reasons"])
+            out["last_call"] = stats["last_call"]
+            out["batch"] = dict(stats["batch"])
+        out["prompt_version"] = PROMPT_VERSION
+        return out
+
+    def reset_routing_stats(self) -> None:
+        with self._lock:
+            self._tier_stats = _new_tier_stats(self.small_model, self.large_model)
+
+    # ── parsing ─────────────────────────────────────────────────────────────
+    def last_parse_info(self) -> Dict[str, object]:
+        """{"llm": "skipped"|"ok"|"error", "coverage": float} for this thread's last parse."""
+        return dict(getattr(self._local, "info", {}))
+
+    def last_batch_info(self) -> List[Dict[str, object]]:
+        """Per-text {"llm": "skipped"|"ok"|"error", "coverage", "mode"} for this thread's last batch."""
+        return [dict(i) for i in getattr(self._local, "batch", [])]
+
+    def _fallback_parse(self, text: str, prior_facts, db_fields: List[str]) -> Dict[str, str]:
+        fallback = self.fallback
+        if fallback is None:
+            return {}
+        try:
+            return fallback(text, dict(prior_facts or {}), db_fields) or {}
+        except Exception:
+            return {}
+
+    def parse(
+        self,
+        user_text: str,
+        prior_facts: Optional[Dict] = None,
+        db_fields: Optional[List[str]] = None,
+        staged: Optional[Dict[str, object]] = None,
+    ) -> Dict:
+        """
+        Regex → gated LLM (→ fallback) → normalize. prior_facts is read, never
+        modified. `staged` is this text's stage() result, if already computed.
+        """
+        if not (user_text and str(user_text).strip()):
+            return {}
+        db_fields = db_fields or []
+
+        # Regex enrichment (runs first so the gate can judge its coverage)
+        staged = staged or self.stage(user_text, db_fields)
+        regex_ferm, regex_bio, regex_only, gate = staged["ferm"], staged["bio"], staged["regex"], staged["gate"]
+        self.record_gate(gate)
+        info = {"llm": "skipped" if gate["skip_llm"] else "ok", "coverage": gate["coverage"]}
+        self._local.info = info
+
+        # LLM pass (Ollama). If fail → fallback parser or regex-only path.
+        llm_parsed: Dict[str, str] = {}
+        if not gate["skip_llm"]:
+            # Few-shot: the past failures most similar to this text, within budget
+            feedback_context = get_feedback_index(self.feedback_log()).select(
+                user_text, k=self.few_shot_k, token_budget=self.few_shot_tokens
+            )
+
+            # Only ask about fields the text plausibly mentions (all fields if none detected)
+            plausible = gate["mentioned"] or normalize_columns(db_fields)
+            try:
+                prompt = build_prompt_text(
+                    user_text,
+                    _summarize_field_categories(plausible),
+                    prior_facts,
+                    examples=feedback_context,
+                )
+                llm_parsed = self.route_llm_parse(prompt, regex_only, db_fields, build_output_schema(plausible))
+            except Exception:
+                info["llm"] = "error"
+                llm_parsed = self._fallback_parse(user_text, prior_facts, db_fields)
+
+        return _merge_parse(prior_facts, llm_parsed, regex_ferm, regex_bio, db_fields)
+
+    def _batch_model(self) -> Tuple[str, str]:
+        if self.small_model and self.small_model != self.large_model:
+            return "small", self.small_model
+        return "large", self.large_model
+
+    def _bump_batch_stats(self, **deltas: int) -> None:
+        with self._lock:
+            stats = self._tier_stats["batch"]
+            for k, v in deltas.items():
+                stats[k] += v
+
+    def _run_llm_batches(self, items: List[Dict[str, object]], db_fields: List[str], prior_facts, budget: int, max_items: int) -> None:
+        """
+        Fill item["llm"] (parsed dict) or item["error"] for every item. Only
+        items missing from an answer or failing the schema are split and
+        re-queued; an answer that merely disagrees with regex goes straight
+        to the large model, as route_llm_parse would escalate it.
+        """
+        tier, model = self._batch_model()
+        queue = _pack_batches(items, budget, max_items)
+
+        def single_prompt(it: Dict[str, object]) -> str:
+            return build_prompt_text(
+                it["text"], _summarize_field_categories(it["fields"]), prior_facts, examples=str(it.get("examples", ""))
+            )
+
+        while queue:
+            batch = queue.pop(0)
+            if len(batch) == 1:
+                it = batch[0]
+                self._bump_batch_stats(singles=1)
+                it["via"] = "single"
+                try:
+                    it["llm"] = self.route_llm_parse(single_prompt(it), it["regex"], db_fields, build_output_schema(it["fields"]))
+                except Exception as e:
+                    it["error"] = e
+                continue
+
+            self._bump_batch_stats(requests=1, items=len(batch))
+            try:
+                answer = self._timed_tier_call(
+                    tier, model, build_batch_prompt_text(batch, prior_facts), build_batch_output_schema(batch)
+                )
+                entries = answer.get("items")
+                if not isinstance(entries, list):
+                    raise ValueError("batch answer has no items array")
+            except Exception:
+                # Likely too big (truncated JSON / timeout): split this one and
+                # re-pack everything still queued under half the budget
+                budget = max(_BATCH_OVERHEAD_TOKENS + 1, budget // 2)
+                self._bump_batch_stats(budget_cuts=1, requeued=len(batch))
+                half = len(batch) // 2
+                rest = [it for b in queue for it in b]
+                queue = [batch[:half], batch[half:]] + _pack_batches(rest, budget, max_items)
+                continue
+
+            by_id = {str(e.get("id")): e for e in entries if isinstance(e, dict)}
+            failed: List[Dict[str, object]] = []
+            for it in batch:
+                ans = by_id.get(it["id"])
+                if ans is None:
+                    failed.append(it)
+                    continue
+                ans = {k: v for k, v in ans.items() if k in it["fields"]}
+                problems = validate_llm_output(ans, it["regex"], db_fields)
+                if any(not p.startswith("disagree:") for p in problems):
+                    failed.append(it)
+                elif problems and tier == "small":
+                    self._escalate_item(it, single_prompt(it), problems[0].split(":")[0])
+                else:
+                    it["llm"] = ans
+            if failed:
+                self._bump_batch_stats(requeued=len(failed))
+                half = max(1, len(failed) // 2)
+                queue[:0] = [b for b in (failed[:half], failed[half:]) if b]
+
+    def _escalate_item(self, it: Dict[str, object], prompt: str, reason: str) -> None:
+        """Large-model single call for a batch item whose small answer disagreed with regex."""
+        self._bump_batch_stats(escalated=1)
+        it["via"] = "escalated"
+        with self._lock:
+            self._tier_stats["escalations"] += 1
+            reasons = self._tier_stats["escalation_reasons"]
+            reasons[reason] = reasons.get(reason, 0) + 1
+        try:
+            it["llm"] = self._timed_tier_call("large", self.large_model, prompt, build_output_schema(it["fields"]))
+        except Exception as e:
+            it["error"] = e
+
+    def parse_batch(
+        self,
+        texts: List[str],
+        prior_facts: Optional[Dict] = None,
+        db_fields: Optional[List[str]] = None,
+        token_budget: Optional[int] = None,
+        max_items: Optional[int] = None,
+        staged: Optional[List[Optional[Dict[str, object]]]] = None,
+    ) -> List[Dict]:
+        """
+        Same output as [self.parse(t, prior_facts, db_fields) for t in texts],
+        with the LLM pass for all texts that need it packed into as few
+        requests as the token budget allows. Order is preserved. `staged`
+        (aligned with texts) carries stage() results already computed.
+        """
+        db_fields = db_fields or []
+        results: List[Dict] = [{} for _ in texts]
+        infos: List[Dict[str, object]] = [{"llm": "skipped", "coverage": 0.0, "mode": "empty"} for _ in texts]
+        merged: Dict[int, Tuple[Dict[str, str], Dict[str, str]]] = {}
+        pending: List[Dict[str, object]] = []
+        index = get_feedback_index(self.feedback_log())
+
+        for i, text in enumerate(texts):
+            if not (text and str(text).strip()):
+                continue
+            st = (staged[i] if staged else None) or self.stage(text, db_fields)
+            regex_ferm, regex_bio, regex_only, gate = st["ferm"], st["bio"], st["regex"], st["gate"]
+            self.record_gate(gate)
+            merged[i] = (regex_ferm, regex_bio)
+            infos[i] = {"llm": "skipped" if gate["skip_llm"] else "ok", "coverage": gate["coverage"], "mode": "regex"}
+            if gate["skip_llm"]:
+                continue
+            item = {
+                "id": f"t{i}",
+                "pos": i,
+                "text": str(text),
+                "fields": gate["mentioned"] or normalize_columns(db_fields),
+                "regex": regex_only,
+                "examples": index.select(text, k=1, token_budget=self.few_shot_tokens // 3),  # one short example per item
+            }
+            item["tokens"] = _estimate_item_tokens(item)
+            pending.append(item)
+
+        if pending:
+            self._run_llm_batches(
+                pending, db_fields, prior_facts,
+                token_budget or self.batch_tokens, max(1, max_items or self.batch_max_items),
+            )
+
+        llm_by_pos: Dict[int, Dict[str, str]] = {}
+        for it in pending:
+            pos = int(it["pos"])
+            if "llm" in it:
+                llm_by_pos[pos] = it["llm"]
+                infos[pos]["mode"] = it.get("via", "batch")
+                continue
+            infos[pos]["llm"] = "error"
+            llm_by_pos[pos] = self._fallback_parse(it["text"], prior_facts, db_fields)
+
+        for i, (regex_ferm, regex_bio) in merged.items():
+            results[i] = _merge_parse(prior_facts, llm_by_pos.get(i), regex_ferm, regex_bio, db_fields)
+        self._local.batch = infos
+        return results
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Module-level API: the process-wide default Parser
+# ──────────────────────────────────────────────────────────────────────────────
+_DEFAULT_PARSER: Optional[Parser] = None
+_DEFAULT_PARSER_LOCK = threading.Lock()
+
+def default_parser() -> Parser:
+    """Parser behind the module-level functions (created on first use, from the cwd)."""
+    global _DEFAULT_PARSER
+    if _DEFAULT_PARSER is None:
+        with _DEFAULT_PARSER_LOCK:
+            if _DEFAULT_PARSER is None:
+                _DEFAULT_PARSER = Parser()
+    return _DEFAULT_PARSER
+
+def get_feedback_log() -> FeedbackStore:
+    return default_parser().feedback_log()
+
+def get_learned_patterns() -> PatternStore:
+    return default_parser().learned_patterns()
+
+def _record_gate_decision(report: Dict[str, object]) -> None:
+    default_parser().record_gate(report)
+
+def get_llm_gate_stats() -> Dict[str, object]:
+    return default_parser().gate_stats()
+
+def reset_llm_gate_stats() -> None:
+    default_parser().reset_gate_stats()
+
+def route_llm_parse(prompt: str, regex_resolved: Dict[str, str], db_fields: List[str], schema: Optional[Dict[str, object]] = None) -> Dict[str, str]:
+    return default_parser().route_llm_parse(prompt, regex_resolved, db_fields, schema)
+
+def get_llm_routing_stats() -> Dict[str, object]:
+    return default_parser().routing_stats()
+
+def reset_llm_routing_stats() -> None:
+    default_parser().reset_routing_stats()
+
+def get_last_parse_info() -> Dict[str, object]:
+    return default_parser().last_parse_info()
+
+def get_last_batch_info() -> List[Dict[str, object]]:
+    return default_parser().last_batch_info()
+
+def regex_stage(user_text: str, db_fields: List[str]) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, str]]:
+    return default_parser().regex_stage(user_text, db_fields)
+
+def parse_input_free_text(user_text: str, prior_facts: Optional[Dict] = None, db_fields: Optional[List[str]] = None) -> Dict:
+    return default_parser().parse(user_text, prior_facts, db_fields)
+
+def parse_batch_free_text(
+    texts: List[str],
+    prior_facts: Optional[Dict] = None,
+    db_fields: Optional[List[str]] = None,
+    token_budget: Optional[int] = None,
+    max_items: Optional[int] = None,
+) -> List[Dict]:
+    return default_parser().parse_batch(texts, prior_facts, db_fields, token_budget, max_items)
 
 # WHAT-IF helper
 def apply_what_if(user_text: str, prior_result: Dict[str, str], db_fields: List[str]) -> Dict[str, str]:
@@ -1058,31 +1707,10 @@ def apply_what_if(user_text: str, prior_result: Dict[str, str], db_fields: List[
     return prior_result
 
 # GOLD TESTS
-def _diff_for_feedback(expected: Dict[str,str], got: Dict[str,str]) -> List[Dict[str,str]]:
-    diffs = []
-    for k, exp in expected.items():
-        g = got.get(k, None)
-        if g is None:
-            diffs.append({"field": k, "expected": exp, "got": ""})
-        elif str(g) != str(exp):
-            diffs.append({"field": k, "expected": exp, "got": g})
-    return diffs
-
-def _log_feedback_case(name: str, text: str, diffs: List[Dict[str,str]]):
-    if not diffs:
-        return
-    feedback = _load_json(FEEDBACK_PATH, [])
-    feedback.append({
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "name": name,
-        "text": text,
-        "errors": diffs
-    })
-    _save_json(FEEDBACK_PATH, feedback)
-
-def run_gold_tests(db_fields: Optional[List[str]] = None) -> Tuple[int,int]:
+def run_gold_tests(db_fields: Optional[List[str]] = None, full: bool = False, parser: Optional[Parser] = None) -> Tuple[int,int]:
     print("Running Gold Tests...")
-    tests = _load_json(GOLD_TESTS_PATH, [])
+    parser = parser or default_parser()
+    tests = _load_json(parser.gold_tests_path, [])
     if not tests:
         print("No gold_tests.json found or file empty. Skipping.")
         return (0, 0)
@@ -1097,50 +1725,62 @@ def run_gold_tests(db_fields: Optional[List[str]] = None) -> Tuple[int,int]:
             "Sorbitol Fermentation","Maltose Fermentation","Arabinose Fermentation","Raffinose Fermentation","Inositol Fermentation","Trehalose Fermentation","Coagulase"
         ]
 
-    total, passed = 0, 0
-    for case in tests:
-        total += 1
-        name = case.get("name", f"case_{total}")
-        input_text = case.get("input", "")
-        expected_raw = case.get("expected", {})
-
-        expected = {k: v for k, v in expected_raw.items() if k in db_fields}
-
-        got = parse_input_free_text(input_text, db_fields=db_fields)
-        diffs = _diff_for_feedback(expected, got)
-        ok = (not diffs)
-
-        if ok:
-            passed += 1
-            print(f"✅ {name} passed.")
-        else:
-            print(f"❌ {name} failed.")
-            for d in diffs[:10]:
-                print(f"   - {d['field']}: expected '{d['expected']}' got '{d['got']}'")
-            _log_feedback_case(name, input_text, diffs)
-
-    print(f"Gold Tests: {passed}/{total} passed.")
+    # Incremental: only cases whose fingerprint changed hit the parser (--full re-runs all).
+    # The suite runs on `parser` (so stats are right under `python parser_llm.py --test`).
+    from gold_test_runner import run_gold_suite
+    parser.reset_gate_stats()
+    parser.reset_routing_stats()
+    report = run_gold_suite(tests, db_fields, full=full, parser=parser)
+    passed, total = report["passed"], report["total"]
+    skipped_failed = sum(1 for r in report["results"] if not r["ok"] and not r["cached"] and r["backend"] == "Regex")
+
+    print(f"Gold Tests: {passed}/{total} passed ({report['ran']} run, {report['cached']} cached, "
+          f"{report['seconds']}s).")
+    stats = parser.gate_stats()
+    print(
+        f"LLM gate (threshold {stats['threshold']}): skipped {stats['skipped']}, called {stats['called']}, "
+        f"mean coverage {stats['mean_coverage']}, skipped-but-failed {skipped_failed}, reasons {stats['reasons']}"
+    )
+    routing = parser.routing_stats()
+    for tier in ("small", "large"):
+        r = routing[tier]
+        print(f"LLM tier {tier} ({r['model']}): {r['calls']} calls, {r['errors']} errors, "
+              f"mean {r['mean_latency_s']}s, max {r['max_latency_s']}s, "
+              f"tokens prompt {r['prompt_tokens']} / generated {r['generated_tokens']}")
+    print(f"Escalation rate: {routing['escalation_rate']} {routing['escalation_reasons']}")
+    b = routing["batch"]
+    if b["requests"] or b["singles"]:
+        print(f"LLM batches: {b['requests']} requests for {b['items']} items, {b['requeued']} re-queued, "
+              f"{b['singles']} single calls, {b['escalated']} escalated to large, {b['budget_cuts']} budget cuts")
     return (passed, total)
 
 # 🧠 Self-learning: analyze feedback → memory
-def analyze_feedback_and_learn(feedback_path=FEEDBACK_PATH, memory_path=MEMORY_PATH):
-    feedback = _load_json(feedback_path, [])
-    if not feedback:
+def analyze_feedback_and_learn(feedback_log: Optional[FeedbackStore] = None, memory_path: Optional[str] = None):
+    """
+    Fold feedback appended since the last run into the persisted counters in
+    parser_memory.json, then derive auto_heuristics from the running totals.
+    """
+    if feedback_log is None:  # an empty FeedbackStore is falsy (__len__)
+        feedback_log = get_feedback_log()
+    memory_path = memory_path or default_parser().memory_path
+    memory = _load_json(memory_path, {})
+    new_cases = fold_feedback_counters(memory, feedback_log, "parser_llm")
+    field_counts = memory["feedback_counters"]["fields"]
+    if not new_cases:
+        if field_counts:
+            print("🧠 No new feedback since last learning pass.")
         return
 
-    memory = _load_json(memory_path, {})
     history = memory.get("history", [])
-    field_counts = {}
     suggestions = []
 
-    for case in feedback:
+    for case in new_cases:
         for err in case.get("errors", []):
             field = err.get("field")
             got = (err.get("got") or "").lower()
             exp = (err.get("expected") or "").lower()
             if not field:
                 continue
-            field_counts[field] = field_counts.get(field, 0) + 1
             sim = difflib.SequenceMatcher(None, got, exp).ratio()
             if sim < 0.6:
                 suggestions.append(f"Consider adjusting pattern for '{field}' — often parsed '{got}' instead of '{exp}'")
@@ -1153,15 +1793,16 @@ def analyze_feedback_and_learn(feedback_path=FEEDBACK_PATH, memory_path=MEMORY_P
 
     history.append({
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "new_cases": len(new_cases),
         "top_error_fields": sorted(field_counts.items(), key=lambda x: -x[1])[:10],
         "suggestions": suggestions[:20]
     })
     memory["history"] = history
     memory["auto_heuristics"] = auto_heuristics
     _save_json(memory_path, memory)
-    print(f"🧠 Learned hints for {len(auto_heuristics)} fields; updated memory.")
+    print(f"🧠 Learned hints for {len(auto_heuristics)} fields from {len(new_cases)} new cases; updated memory.")
 
-# Utilities for autopatcher
+# Utilities for pattern learning
 def _escape_for_raw_regex(text: str) -> str:
     """
     Convert a human-ish term (possibly with spaces) into a safe raw-regex token.
@@ -1172,78 +1813,30 @@ def _escape_for_raw_regex(text: str) -> str:
     text = re.sub(r"\s+", r"\\s+", text.strip())
     return text
 
-def _dedupe_keep_order(seq: List[str]) -> List[str]:
-    seen = set()
-    out = []
-    for s in seq:
-        if s not in seen:
-            out.append(s); seen.add(s)
-    return out
-
-def _pattern_exists(existing_list: List[str], candidate: str) -> bool:
-    return candidate in existing_list
-
 def auto_commit_changes():
     """
-    Commit and push parser updates safely on Streamlit Cloud using HTTPS + token.
-    Requires env (or st.secrets bridged to env):
-      GH_TOKEN, GITHUB_REPO, [GIT_BRANCH], GIT_USER_NAME, GIT_USER_EMAIL
+    Queue learned state for the background git sync worker (git_sync.py).
+    Returns immediately; the worker debounces, commits once per batch and
+    pushes using GH_TOKEN / GITHUB_REPO / GIT_BRANCH / GIT_USER_* from env.
+    Anything still pending when a CLI run exits is flushed by git_sync's
+    atexit hook.
     """
-    try:
-        gh_token  = os.getenv("GH_TOKEN", "").strip()
-        repo_slug = os.getenv("GITHUB_REPO", "").strip()  # e.g. "EphraimAsad/BacAi-D-Dev"
-        branch    = os.getenv("GIT_BRANCH", "main").strip()
-        user_name = os.getenv("GIT_USER_NAME", "auto-learner").strip()
-        user_email= os.getenv("GIT_USER_EMAIL", "auto@example.com").strip()
-
-        if not (gh_token and repo_slug):
-            print("⚠️ Skipping auto-commit: GH_TOKEN or GITHUB_REPO missing.")
-            return
-
-        # Configure identity & safe directory
-        os.system(f'git config --global user.name "{user_name}"')
-        os.system(f'git config --global user.email "{user_email}"')
-        os.system('git config --global --add safe.directory "$(pwd)"')
-
-        # Tokenized remote
-        remote_url_token = f"https://{gh_token}@github.com/{repo_slug}.git"
-        os.system(f'git remote set-url origin "{remote_url_token}"')
-
-        # Stage only files we mutate
-        files = [
-            os.getenv("PARSER_FILE", "parser_llm.py"),
-            os.getenv("MEMORY_PATH", "parser_memory.json"),
-            os.getenv("FEEDBACK_PATH", "parser_feedback.json"),
-        ]
-        files = " ".join(sorted(set(files)))
-        os.system(f"git add {files}")
-
-        # If no staged changes, skip commit
-        diff_rc = os.system('git diff --cached --quiet')
-        if diff_rc == 0:
-            print("ℹ️ No staged changes; skipping commit.")
-        else:
-            c_rc = os.system('git commit -m "Auto-learned regex update [bot]"')
-            if c_rc == 0:
-                print("✅ Commit created.")
-            else:
-                print("⚠️ Commit attempt returned non-zero status.")
-
-        # Push
-        push_rc = os.system(f'git push origin "{branch}"')
-        if push_rc != 0:
-            print("⚠️ git push failed. Check token scopes (repo) and branch name.")
-        else:
-            print("🚀 Changes pushed.")
-    except Exception as e:
-        print(f"❌ auto_commit_changes error: {e}")
+    from git_sync import get_git_sync
+    sync = get_git_sync()
+    if not sync.enabled:
+        print("⚠️ Skipping auto-commit: GH_TOKEN or GITHUB_REPO missing.")
+        return
+    sync.notify("auto-learn")
 
-# 🧬 Auto-update this file’s regex lists from learned heuristics (FULL LEARNING)
-def auto_update_parser_regex(memory_path=MEMORY_PATH, parser_file=__file__):
+# 🧬 Record learned heuristics as regex rows in the pattern store (FULL LEARNING)
+def auto_update_parser_regex(memory_path: Optional[str] = None, patterns_path: Optional[str] = None):
     """
-    Automatically patch regex pattern lists when heuristics reach threshold.
-    Includes space-escaping fix and *deduplication* (won't re-add identical rules).
+    Turn auto_heuristics that reached threshold into learned patterns. Rows are
+    bucketed by the *_PATTERNS list they extend; the store dedupes, so re-running
+    is a no-op. Parsers pick new rows up on their next call (no re-import).
     """
+    memory_path = memory_path or default_parser().memory_path
+    patterns_path = patterns_path or default_parser().patterns_path
     memory = _load_json(memory_path, {})
     auto_heuristics = memory.get("auto_heuristics", {})
     if not auto_heuristics:
@@ -1287,50 +1880,8 @@ def auto_update_parser_regex(memory_path=MEMORY_PATH, parser_file=__file__):
         "onpg": "DNASE_PATTERNS"  # No dedicated ONPG list; reuse generic bucket
     }
 
-    # Load this file's code
-    try:
-        with open(parser_file, "r", encoding="utf-8") as f:
-            code = f.read()
-    except Exception as e:
-        print(f"❌ Could not read parser file: {e}")
-        return
-
-    # Prepare a live namespace to access current lists for dedupe
-    ns = {}
-    try:
-        exec(compile(code, parser_file, "exec"), ns, ns)
-    except Exception:
-        try:
-            _repair_parser_file(parser_file)
-            _sanitize_auto_learned_patterns(parser_file)
-            with open(parser_file, "r", encoding="utf-8") as f:
-                code = f.read()
-            exec(compile(code, parser_file, "exec"), ns, ns)
-        except Exception as e2:
-            print(f"❌ Failed to exec parser for introspection: {e2}")
-            return
-
-    updated = 0
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    def add_rule_to_list(list_name: str, raw_regex_literal: str) -> Tuple[str, bool]:
-        nonlocal code
-        pattern_block_regex = rf"({re.escape(list_name)}\s*=\s*\[)([^]]*)(\])"
-        m = re.search(pattern_block_regex, code, flags=re.S)
-        if not m:
-            return (code, False)
-        head, body, tail = m.group(1), m.group(2), m.group(3)
-
-        existing_items = re.findall(r'r"[^"]*"|r\'[^\']*\'', body)
-        if raw_regex_literal in existing_items:
-            return (code, False)
-
-        insertion = f"\n    {raw_regex_literal},  # auto-learned {now}"
-        new_body = body + insertion
-        new_code = code[:m.start()] + head + new_body + tail + code[m.end():]
-        return (new_code, True)
-
     # For each heuristic, create both a positive and negative generic pattern covering spaces
+    rules = []
     for field, rule in auto_heuristics.items():
         field_l = field.lower().strip()
         list_name = None
@@ -1345,33 +1896,16 @@ def auto_update_parser_regex(memory_path=MEMORY_PATH, parser_file=__file__):
             continue
 
         safe_field = _escape_for_raw_regex(field_l)
-        pos_pat = f'r"\\b{safe_field}\\b.*(?:positive|\\+|detected|produced)"'
-        neg_pat = f'r"\\b{safe_field}\\b.*(?:negative|\\-|not\\s+detected|absent|not\\s+produced)"'
-
-        code, ins1 = add_rule_to_list(list_name, pos_pat)
-        code, ins2 = add_rule_to_list(list_name, neg_pat)
-        if ins1 or ins2:
-            updated += 1
-            print(f"✅ Added learned pattern(s) for '{field}' → {list_name}")
-
-    # Append summary comment and write back if changed
-        # Append summary comment and write back if changed
-    if updated > 0:
-        code += f"\n\n# === AUTO-LEARNED PATTERNS SUMMARY ({now}) ===\n"
-        for f_name, rinfo in auto_heuristics.items():
-            code += f"# {f_name}: {rinfo['rule']} (seen {rinfo['count']}x)\n"
-
-        try:
-            with open(parser_file, "w", encoding="utf-8") as f:
-                f.write(code)
-            print(f"🧠 Updated {os.path.basename(parser_file)} with {updated} new regex patterns.")
-            _sanitize_parser_file(parser_file)
-            _sanitize_auto_learned_patterns(parser_file)
-            _repair_parser_file(parser_file)
-
-        except Exception as e:
-            print(f"❌ Failed to write updates: {e}")
-
+        count = rule.get("count", 0)
+        rules.append({"bucket": list_name, "field": field, "count": count,
+                      "regex": rf"\b{safe_field}\b[^.\n]{{0,80}}?(?:positive|\+|detected|produced)"})
+        rules.append({"bucket": list_name, "field": field, "count": count,
+                      "regex": rf"\b{safe_field}\b[^.\n]{{0,80}}?(?:negative|\-|not\s+detected|absent|not\s+produced)"})
+
+    store = get_pattern_store(patterns_path)
+    added = store.add_many(rules)
+    if added:
+        print(f"🧠 Added {added} learned regex patterns to {os.path.basename(patterns_path)} (v{store.version}).")
     else:
         print("ℹ️ No new unique patterns to add.")
 
@@ -1381,28 +1915,22 @@ def auto_update_parser_regex(memory_path=MEMORY_PATH, parser_file=__file__):
 
 
 # Convenience bootstrap: run learning + optional gold tests + auto-patch
-def enable_self_learning_autopatch(run_tests: bool = False, db_fields: Optional[List[str]] = None):
+def enable_self_learning_autopatch(run_tests: bool = False, db_fields: Optional[List[str]] = None, full: bool = False):
     """
     Typical Streamlit usage in app.py/app_chat.py:
         from parser_llm import enable_self_learning_autopatch
         enable_self_learning_autopatch(run_tests=False)
     """
     if run_tests:
-        run_gold_tests(db_fields=db_fields)
+        run_gold_tests(db_fields=db_fields, full=full)
     analyze_feedback_and_learn()
     auto_update_parser_regex()
 
 # CLI
 if __name__ == "__main__":
-    # Defensive cleanups if you ever call this directly
-    this_file = __file__
-    _sanitize_parser_file(this_file)
-    _sanitize_auto_learned_patterns(this_file)
-    _repair_parser_file(this_file)
-
     if "--test" in sys.argv:
-        run_gold_tests()
+        run_gold_tests(full="--full" in sys.argv)
         analyze_feedback_and_learn()
         auto_update_parser_regex()
         sys.exit(0)
-    print("parser_llm.py loaded. Use --test to run gold tests (learns & patches).")
\ No newline at end of file
+    print("parser_llm.py loaded. Use --test [--full] to run gold tests (and learn).")
\ No newline at end of file
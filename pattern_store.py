@@ -0,0 +1,286 @@
+# pattern_store.py — learned regex patterns as versioned data (not source edits)
+# ──────────────────────────────────────────────────────────────────────────────
+# Replaces "rewrite parser_llm.py / parser_basic.py, exec it, repair it".
+#
+# File (default data/learned_patterns.json):
+#   {
+#     "version": 7,                       ← bumped on every write
+#     "updated": "2025-01-01 12:00:00",
+#     "patterns": [
+#       {"bucket": "OXIDASE_PATTERNS", "field": "Oxidase",
+#        "regex": "\\boxidase\\b.*(?:positive|...)",
+#        "source": "auto-learn", "count": 5, "added": "..."}
+#     ]
+#   }
+#
+#   • bucket  — which built-in list the pattern extends (parser_llm uses its
+#               *_PATTERNS names; parser_basic uses GENERAL_PATTERNS)
+#   • Every regex is compiled at load; invalid or malformed entries are
+#     skipped (reported in .rejected), never fatal
+#   • regex_guard screens new rules: statically exponential patterns are
+#     rejected; ones over the step bound (or timing out) are written with
+#     "quarantined": "<reason>" and never compiled in (.quarantined). A
+#     quarantined rule that is re-proposed is screened again and lifted if
+#     it now passes
+#   • snapshot() re-reads the file only when its mtime/size changed, so a
+#     running app picks up new rules without re-import or restart
+#   • version is bumped on every write (count refreshes too); rules_hash
+#     changes only when the active rule set does — key caches on that
+#   • add_many() validates, dedupes and writes atomically under a file lock
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import regex_guard
+
+try:
+    import fcntl  # POSIX only; cross-process write lock
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PATTERN_FLAGS = re.I | re.S
+
+# bucket -> [(field, compiled regex)]
+Compiled = Dict[str, List[Tuple[str, "re.Pattern[str]"]]]
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def validate_entry(entry: Dict) -> Optional[str]:
+    """Return a reason string if the entry is unusable, else None."""
+    if not isinstance(entry, dict):
+        return "not an object"
+    for key in ("bucket", "regex"):
+        if not isinstance(entry.get(key), str) or not entry[key].strip():
+            return f"missing {key}"
+    try:
+        re.compile(entry["regex"], PATTERN_FLAGS)
+    except re.error as e:
+        return f"bad regex: {e}"
+    return regex_guard.static_reject_reason(entry["regex"])
+
+
+class PatternStore:
+    """Versioned, hot-reloadable set of learned regex patterns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._stamp: Optional[Tuple[int, int]] = None
+        self._version = 0
+        self._rules_hash = ""
+        self._entries: List[Dict] = []
+        self._compiled: Compiled = {}
+        self.rejected: List[Tuple[Dict, str]] = []
+        self.quarantined: List[Dict] = []
+
+    # ── loading ─────────────────────────────────────────────────────────────
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except Exception:
+            return {}
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the file if it changed on disk. Returns True if reloaded."""
+        with self._lock:
+            stamp = self._file_stamp()
+            if not force and stamp == self._stamp:
+                return False
+            data = self._read()
+            entries, compiled, rejected, quarantined = [], {}, [], []
+            for entry in data.get("patterns", []):
+                reason = validate_entry(entry)
+                if reason:
+                    rejected.append((entry, reason))
+                    continue
+                if entry.get("quarantined"):
+                    quarantined.append(entry)
+                    continue
+                entries.append(entry)
+                compiled.setdefault(entry["bucket"], []).append(
+                    (entry.get("field", ""), re.compile(entry["regex"], PATTERN_FLAGS))
+                )
+            if rejected:
+                print(f"⚠️ Skipped {len(rejected)} invalid learned pattern(s) in {self.path}")
+            self._stamp = stamp
+            self._version = int(data.get("version", 0) or 0)
+            self._rules_hash = hashlib.sha1(json.dumps(
+                sorted([e["bucket"], e.get("field", ""), e["regex"]] for e in entries)
+            ).encode("utf-8")).hexdigest()
+            self._entries, self._compiled, self.rejected = entries, compiled, rejected
+            self.quarantined = quarantined
+            return True
+
+    def snapshot(self) -> Compiled:
+        """Compiled patterns by bucket (cheap stat check; reloads if changed)."""
+        self.reload()
+        return self._compiled
+
+    @property
+    def version(self) -> int:
+        self.reload()
+        return self._version
+
+    @property
+    def rules_hash(self) -> str:
+        """sha1 of the active (bucket, field, regex) set. Unlike version, count-only updates leave it alone."""
+        self.reload()
+        return self._rules_hash
+
+    def entries(self, bucket: Optional[str] = None) -> List[Dict]:
+        self.reload()
+        return [dict(e) for e in self._entries if bucket is None or e["bucket"] == bucket]
+
+    def __len__(self) -> int:
+        self.reload()
+        return len(self._entries)
+
+    # ── writing ─────────────────────────────────────────────────────────────
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a+") as lf:
+            fcntl.flock(lf, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf, fcntl.LOCK_UN)
+
+    def add_many(self, rules: Iterable[Dict]) -> int:
+        """
+        Add {"bucket","field","regex",["source","count"]} rules. Invalid and
+        already-present (bucket, regex) pairs are skipped; counts on existing
+        rules are refreshed. Returns the number of new rules written.
+        """
+        rules = list(rules)
+        if not rules:
+            return 0
+        quarantine = self._runtime_screen(rules)
+        with self._lock, self._file_lock():
+            data = self._read()
+            patterns = [e for e in data.get("patterns", []) if isinstance(e, dict)]
+            existing = {(e.get("bucket"), e.get("regex")): e for e in patterns}
+            added, touched = 0, False
+            for rule in rules:
+                reason = validate_entry(rule)
+                if reason:
+                    print(f"⚠️ Rejected learned pattern for {rule.get('field')!r}: {reason}")
+                    continue
+                key = (rule["bucket"], rule["regex"])
+                if key in existing:
+                    if rule.get("count") and existing[key].get("count") != rule["count"]:
+                        existing[key]["count"] = rule["count"]
+                        touched = True
+                    if (str(existing[key].get("quarantined", "")).startswith(("runtime:", "budget:"))
+                            and rule["regex"] in quarantine and not quarantine[rule["regex"]]):
+                        print(f"✅ Lifted quarantine on learned pattern for {existing[key].get('field')!r}")
+                        del existing[key]["quarantined"]
+                        touched = True
+                    continue
+                entry = {
+                    "bucket": rule["bucket"],
+                    "field": rule.get("field", ""),
+                    "regex": rule["regex"],
+                    "source": rule.get("source", "auto-learn"),
+                    "count": rule.get("count", 0),
+                    "added": _now(),
+                }
+                if quarantine.get(rule["regex"]):
+                    entry["quarantined"] = quarantine[rule["regex"]]
+                    print(f"🚧 Quarantined learned pattern for {entry['field']!r}: {entry['quarantined']}")
+                patterns.append(entry)
+                existing[key] = entry
+                added += 1
+            if added or touched:
+                self._write({
+                    "version": int(data.get("version", 0) or 0) + 1,
+                    "updated": _now(),
+                    "patterns": patterns,
+                })
+            self.reload(force=True)
+            return added
+
+    def _runtime_screen(self, rules: List[Dict]) -> Dict[str, Optional[str]]:
+        """
+        regex → quarantine reason (None = passes) for statically-valid rules
+        that are new or currently quarantined, so a quarantine is re-checked
+        each time the learner proposes the rule again.
+        """
+        if not regex_guard.GUARD_ENABLED:
+            return {}
+        known = {(e.get("bucket"), e.get("regex")): e for e in self._read().get("patterns", []) if isinstance(e, dict)}
+        screen = [r["regex"] for r in rules if not validate_entry(r)
+                  and ((r["bucket"], r["regex"]) not in known or known[(r["bucket"], r["regex"])].get("quarantined"))]
+        if not screen:
+            return {}
+        results = regex_guard.run_budgeted(screen)
+        return {pat: regex_guard.quarantine_reason(pat, stats) for pat, stats in results.items()}
+
+    def quarantine(self, reasons: Dict[str, str]) -> int:
+        """Mark existing rules (by regex) quarantined. Returns how many changed."""
+        reasons = {k: v for k, v in reasons.items() if v}
+        if not reasons:
+            return 0
+        with self._lock, self._file_lock():
+            data = self._read()
+            patterns = [e for e in data.get("patterns", []) if isinstance(e, dict)]
+            changed = 0
+            for e in patterns:
+                if e.get("regex") in reasons and not e.get("quarantined"):
+                    e["quarantined"] = reasons[e["regex"]]
+                    changed += 1
+            if changed:
+                self._write({
+                    "version": int(data.get("version", 0) or 0) + 1,
+                    "updated": _now(),
+                    "patterns": patterns,
+                })
+            self.reload(force=True)
+            return changed
+
+    def add(self, bucket: str, field: str, regex: str, **extra) -> bool:
+        return self.add_many([dict(extra, bucket=bucket, field=field, regex=regex)]) > 0
+
+    def _write(self, data: Dict) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+_STORES: Dict[str, PatternStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_pattern_store(path: str) -> PatternStore:
+    """Process-wide store for a pattern file (shared by both parsers)."""
+    key = os.path.abspath(path)
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = PatternStore(key)
+        return _STORES[key]
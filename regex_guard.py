@@ -0,0 +1,666 @@
+#!/usr/bin/env python3
+# regex_guard.py — ReDoS screening + execution budget for learned regex patterns
+# ──────────────────────────────────────────────────────────────────────────────
+# Two layers, both applied before a learned pattern becomes active:
+#
+#   1. static_check(pattern) — walks the sre parse tree and reports
+#        • nested_quantifier        (a+)+ / (\w+\s?)* — exponential backtracking
+#        • overlapping_alternation  (a|ab)* / (.|x)+  — exponential backtracking
+#        • quantified_variable_span (?:[^.]{0,80}?\s){8} / (a?){25} — the
+#                                   body's splits multiply per repetition
+#        • stacked_wildcards        .*\s*.* / 3+ unbounded wide spans — polynomial
+#        • too_long                 pattern longer than MAX_PATTERN_LEN
+#      "exponential" findings are rejected outright (pattern_store.validate_entry);
+#      "polynomial" ones are left to the step bound below, since the hand-written
+#      banks use single `.*` / `[^.]*?` spans on purpose.
+#
+#   step_bound(pattern) — deterministic worst-case backtracking positions per
+#      match start on a FUZZ_LEN-char input: every repeat multiplies by the
+#      counts it can try (an unbounded `.*` tries FUZZ_LEN+1), alternations add.
+#      Learned patterns above MAX_STEPS_PER_START (default FUZZ_LEN: at most
+#      one pass over the input per start) are quarantined — the same answer
+#      on every run, unlike wall-clock timing. `[^.\n]{0,80}?` costs 81, `.*`
+#      costs 5001, so bounded spans pass and unbounded ones don't. A
+#      single-class run whose neighbours can't match that class
+#      (`not\s+detected`) is scanned once, so it adds no factor (not FUZZ_LEN).
+#
+#   2. run_budgeted(patterns) — fuzz harness. Each pattern runs (finditer, as
+#      the parsers do) over adversarial inputs of FUZZ_LEN chars: long gold-like
+#      reports, repeated characters, and the pattern's own literal words
+#      repeated without terminators. Runs happen in a spawned worker that is
+#      killed if a pattern exceeds HARD_TIMEOUT, so a catastrophic pattern
+#      cannot hang the caller. A worst input over BUDGET_MS is re-timed
+#      RETIMES times and only a median still over budget counts, so one slow
+#      pass doesn't quarantine. pattern_store quarantines via
+#      quarantine_reason() (kept in the file, never compiled in) and
+#      re-screens quarantined rules whenever the learner proposes them again.
+#
+# Env:
+#   • BACTAI_REGEX_BUDGET_MS   ← worst-input latency budget per pattern (default 25)
+#   • BACTAI_REGEX_MAX_STEPS   ← step bound per match start (default FUZZ_LEN)
+#   • BACTAI_REGEX_FUZZ_LEN    ← adversarial input length (default 5000 chars)
+#   • BACTAI_REGEX_GUARD       ← "0" skips the runtime budget (static check stays)
+#
+# CLI:
+#   python regex_guard.py                 ← audit built-in + learned patterns,
+#                                           tail latency per pattern
+#   python regex_guard.py --quarantine    ← also quarantine over-budget learned ones
+#   python regex_guard.py --check 'REGEX' ← one pattern
+#   python regex_guard.py --selftest      ← known-bad shapes caught, learner
+#                                           templates pass
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import os
+import re
+import sys
+import math
+import json
+import time
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover - older Pythons
+    import sre_parse  # type: ignore
+    import sre_constants  # type: ignore
+
+PATTERN_FLAGS = re.I | re.S  # same as pattern_store
+MAX_PATTERN_LEN = 500
+BUDGET_MS = float(os.getenv("BACTAI_REGEX_BUDGET_MS", "25"))
+FUZZ_LEN = int(os.getenv("BACTAI_REGEX_FUZZ_LEN", "5000"))
+MAX_STEPS_PER_START = int(os.getenv("BACTAI_REGEX_MAX_STEPS", "0")) or FUZZ_LEN
+HARD_TIMEOUT = 5.0  # seconds per pattern before the worker is killed
+RETIMES = 3  # re-runs of an over-budget worst input; their median decides
+GUARD_ENABLED = os.getenv("BACTAI_REGEX_GUARD", "1") != "0"
+
+C = sre_constants
+_REPEATS = {C.MAX_REPEAT, C.MIN_REPEAT} | ({C.POSSESSIVE_REPEAT} if hasattr(C, "POSSESSIVE_REPEAT") else set())
+_UNBOUNDED = C.MAXREPEAT
+_WIDE_CATEGORIES = {C.CATEGORY_WORD, C.CATEGORY_NOT_WORD, C.CATEGORY_NOT_SPACE, C.CATEGORY_NOT_DIGIT}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Static check
+# ──────────────────────────────────────────────────────────────────────────────
+def _min_width(seq) -> int:
+    total = 0
+    for op, av in seq:
+        if op in (C.LITERAL, C.NOT_LITERAL, C.ANY, C.IN):
+            total += 1
+        elif op in _REPEATS:
+            total += av[0] * _min_width(av[2])
+        elif op is C.SUBPATTERN:
+            total += _min_width(av[-1])
+        elif op is C.BRANCH:
+            total += min((_min_width(alt) for alt in av[1]), default=0)
+        elif op is getattr(C, "ATOMIC_GROUP", None):
+            total += _min_width(av)
+    return total
+
+
+def _max_width(seq) -> Optional[int]:
+    """Longest match of seq, or None if unbounded."""
+    total = 0
+    for op, av in seq:
+        if op in (C.LITERAL, C.NOT_LITERAL, C.ANY, C.IN):
+            w = 1
+        elif op in _REPEATS:
+            body = _max_width(av[2])
+            w = None if body is None or (av[1] == _UNBOUNDED and body) else av[1] * body
+        elif op is C.SUBPATTERN:
+            w = _max_width(av[-1])
+        elif op is C.BRANCH:
+            widths = [_max_width(alt) for alt in av[1]]
+            w = None if None in widths else max(widths, default=0)
+        elif op is getattr(C, "ATOMIC_GROUP", None):
+            w = _max_width(av)
+        elif op in (C.AT, C.ASSERT, C.ASSERT_NOT):
+            w = 0
+        else:
+            w = None
+        if w is None:
+            return None
+        total += w
+    return total
+
+
+def _is_wide(op, av) -> bool:
+    """Single-char matcher that accepts most text (., [^x], \\w, \\S ...)."""
+    if op in (C.ANY, C.NOT_LITERAL):
+        return True
+    if op is C.IN:
+        return any(o is C.NEGATE or (o is C.CATEGORY and a in _WIDE_CATEGORIES) for o, a in av)
+    return False
+
+
+def _first_key(seq):
+    """Rough first-character class of a sequence: 'wide', or a hashable descriptor."""
+    for op, av in seq:
+        if op in (C.AT, C.ASSERT, C.ASSERT_NOT):
+            continue
+        if op is C.SUBPATTERN:
+            return _first_key(av[-1])
+        if op in _REPEATS:
+            return "wide" if av[0] == 0 else _first_key(av[2])
+        if op is C.LITERAL:
+            return ("lit", chr(av).lower())
+        if op is C.IN:
+            return "wide" if _is_wide(op, av) else ("in", repr(av))
+        return "wide"
+    return "wide"
+
+
+def _unwrap(seq):
+    """Inline single capture groups so (x+)+ and (?:x+)+ look the same."""
+    items = list(seq)
+    while len(items) == 1 and items[0][0] is C.SUBPATTERN:
+        items = list(items[0][1][-1])
+    return items
+
+
+def _repeats_alone(seq) -> bool:
+    """True if seq can match using one inner unbounded repeat and nothing else mandatory."""
+    items = _unwrap(seq)
+    for i, (op, av) in enumerate(items):
+        rest = items[:i] + items[i + 1:]
+        if _min_width(rest) > 0:
+            continue
+        if op in _REPEATS and av[1] == _UNBOUNDED and _min_width(av[2]) > 0:
+            return True
+        if op is C.SUBPATTERN and _repeats_alone(av[-1]):
+            return True
+        if op is C.BRANCH and any(_repeats_alone(alt) for alt in av[1]):
+            return True
+    return False
+
+
+def _walk(seq, findings: List[Dict[str, str]]) -> None:
+    items = list(seq)
+    # Stacked wide spans in one sequence: .*\s*.* style (polynomial)
+    wide_spans = [i for i, (op, av) in enumerate(items)
+                  if op in _REPEATS and av[1] == _UNBOUNDED and len(av[2]) == 1 and _is_wide(*av[2][0])]
+    adjacent = any(_min_width(items[a + 1:b]) == 0 for a, b in zip(wide_spans, wide_spans[1:]))
+    if len(wide_spans) >= 3 or adjacent:
+        findings.append({"kind": "stacked_wildcards", "severity": "polynomial",
+                         "detail": f"{len(wide_spans)} unbounded wide spans in one sequence"})
+
+    for op, av in items:
+        if op in _REPEATS:
+            body = av[2]
+            if av[1] > 1 and _max_width(body) != _min_width(body):
+                # (?:[^.]{0,80}?\s){8} / (.*a){12} / (?:a?){25}: every
+                # iteration re-splits the span, so splits multiply per count
+                findings.append({"kind": "quantified_variable_span", "severity": "exponential",
+                                 "detail": "repeated group whose body has a variable-width span"})
+            if av[1] == _UNBOUNDED:
+                if _repeats_alone(body):
+                    findings.append({"kind": "nested_quantifier", "severity": "exponential",
+                                     "detail": "unbounded repeat of a body that is itself an unbounded repeat"})
+                for bop, bav in _unwrap(body):
+                    if bop is C.BRANCH:
+                        keys = [_first_key(alt) for alt in bav[1]]
+                        if "wide" in keys or len(set(keys)) < len(keys):
+                            findings.append({"kind": "overlapping_alternation", "severity": "exponential",
+                                             "detail": "alternatives under an unbounded repeat can start with the same character"})
+            _walk(body, findings)
+        elif op is C.SUBPATTERN:
+            _walk(av[-1], findings)
+        elif op is C.BRANCH:
+            for alt in av[1]:
+                _walk(alt, findings)
+        elif op in (C.ASSERT, C.ASSERT_NOT):
+            _walk(av[1], findings)
+        elif op is getattr(C, "ATOMIC_GROUP", None):
+            _walk(av, findings)
+
+
+def static_check(pattern: str, flags: int = PATTERN_FLAGS) -> List[Dict[str, str]]:
+    """ReDoS findings for a pattern (empty list = nothing suspicious)."""
+    findings: List[Dict[str, str]] = []
+    if len(pattern) > MAX_PATTERN_LEN:
+        findings.append({"kind": "too_long", "severity": "exponential",
+                         "detail": f"{len(pattern)} chars > {MAX_PATTERN_LEN}"})
+    try:
+        tree = sre_parse.parse(pattern, flags)
+    except re.error as e:
+        return [{"kind": "invalid", "severity": "exponential", "detail": str(e)}]
+    _walk(tree, findings)
+    # Same finding can come from several levels; keep one of each kind
+    seen, out = set(), []
+    for f in findings:
+        if f["kind"] not in seen:
+            seen.add(f["kind"])
+            out.append(f)
+    return out
+
+
+_CATEGORIES = {
+    C.CATEGORY_DIGIT: str.isdigit,
+    C.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdigit(),
+    C.CATEGORY_SPACE: str.isspace,
+    C.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    C.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == "_",
+    C.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == "_"),
+}
+
+
+def _item_matches(op, av, ch: str) -> bool:
+    """Can one parse item match the character ch? Unknown items → True."""
+    if op is C.LITERAL:
+        return chr(av).lower() == ch.lower()
+    if op is C.NOT_LITERAL:
+        return chr(av).lower() != ch.lower()
+    if op is C.ANY:
+        return True
+    if op is C.RANGE:
+        return any(av[0] <= ord(c) <= av[1] for c in {ch.lower(), ch.upper()})
+    if op is C.CATEGORY:
+        test = _CATEGORIES.get(av)
+        return True if test is None else test(ch)
+    if op is C.IN:
+        negate = bool(av) and av[0][0] is C.NEGATE
+        hit = any(_item_matches(o, a, ch) for o, a in (av[1:] if negate else av))
+        return hit != negate
+    return True
+
+
+_CHAR_OPS = (C.LITERAL, C.NOT_LITERAL, C.ANY, C.IN)
+_ZERO_WIDTH = (C.AT,)
+_SAMPLE = [chr(i) for i in range(256)]
+
+
+def _edge(seq, last: bool = False):
+    """
+    (single-char items that can start — or with last=True end — a match of
+    seq, whether seq can match empty). None for the items when unknown.
+    """
+    chars = []
+    for op, av in (reversed(list(seq)) if last else seq):
+        if op in _CHAR_OPS:
+            return chars + [(op, av)], False
+        if op in _ZERO_WIDTH:
+            continue
+        if op is C.SUBPATTERN:
+            sub, nullable = _edge(av[-1], last)
+        elif op is C.BRANCH:
+            subs = [_edge(alt, last) for alt in av[1]]
+            sub = None if any(x is None for x, _ in subs) else [c for x, _ in subs for c in x]
+            nullable = any(n for _, n in subs)
+        elif op in _REPEATS:
+            sub, nullable = _edge(av[2], last)
+            nullable = nullable or av[0] == 0
+        else:
+            return None, False
+        if sub is None:
+            return None, False
+        chars += sub
+        if not nullable:
+            return chars, False
+    return chars, True
+
+
+def _delimited(items, i: int) -> bool:
+    """
+    A repeat of one character class whose neighbours can't start/end with
+    that class (`h2s\\s+production`, `red\\s*(?:test)`): backtracking into the
+    run fails at once, so the run is one scan and adds no factor, instead
+    of multiplying the rest of the pattern by the run length.
+    """
+    body = list(items[i][1][2])
+    if len(body) != 1 or body[0][0] not in _CHAR_OPS:
+        return False
+    before, open_start = _edge(items[:i], last=True)
+    after, open_end = _edge(items[i + 1:])
+    if before is None or after is None or open_start or open_end:
+        return False
+    op, av = body[0]
+    return not any(_item_matches(op, av, ch) and any(_item_matches(o, a, ch) for o, a in before + after)
+                   for ch in _SAMPLE)
+
+
+_SATURATE = 10 ** 12  # step counts are capped here: far over any budget
+
+
+def _times(a: int, b: int) -> int:
+    return min(a * b, _SATURATE)
+
+
+def _steps(seq, length: int) -> int:
+    """Worst-case positions tried by one sequence from a single start (see step_bound)."""
+    items = list(seq)
+    total = 1
+    for i, (op, av) in enumerate(items):
+        if op in _REPEATS:
+            lo, hi, body = av
+            if _delimited(items, i):
+                continue  # one scan, no backtracking into the rest
+            reps = length if hi == _UNBOUNDED else min(hi, length)
+            counts = max(1, reps - lo + 1)
+            inner = _steps(body, length)
+            if inner > 1:
+                # each iteration backtracks through the body again: inner ** reps
+                counts = _SATURATE if reps * math.log(inner) > math.log(_SATURATE) else _times(counts, inner ** reps)
+            total = _times(total, counts)
+        elif op is C.SUBPATTERN:
+            total = _times(total, _steps(av[-1], length))
+        elif op is C.BRANCH:
+            total = _times(total, min(_SATURATE, sum(_steps(alt, length) for alt in av[1])))
+        elif op in (C.ASSERT, C.ASSERT_NOT):
+            total = _times(total, _steps(av[1], length))
+        elif op is getattr(C, "ATOMIC_GROUP", None):
+            total = _times(total, _steps(av, length))
+    return total
+
+
+def step_bound(pattern: str, length: int = FUZZ_LEN) -> int:
+    """Deterministic worst-case backtracking steps per match start on a length-char input."""
+    try:
+        return _steps(sre_parse.parse(pattern, PATTERN_FLAGS), length)
+    except re.error:
+        return 0
+
+
+def static_reject_reason(pattern: str) -> Optional[str]:
+    """Reason string if static_check finds exponential risk, else None."""
+    bad = [f for f in static_check(pattern) if f["severity"] == "exponential"]
+    return f"redos: {bad[0]['kind']} ({bad[0]['detail']})" if bad else None
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Runtime budget (fuzz harness)
+# ──────────────────────────────────────────────────────────────────────────────
+def _literal_words(pattern: str) -> List[str]:
+    """Literal runs in a pattern (e.g. 'oxidase', 'positive') for targeted inputs."""
+    words, cur = [], []
+
+    def flush():
+        if len(cur) >= 2:
+            words.append("".join(cur))
+        cur.clear()
+
+    def walk(seq):
+        for op, av in seq:
+            if op is C.LITERAL and chr(av).isalnum():
+                cur.append(chr(av).lower())
+                continue
+            flush()
+            if op in _REPEATS:
+                walk(av[2])
+            elif op is C.SUBPATTERN:
+                walk(av[-1])
+            elif op is C.BRANCH:
+                for alt in av[1]:
+                    walk(alt)
+                    flush()
+        flush()
+
+    try:
+        walk(sre_parse.parse(pattern, PATTERN_FLAGS))
+    except re.error:
+        pass
+    return words or ["x"]
+
+
+def adversarial_inputs(pattern: str, length: int = FUZZ_LEN, corpus: Sequence[str] = ()) -> Dict[str, str]:
+    """Named inputs of ~length chars aimed at backtracking-heavy behaviour."""
+    def fill(unit: str) -> str:
+        # Trailing "!" makes the overall match fail late, forcing full backtracking
+        return (unit * (length // max(1, len(unit)) + 1))[:length - 1] + "!"
+
+    words = _literal_words(pattern)
+    inputs = {
+        "repeat_a": fill("a"),
+        "repeat_space": fill(" "),
+        "word_space": fill("ab "),
+        "signs": fill("+-"),
+        # The pattern's own words, no sentence terminators: every [^.]*/.* span runs to the end
+        "own_words": fill(" ".join(words) + " "),
+        "own_words_no_space": fill("".join(words)),
+        "own_words_first": fill(words[0] + " "),
+    }
+    if corpus:
+        inputs["long_report"] = fill(" ".join(t.lower() for t in corpus))
+    return inputs
+
+
+def _time_once(rx: "re.Pattern", text: str) -> float:
+    t0 = time.perf_counter()
+    for _ in rx.finditer(text):
+        pass
+    return round((time.perf_counter() - t0) * 1000, 3)
+
+
+def time_pattern(pattern: str, inputs: Dict[str, str], budget_ms: Optional[float] = None) -> Dict[str, object]:
+    """
+    Time one full finditer pass per input; returns per-input ms and tail stats.
+    With budget_ms, a worst input over budget is re-timed RETIMES times and
+    "over_budget" is set only if their median is still over (one slow pass
+    from a scheduler hiccup doesn't count).
+    """
+    rx = re.compile(pattern, PATTERN_FLAGS)
+    per_input = {name: _time_once(rx, text) for name, text in inputs.items()}
+    xs = sorted(per_input.values())
+
+    def pct(p: float) -> float:
+        return xs[min(len(xs) - 1, int(round((len(xs) - 1) * p / 100)))] if xs else 0.0
+
+    stats = {"per_input_ms": per_input, "p50_ms": pct(50), "p95_ms": pct(95),
+             "max_ms": xs[-1] if xs else 0.0, "worst_input": max(per_input, key=per_input.get) if xs else None}
+    if budget_ms is not None:
+        stats["over_budget"], stats["budget_ms"] = False, budget_ms
+        if stats["max_ms"] > budget_ms:
+            retimed = sorted(_time_once(rx, inputs[stats["worst_input"]]) for _ in range(RETIMES))
+            stats["median_ms"] = retimed[len(retimed) // 2]
+            stats["over_budget"] = stats["median_ms"] > budget_ms
+    return stats
+
+
+def _load_corpus(path: Optional[str]) -> List[str]:
+    if not path:
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [c.get("input", "") for c in json.load(f)]
+    except (OSError, ValueError):
+        return []
+
+
+def _fuzz_worker(conn, patterns: List[str], length: int, corpus_path: Optional[str], budget_ms: float) -> None:
+    corpus = _load_corpus(corpus_path)
+    for pat in patterns:
+        try:
+            conn.send((pat, time_pattern(pat, adversarial_inputs(pat, length, corpus), budget_ms)))
+        except Exception as e:
+            conn.send((pat, {"error": repr(e), "max_ms": float("inf")}))
+    conn.close()
+
+
+def run_budgeted(
+    patterns: Sequence[str],
+    budget_ms: float = BUDGET_MS,
+    length: int = FUZZ_LEN,
+    corpus_path: Optional[str] = "gold_tests.json",
+    hard_timeout: float = HARD_TIMEOUT,
+) -> Dict[str, Dict[str, object]]:
+    """
+    Fuzz every pattern in a spawned worker (killed and restarted if one pattern
+    runs past hard_timeout). Result per pattern has "over_budget" (worst
+    input still over budget_ms on the median of RETIMES re-runs) plus the
+    timing stats from time_pattern(), or "timeout": True.
+    """
+    import multiprocessing
+    ctx = multiprocessing.get_context("spawn")
+    remaining = list(dict.fromkeys(patterns))
+    results: Dict[str, Dict[str, object]] = {}
+    while remaining:
+        parent, child = ctx.Pipe(duplex=False)
+        proc = ctx.Process(target=_fuzz_worker, args=(child, remaining, length, corpus_path, budget_ms), daemon=True)
+        proc.start()
+        child.close()
+        fresh = True  # first result from a new worker also pays its start-up
+        while remaining:
+            pat = remaining[0]
+            if not parent.poll(hard_timeout + (3.0 if fresh else 0.0)):
+                proc.kill()
+                results[pat] = {"timeout": True, "max_ms": hard_timeout * 1000, "over_budget": True}
+                remaining.pop(0)
+                break
+            try:
+                got_pat, stats = parent.recv()
+            except EOFError:
+                if fresh:
+                    # Worker could not start (e.g. no importable __main__ under
+                    # spawn); the static check already ran, so time in-process.
+                    print("⚠️ regex_guard worker failed to start; timing in-process")
+                    corpus = _load_corpus(corpus_path)
+                    for p in remaining:
+                        results[p] = time_pattern(p, adversarial_inputs(p, length, corpus), budget_ms)
+                    remaining.clear()
+                    break
+                got_pat, stats = pat, {"error": "worker died", "max_ms": float("inf")}
+            stats.setdefault("over_budget", True)  # worker errors: no re-timed verdict, count as over
+            results[got_pat] = stats
+            remaining.pop(0)
+            fresh = False
+        proc.join(timeout=1.0)
+        parent.close()
+    return results
+
+
+def quarantine_reason(pattern: str, stats: Optional[Dict[str, object]] = None,
+                      length: int = FUZZ_LEN, max_steps: int = MAX_STEPS_PER_START) -> Optional[str]:
+    """
+    Why a pattern should be quarantined, or None: over the step bound, a hard
+    failure (timeout / crash), or a worst input whose re-timed median is
+    still over the latency budget.
+    """
+    steps = step_bound(pattern, length)
+    if steps > max_steps:
+        return f"budget: {steps} steps per start on {length} chars > {max_steps} (unbounded span?)"
+    stats = stats or {}
+    if stats.get("timeout"):
+        return f"runtime: exceeded {HARD_TIMEOUT:.0f}s hard timeout"
+    if stats.get("error"):
+        return f"runtime: {stats['error']}"
+    if stats.get("over_budget"):
+        return (f"runtime: {stats.get('median_ms')}ms median of {RETIMES} re-runs on "
+                f"{stats.get('worst_input')} > {stats.get('budget_ms', BUDGET_MS)}ms budget")
+    return None
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI audit
+# ──────────────────────────────────────────────────────────────────────────────
+def _all_patterns() -> List[Tuple[str, str, bool]]:
+    """(bank, pattern, learned?) for parser_llm's banks and the learned store."""
+    import parser_llm
+    out = [(name, p, False) for name, val in vars(parser_llm).items()
+           if name.endswith("_PATTERNS") and isinstance(val, list) for p in val]
+    store = parser_llm.get_learned_patterns()
+    out += [(e["bucket"], e["regex"], True) for e in store.entries()]
+    return out
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Self-test: known-bad shapes must be caught, the learners' templates must pass
+# ──────────────────────────────────────────────────────────────────────────────
+SELFTEST_BAD = [
+    r"(?:[^.\n]{0,80}?\s){8}x",  # bounded repeat of a variable span: ~8 s on 90 chars
+    r"(.*a){12}",
+    r"(?:a?){25}a{25}",
+    r"\bindole\b.*(?:positive|\+)",  # unbounded span per start
+]
+SELFTEST_GOOD = [
+    r"\bindole\b[^.\n]{0,80}?(?:positive|\+|detected|produced)",
+    r"\bnacl\s+tolerant\b[^.\n]{0,80}?(?:negative|\-|not\s+detected|absent|not\s+produced)",
+    r"\bh2s production\b[^.\n]{0,80}?\b(not\s+detected|not\s+produced|positive|negative|detected|produced|absent|variable)\b",
+]
+
+
+def _selftest() -> int:
+    ok = True
+
+    def check(label: str, cond: bool) -> None:
+        nonlocal ok
+        ok = ok and cond
+        print(f"{'✅' if cond else '❌'} {label}")
+
+    for pat in SELFTEST_BAD:
+        check(f"step bound quarantines {pat}", step_bound(pat) > MAX_STEPS_PER_START and quarantine_reason(pat) is not None)
+    for pat in SELFTEST_BAD[:3]:
+        check(f"static check rejects {pat}", static_reject_reason(pat) is not None)
+    for pat in SELFTEST_GOOD:
+        check(f"learner template passes {pat}", static_reject_reason(pat) is None and quarantine_reason(pat) is None)
+
+    inputs = adversarial_inputs(SELFTEST_GOOD[0], 2000)
+    slow = time_pattern(SELFTEST_GOOD[0], inputs, budget_ms=0.0)
+    check("over budget only after re-timing the worst input",
+          slow["over_budget"] and "median_ms" in slow and quarantine_reason(SELFTEST_GOOD[0], slow) is not None)
+    check("within budget → no runtime quarantine",
+          quarantine_reason(SELFTEST_GOOD[0], time_pattern(SELFTEST_GOOD[0], inputs, budget_ms=1e9)) is None)
+    print("regex_guard selftest:", "PASS" if ok else "FAIL")
+    return 0 if ok else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Static ReDoS check + runtime budget for parser regex")
+    ap.add_argument("--check", help="check a single pattern instead of the banks")
+    ap.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    ap.add_argument("--length", type=int, default=FUZZ_LEN)
+    ap.add_argument("--quarantine", action="store_true", help="quarantine over-budget learned patterns")
+    ap.add_argument("--json", dest="json_path")
+    ap.add_argument("--selftest", action="store_true", help="check known-bad and learner-template patterns")
+    args = ap.parse_args(argv)
+    if args.selftest:
+        return _selftest()
+
+    rows = [("(cli)", args.check, False)] if args.check else _all_patterns()
+    t0 = time.time()
+    timing = run_budgeted([p for _, p, _ in rows], budget_ms=args.budget_ms, length=args.length)
+    report = []
+    for bank, pat, learned in rows:
+        stats = timing.get(pat, {})
+        report.append({"bank": bank, "pattern": pat, "learned": learned,
+                       "static": static_check(pat), **{k: v for k, v in stats.items() if k != "per_input_ms"},
+                       "steps": step_bound(pat, args.length),
+                       "quarantine": quarantine_reason(pat, stats, args.length),
+                       "per_input_ms": stats.get("per_input_ms")})
+
+    worst = sorted(report, key=lambda r: r.get("max_ms", 0.0), reverse=True)
+    maxes = sorted(r.get("max_ms", 0.0) for r in report)
+    p = lambda q: maxes[min(len(maxes) - 1, int(round((len(maxes) - 1) * q)))] if maxes else 0.0
+    print(f"🛡️ {len(report)} patterns fuzzed at {args.length} chars in {time.time() - t0:.1f}s — "
+          f"worst-input latency p50 {p(0.5)}ms p95 {p(0.95)}ms p99 {p(0.99)}ms max {maxes[-1] if maxes else 0}ms "
+          f"(budget {args.budget_ms}ms)")
+    for r in report:
+        for f in r["static"]:
+            print(f"  ⚠️ static {f['severity']}: [{r['bank']}] {r['pattern']} — {f['kind']}")
+    for r in worst:
+        if r.get("over_budget"):
+            print(f"  🐢 slow: [{r['bank']}] {r['max_ms']}ms on {r.get('worst_input')} — {r['pattern']}")
+    # Only learned patterns are quarantined; built-in ones just carry "steps" in the report
+    over = [r for r in worst if r["quarantine"] and (r["learned"] or args.check)]
+    for r in over:
+        print(f"  🚧 [{r['bank']}] {r['quarantine']} — {r['pattern']}")
+    if not over:
+        print(f"  ✅ every learned pattern within {MAX_STEPS_PER_START} steps per start and the latency budget")
+
+    if args.quarantine:
+        import parser_llm
+        store = parser_llm.get_learned_patterns()
+        moved = store.quarantine({r["pattern"]: r["quarantine"] for r in over})
+        print(f"🚧 Quarantined {moved} learned pattern(s).")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Wrote {args.json_path}")
+    return 1 if (args.check and over) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
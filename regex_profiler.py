@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# regex_profiler.py — opt-in per-pattern profiling for the parsers' regex banks
+# ──────────────────────────────────────────────────────────────────────────────
+# parser_llm runs every *_PATTERNS entry (built-in + learned) through
+# _finditer(), and parser_basic runs its learned GENERAL_PATTERNS; both check a
+# module-level _REGEX_PROFILER that is None unless profiling is enabled, so the
+# normal path pays one global lookup per pattern.
+#
+# Per (bank, pattern) the profiler records:
+#   • calls, calls that matched, total matches
+#   • cumulative and worst-case time (the full finditer iteration is timed)
+#   • which corpus cases it fired on (begin_case() marks case boundaries)
+#
+# report() flags:
+#   • dead       — ran on the corpus, never matched
+#   • redundant  — fires on exactly the same non-empty set of cases as another
+#                  pattern in its bank (always co-firing; one can likely go)
+#   • slow       — worst call above slow_ms, or mean in the top share of cost
+#
+# Usage:
+#   python regex_profiler.py                     ← gold_tests.json, both parsers
+#   python regex_profiler.py --json data/regex_profile.json --slow-ms 0.5
+#
+#   from regex_profiler import RegexProfiler, profiling
+#   with profiling() as prof:
+#       ...parse things...
+#   print(prof.report())
+# ──────────────────────────────────────────────────────────────────────────────
+
+from __future__ import annotations
+
+import re
+import sys
+import json
+import time
+import argparse
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+PatternLike = Union[str, "re.Pattern[str]"]
+Key = Tuple[str, str]  # (bank, pattern source)
+
+
+class RegexProfiler:
+    """Collects per-pattern call/match/timing stats across a corpus run."""
+
+    def __init__(self) -> None:
+        self.stats: Dict[Key, Dict[str, object]] = {}
+        self.case: Optional[str] = None
+        self.cases_seen = 0
+
+    def begin_case(self, case_id: str) -> None:
+        self.case = case_id
+        self.cases_seen += 1
+
+    def _record(self, bank: str, pattern: str, seconds: float, matches: int) -> None:
+        s = self.stats.get((bank, pattern))
+        if s is None:
+            s = self.stats[(bank, pattern)] = {
+                "calls": 0, "calls_matched": 0, "matches": 0,
+                "total_s": 0.0, "max_s": 0.0, "cases": set(),
+            }
+        s["calls"] += 1
+        s["total_s"] += seconds
+        s["max_s"] = max(s["max_s"], seconds)
+        if matches:
+            s["calls_matched"] += 1
+            s["matches"] += matches
+            if self.case is not None:
+                s["cases"].add(self.case)
+
+    def finditer(self, bank: str, pat: PatternLike, text: str, flags: int = 0) -> List["re.Match[str]"]:
+        """Timed stand-in for re.finditer (materialised so the whole scan is timed)."""
+        source = pat.pattern if isinstance(pat, re.Pattern) else pat
+        t0 = time.perf_counter()
+        found = list(pat.finditer(text) if isinstance(pat, re.Pattern) else re.finditer(pat, text, flags=flags))
+        self._record(bank, source, time.perf_counter() - t0, len(found))
+        return found
+
+    def search(self, bank: str, pat: PatternLike, text: str, flags: int = 0) -> Optional["re.Match[str]"]:
+        source = pat.pattern if isinstance(pat, re.Pattern) else pat
+        t0 = time.perf_counter()
+        m = pat.search(text) if isinstance(pat, re.Pattern) else re.search(pat, text, flags=flags)
+        self._record(bank, source, time.perf_counter() - t0, 1 if m else 0)
+        return m
+
+    # ── reporting ───────────────────────────────────────────────────────────
+    def rows(self) -> List[Dict[str, object]]:
+        out = []
+        for (bank, pattern), s in self.stats.items():
+            calls = int(s["calls"])
+            out.append({
+                "bank": bank, "pattern": pattern, "calls": calls,
+                "calls_matched": s["calls_matched"], "matches": s["matches"],
+                "cases_fired": len(s["cases"]),
+                "total_ms": round(float(s["total_s"]) * 1000, 3),
+                "mean_us": round(float(s["total_s"]) / calls * 1e6, 2) if calls else 0.0,
+                "max_ms": round(float(s["max_s"]) * 1000, 3),
+            })
+        return sorted(out, key=lambda r: r["total_ms"], reverse=True)
+
+    def redundant_groups(self) -> List[Dict[str, object]]:
+        """Patterns in one bank that fire on exactly the same (non-empty) cases."""
+        groups: Dict[Tuple[str, frozenset], List[str]] = {}
+        for (bank, pattern), s in self.stats.items():
+            if s["cases"]:
+                groups.setdefault((bank, frozenset(s["cases"])), []).append(pattern)
+        return [
+            {"bank": bank, "cases": len(cases), "patterns": sorted(pats)}
+            for (bank, cases), pats in sorted(groups.items(), key=lambda kv: (kv[0][0], -len(kv[0][1])))
+            if len(pats) > 1
+        ]
+
+    def report(self, slow_ms: float = 1.0, slow_share: float = 0.05) -> Dict[str, object]:
+        """Dead / redundant / slow summary plus the full per-pattern table."""
+        rows = self.rows()
+        total_ms = sum(r["total_ms"] for r in rows) or 1.0
+        # Slow: a single call over slow_ms, or one pattern eating > slow_share of all regex time
+        slow = [r for r in rows if r["max_ms"] > slow_ms or r["total_ms"] / total_ms > slow_share]
+        return {
+            "cases": self.cases_seen,
+            "patterns": len(rows),
+            "total_ms": round(sum(r["total_ms"] for r in rows), 3),
+            "dead": [{"bank": r["bank"], "pattern": r["pattern"], "calls": r["calls"]}
+                     for r in rows if r["calls"] and not r["matches"]],
+            "redundant": self.redundant_groups(),
+            "slow": slow,
+            "all": rows,
+        }
+
+
+def enable_profiling(profiler: Optional[RegexProfiler] = None) -> RegexProfiler:
+    """Attach a profiler to parser_llm and parser_basic (returns it)."""
+    import parser_llm
+    import parser_basic
+    profiler = profiler or RegexProfiler()
+    for mod in (parser_llm, parser_basic):
+        mod._REGEX_PROFILER = profiler
+    return profiler
+
+
+def disable_profiling() -> None:
+    import parser_llm
+    import parser_basic
+    for mod in (parser_llm, parser_basic):
+        mod._REGEX_PROFILER = None
+
+
+@contextmanager
+def profiling(profiler: Optional[RegexProfiler] = None) -> Iterator[RegexProfiler]:
+    prof = enable_profiling(profiler)
+    try:
+        yield prof
+    finally:
+        disable_profiling()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CLI: profile a corpus run over gold_tests.json
+# ──────────────────────────────────────────────────────────────────────────────
+def profile_corpus(texts: List[str], db_fields: List[str], parsers: Tuple[str, ...] = ("llm", "basic")) -> RegexProfiler:
+    """Run the regex layer(s) over every text with profiling on."""
+    import parser_llm
+    import parser_basic
+    with profiling() as prof:
+        for i, text in enumerate(texts):
+            prof.begin_case(str(i))
+            if "llm" in parsers:
+                parser_llm.regex_stage(text, db_fields)
+            if "basic" in parsers:
+                parser_basic.parse_input_free_text(text, prior_facts={}, db_fields=db_fields)
+    return prof
+
+
+def print_report(rep: Dict[str, object], top: int = 10) -> None:
+    print(f"🔬 Regex profile: {rep['patterns']} patterns over {rep['cases']} cases, {rep['total_ms']} ms total")
+    print(f"💀 Dead ({len(rep['dead'])}):")
+    for r in rep["dead"]:
+        print(f"   [{r['bank']}] {r['pattern']}")
+    print(f"👯 Redundant groups ({len(rep['redundant'])}):")
+    for g in rep["redundant"]:
+        print(f"   [{g['bank']}] same {g['cases']} case(s):")
+        for p in g["patterns"]:
+            print(f"      {p}")
+    print(f"🐢 Slow ({len(rep['slow'])}):")
+    for r in rep["slow"][:top]:
+        print(f"   [{r['bank']}] max {r['max_ms']}ms mean {r['mean_us']}µs total {r['total_ms']}ms  {r['pattern']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Per-pattern regex profile over gold_tests.json")
+    ap.add_argument("--tests", default="gold_tests.json")
+    ap.add_argument("--parsers", default="llm,basic", help="comma list of: llm, basic")
+    ap.add_argument("--slow-ms", type=float, default=1.0, help="worst single call above this is slow")
+    ap.add_argument("--json", dest="json_path", help="write the full report here")
+    args = ap.parse_args(argv)
+
+    from gold_test_runner import load_db_fields
+    with open(args.tests, "r", encoding="utf-8") as f:
+        texts = [c.get("input", "") for c in json.load(f)]
+    prof = profile_corpus(texts, load_db_fields(), tuple(p.strip() for p in args.parsers.split(",")))
+    rep = prof.report(slow_ms=args.slow_ms)
+    print_report(rep)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2, ensure_ascii=False)
+        print(f"💾 Wrote {args.json_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())